@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the gzip compression of the bulk bodies.
+
+For every compression level the bulk bodies of the same documents are
+compressed, measuring the CPU time per MB and the bytes on the wire; then the
+documents are sent through a connection to a local stand-in ``_bulk``
+endpoint, measuring the documents per second and the bytes received by the
+endpoint.
+
+Usage:
+        python bench_compression.py [number of documents] [bulk size]
+"""
+import json
+import sys
+import time
+
+sys.path.insert(0, "..")
+
+from pyes.compression import Compression, gzip_compress
+from pyes.es import ES
+from pyes.tests import StandInServer
+
+
+def handler(method, path, body):
+    lines = len([line for line in body.splitlines() if line]) // 2
+    items = [{"index": {"_index": "test-index", "_type": "test-type", "status": 201}}] * lines
+    return 200, json.dumps({"took": 1, "errors": False, "items": items}).encode("utf-8")
+
+
+def make_documents(number_documents):
+    return [{"position": i, "title": u"title %d àèìòù" % i, "tags": [u"tag%d" % (i % 50), u"shared"],
+             "created": "2014-01-01T10:%02d:00" % (i % 60), "body": u"lorem ipsum dolor sit amet %d " % i * 10}
+            for i in range(number_documents)]
+
+
+def make_bodies(conn, documents, bulk_size):
+    dumps = conn.json_backend.dumps
+    bodies = []
+    for start in range(0, len(documents), bulk_size):
+        lines = []
+        for i, document in enumerate(documents[start:start + bulk_size], start):
+            lines.append(dumps({"index": {"_index": "test-index", "_type": "test-type", "_id": i}}))
+            lines.append(dumps(document))
+        bodies.append(("\n".join(lines) + "\n").encode("utf-8"))
+    return bodies
+
+
+def send(server, documents, bulk_size, compression):
+    conn = ES(server.server, bulk_size=bulk_size, compression=compression)
+    server.received_bytes = 0
+    start = time.time()
+    for i, document in enumerate(documents):
+        conn.index(document, "test-index", "test-type", i, bulk=True)
+    conn.force_bulk()
+    return len(documents) / (time.time() - start), server.received_bytes
+
+
+def main(number_documents=20000, bulk_size=500):
+    documents = make_documents(number_documents)
+    server = StandInServer(handler).start()
+    try:
+        bodies = make_bodies(ES(server.server), documents, bulk_size)
+        size = sum(len(body) for body in bodies)
+        print("%d documents, %d bulks of %d documents, %.1f MB" % (number_documents, len(bodies), bulk_size,
+                                                                  size / 1048576.0))
+        print("  %-8s %12s %10s %12s %12s" % ("level", "CPU ms/MB", "ratio", "docs/s", "wire MB"))
+        rate, received = send(server, documents, bulk_size, None)
+        print("  %-8s %12s %10s %12.0f %12.2f" % ("none", "-", "1.00", rate, received / 1048576.0))
+        for level in (1, 3, 6, 9):
+            start = time.process_time()
+            compressed = sum(len(gzip_compress(body, level)) for body in bodies)
+            cpu = (time.process_time() - start) * 1000 / (size / 1048576.0)
+            rate, received = send(server, documents, bulk_size, Compression(level=level))
+            print("  %-8s %12.1f %10.2f %12.0f %12.2f" % (level, cpu, float(size) / compressed, rate,
+                                                          received / 1048576.0))
+    finally:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:3]])
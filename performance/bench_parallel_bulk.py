@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Benchmark of parallel_bulk.
+
+A local stand-in ``_bulk`` endpoint answers every bulk after a delay that
+simulates the indexing time of the cluster; the same documents are sent with
+the default bulker (a bulk at a time) and with parallel_bulk with a growing
+number of workers, measuring the documents per second.
+
+Usage:
+        python bench_parallel_bulk.py [number of documents] [bulk latency in ms]
+"""
+import json
+import sys
+import time
+
+sys.path.insert(0, "..")
+
+from pyes.bulk import parallel_bulk
+from pyes.es import ES
+from pyes.tests import StandInServer
+
+
+def make_handler(latency):
+    def handler(method, path, body):
+        time.sleep(latency)
+        lines = body.count(b"\n") // 2
+        items = [{"index": {"_index": "test-index", "_type": "test-type", "_id": str(i), "status": 201}}
+                 for i in range(lines)]
+        return 200, json.dumps({"took": 1, "errors": False, "items": items}).encode("utf-8")
+    return handler
+
+
+def make_documents(number_documents):
+    return [{"_index": "test-index", "_type": "test-type", "_id": i,
+             "_source": {"position": i, "title": u"title %d àèìòù" % i, "body": u"lorem ipsum dolor sit amet " * 20}}
+            for i in range(number_documents)]
+
+
+def bulker(conn, documents):
+    for document in documents:
+        conn.index(document["_source"], document["_index"], document["_type"], document["_id"], bulk=True)
+    conn.force_bulk()
+
+
+def main(number_documents=20000, latency=50):
+    documents = make_documents(number_documents)
+    server = StandInServer(make_handler(latency / 1000.0)).start()
+    conn = ES(server.server, bulk_size=500)
+    print("%d documents, bulks of 500 documents, %d ms per bulk" % (number_documents, latency))
+    try:
+        start = time.time()
+        bulker(conn, documents)
+        print("  %-20s %10.0f docs/s" % ("ListBulker", number_documents / (time.time() - start)))
+        for workers in (1, 2, 4, 8):
+            start = time.time()
+            for ok, item in parallel_bulk(conn, documents, workers=workers, chunk_size=500):
+                pass
+            print("  %-20s %10.0f docs/s" % ("parallel_bulk(%d)" % workers,
+                                             number_documents / (time.time() - start)))
+    finally:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:3]])
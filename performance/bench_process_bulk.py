@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Benchmark of process_bulk.
+
+The transport of the connection is replaced with a fake one that answers
+every bulk at once, so only the serialization of the documents is measured:
+the same documents are sent with parallel_bulk (serialized by the main
+process) and with process_bulk with a growing number of processes, up to the
+number of cores, measuring the documents per second.
+
+Usage:
+        python bench_process_bulk.py [number of documents]
+"""
+import multiprocessing
+import sys
+import time
+
+sys.path.insert(0, "..")
+
+from pyes.bulk import parallel_bulk, process_bulk
+from pyes.es import ES
+
+
+def fake_send_request(method, path, body=None, params=None, **kwargs):
+    lines = bytes(body).count(b"\n") // 2
+    return {"took": 1, "errors": False,
+            "items": [{"index": {"_index": "test-index", "_type": "test-type", "status": 201}}] * lines}
+
+
+def make_documents(number_documents):
+    return [{"_index": "test-index", "_type": "test-type", "_id": i,
+             "_source": {"position": i, "title": u"title %d àèìòù" % i,
+                         "tags": [u"tag%d" % tag for tag in range(20)],
+                         "values": [{"key": u"key %d" % key, "value": key * 0.5} for key in range(20)],
+                         "body": u"lorem ipsum dolor sit amet " * 20}}
+            for i in range(number_documents)]
+
+
+def run(label, number_documents, results):
+    start = time.time()
+    for ok, item in results:
+        pass
+    print("  %-20s %10.0f docs/s" % (label, number_documents / (time.time() - start)))
+
+
+def main(number_documents=50000):
+    documents = make_documents(number_documents)
+    conn = ES("127.0.0.1:9200")
+    conn._send_request = fake_send_request
+    cores = multiprocessing.cpu_count()
+    print("%d documents, bulks of 500 documents, %d cores" % (number_documents, cores))
+    run("parallel_bulk", number_documents, parallel_bulk(conn, documents, workers=1, chunk_size=500))
+    processes = 1
+    while processes <= cores:
+        run("process_bulk(%d)" % processes, number_documents,
+            process_bulk(conn, documents, processes=processes, chunk_size=500))
+        processes *= 2
+    if processes // 2 != cores:
+        run("process_bulk(%d)" % cores, number_documents, process_bulk(conn, documents, processes=cores, chunk_size=500))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Micro-benchmark of the decoding of a search response.
+
+It decodes a realistic search page with the default response mode (a
+DotDict for every object and the date heuristic on every string) and with
+response_mode="dict" (plain dicts from the C decoder, hits wrapped only when
+they are read), for every available json backend. No server is needed.
+
+Usage:
+        python bench_response_decoding.py [number of hits in the page]
+"""
+import random
+import sys
+import time
+
+sys.path.insert(0, "..")
+
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+from pyes.es import ES
+from pyes.serializers import JSON_BACKENDS
+
+WORDS = u"lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor àèìòù".split()
+
+
+def make_page(number_hits):
+    random.seed(0)
+    hits = []
+    for i in range(number_hits):
+        hits.append({"_index": "test-index", "_type": "test-type", "_id": str(i), "_score": 1.0,
+                     "_source": {"title": " ".join(random.sample(WORDS, 5)),
+                                 "body": " ".join(random.choice(WORDS) for _ in range(80)),
+                                 "inserted": "2014-03-%02dT12:%02d:00" % (i % 28 + 1, i % 60),
+                                 "tags": random.sample(WORDS, 3),
+                                 "position": i,
+                                 "author": {"name": "Joe Tester", "uuid": "11111111-2222-3333-4444-555555555555"},
+                                 "comments": [{"text": " ".join(random.sample(WORDS, 8)),
+                                               "date": "2014-03-01T10:00:00.000000"} for _ in range(3)]}})
+    return json.dumps({"took": 12, "timed_out": False, "_shards": {"total": 5, "successful": 5, "failed": 0},
+                       "hits": {"total": 100000, "max_score": 1.0, "hits": hits}}).encode("utf-8")
+
+
+def measure(name, func, repeat):
+    func()
+    start = time.time()
+    for _ in range(repeat):
+        func()
+    elapsed = (time.time() - start) / repeat
+    print("  %-38s %8.2f ms/page" % (name, elapsed * 1e3))
+
+
+def main(number_hits=1000, repeat=20):
+    data = make_page(number_hits)
+    print("search page with %d hits (%d bytes)" % (number_hits, len(data)))
+    for backend in sorted(JSON_BACKENDS):
+        for mode in ("dotdict", "dict"):
+            conn = ES(("http", "127.0.0.1", 9200), json_backend=backend, response_mode=mode)
+            if type(conn.json_backend) is not JSON_BACKENDS[backend]:
+                continue
+
+            def decode():
+                return conn._process_response("POST", None, 200, {}, data)
+
+            def decode_and_read(count):
+                result = decode()
+                return [conn.model(conn, hit).title for hit in result["hits"]["hits"][:count]]
+
+            measure("%s %s decode" % (backend, mode), decode, repeat)
+            measure("%s %s decode + read 10 hits" % (backend, mode), lambda: decode_and_read(10), repeat)
+            measure("%s %s decode + read all hits" % (backend, mode), lambda: decode_and_read(None), repeat)
+
+
+if __name__ == '__main__':
+    try:
+        main(int(sys.argv[1]))
+    except IndexError:
+        main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the streaming search responses.
+
+A local stand-in server answers a large search page; the page is iterated
+with a ResultSet and with a StreamingResultSet (``search(..., stream=True)``)
+measuring the time to the first hit, the total time and the peak of the
+memory allocated while iterating.
+
+Usage:
+        python bench_streaming.py [number of hits in the page]
+"""
+import json
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, "..")
+
+from pyes.es import ES
+from pyes.query import Search, MatchAllQuery
+from pyes.tests import StandInServer
+
+
+def make_page(number_hits):
+    hits = [{"_index": "test-index", "_type": "test-type", "_id": str(i), "_score": 1.0,
+             "_source": {"position": i, "title": u"title %d àèìòù" % i, "body": u"lorem ipsum dolor sit amet " * 40,
+                         "inserted": "2014-03-01T12:00:00", "tags": ["a", "b", "c"]}}
+            for i in range(number_hits)]
+    return json.dumps({"took": 12, "hits": {"total": number_hits, "max_score": 1.0, "hits": hits}}).encode("utf-8")
+
+
+def iterate(conn, number_hits, stream):
+    start = time.time()
+    first = None
+    count = 0
+    resultset = conn.search(Search(MatchAllQuery(), size=number_hits), "test-index", "test-type", stream=stream)
+    for _ in resultset:
+        if first is None:
+            first = time.time() - start
+        count += 1
+    assert count == number_hits
+    return first, time.time() - start
+
+
+def main(number_hits=5000):
+    page = make_page(number_hits)
+    server = StandInServer(lambda method, path, body: (200, page)).start()
+    conn = ES(server.server)
+    print("search page with %d hits (%d bytes)" % (number_hits, len(page)))
+    try:
+        for name, stream in (("ResultSet", False), ("StreamingResultSet", True)):
+            iterate(conn, number_hits, stream)
+            tracemalloc.start()
+            first, total = iterate(conn, number_hits, stream)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print("  %-20s first hit %8.1f ms  total %8.1f ms  peak %10d bytes" % (name, first * 1e3, total * 1e3,
+                                                                                  peak))
+    finally:
+        server.stop()
+
+
+if __name__ == '__main__':
+    try:
+        main(int(sys.argv[1]))
+    except IndexError:
+        main()
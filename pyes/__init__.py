@@ -24,6 +24,9 @@ def version_with_meta():
                         is_stable_release() and "stable" or "unstable")
 
 from .es import ES, file_to_attachment
+import sys
+if sys.version_info >= (3, 5):
+    from .es_async import AsyncES
 from .query import *
 from .filters import *
 #from highlight import HighLighter
@@ -0,0 +1,349 @@
+# -*- coding: utf-8 -*-
+"""
+Helpers to send large streams of actions with the ``_bulk`` API.
+
+The actions are action dicts::
+
+    {"_op_type": "index", "_index": "test-index", "_type": "test-type", "_id": 1,
+     "_source": {"name": "Joe"}}
+
+(``_op_type`` defaults to ``index`` and, without ``_source``, the keys that
+don't start with ``_`` are the document: ``routing``, ``parent`` and
+``version`` are metadata only next to a ``_source``) or the
+``(header, document)`` pairs of already serialized JSON lines accepted by
+:meth:`pyes.es.ES.index_raw_bulk` (``document`` is None for a delete).
+"""
+from __future__ import absolute_import
+
+import functools
+import gzip
+import mmap
+import multiprocessing
+import time
+from collections import deque
+
+import six
+
+from .models import _is_bulk_item_ok, _raise_exception_if_bulk_item_failed
+from .serializers import get_json_backend
+
+__all__ = ["serialize_action", "chunk_actions", "parallel_bulk", "process_bulk", "file_actions", "bulk_file"]
+
+# the metadata of the action dicts that goes in the action header
+ACTION_META = ("_index", "_type", "_id", "_routing", "_parent", "_version", "_version_type", "_ttl",
+               "_retry_on_conflict")
+# the metadata without underscore, only with a _source: else they are fields of the document
+SOURCE_ACTION_META = ("routing", "parent", "version")
+
+
+def _to_bytes(line):
+    if isinstance(line, six.text_type):
+        return line.encode("utf-8")
+    return bytes(line)
+
+
+def serialize_action(action, json_backend):
+    """
+    Return the bulk lines of an action as bytes, ended with a newline.
+
+    :param json_backend: the :class:`pyes.serializers.JSONBackend` of the
+        connection.
+    """
+    if isinstance(action, tuple):
+        header, document = action
+        if document is None:
+            return _to_bytes(header)
+        return _to_bytes(header) + _to_bytes(document)
+
+    action = dict(action)
+    op_type = action.pop("_op_type", "index")
+    meta_keys = ACTION_META + SOURCE_ACTION_META if "_source" in action else ACTION_META
+    meta = dict((key, action.pop(key)) for key in meta_keys if key in action)
+    header = json_backend.dumps_bytes({op_type: meta}) + b"\n"
+    if op_type == "delete":
+        return header
+    if "_source" in action:
+        document = action["_source"]
+    else:
+        # the body of an update is given as {"doc": ...} or {"script": ...}
+        document = dict((key, value) for key, value in action.items() if not key.startswith("_"))
+    if isinstance(document, (six.binary_type, six.text_type)):
+        document = _to_bytes(document).rstrip(b"\n")
+    else:
+        document = json_backend.dumps_bytes(document)
+    return header + document + b"\n"
+
+
+def chunk_actions(lines, chunk_size=500, chunk_bytes=5 * 1024 * 1024):
+    """
+    Group the serialized actions in lists of at most chunk_size actions and
+    chunk_bytes bytes (but at least an action)
+    """
+    chunk = []
+    size = 0
+    for line in lines:
+        if chunk and (len(chunk) >= chunk_size or size + len(line) > chunk_bytes):
+            yield chunk
+            chunk = []
+            size = 0
+        chunk.append(line)
+        size += len(line)
+    if chunk:
+        yield chunk
+
+
+def _map_ordered(executor, function, iterable, max_pending):
+    """
+    Yield function(item) for every item of iterable, computed by executor
+    with at most max_pending calls submitted, in the order of iterable
+    """
+    pending = deque()
+    try:
+        for item in iterable:
+            pending.append(executor.submit(function, item))
+            if len(pending) >= max_pending:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def _send_body(conn, body):
+    result = conn._send_request("POST", "/_bulk", body)
+    conn._invalidate_bulk(result)
+    return result
+
+
+def _send_bulks(conn, bodies, workers, function=_send_body):
+    """
+    Send the bulk bodies with up to workers in flight and yield
+    function(conn, body) for every body, in order
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # a bulk is queued behind every running bulk: the workers stay busy
+        # while the results are yielded in order
+        for result in _map_ordered(pool, functools.partial(function, conn), bodies, workers * 2):
+            yield result
+
+
+def _send_bodies(conn, bodies, workers, raise_on_bulk_item_failure):
+    """
+    Send the bulk bodies with up to workers in flight and yield ``(ok, item)``
+    for every action, in order
+    """
+    for bulk_result in _send_bulks(conn, bodies, workers):
+        for result in _chunk_results(bulk_result, raise_on_bulk_item_failure):
+            yield result
+
+
+def parallel_bulk(conn, actions, workers=4, chunk_size=500, chunk_bytes=5 * 1024 * 1024,
+                  raise_on_bulk_item_failure=False):
+    """
+    Send actions in bulks of chunk_size actions and chunk_bytes bytes, with
+    up to workers bulks in flight on the connection pool of conn.
+
+    It's a generator of ``(ok, item)`` for every action, in the order of the
+    actions: ``item`` is the item of the bulk response. A good value of
+    workers is about the number of data nodes of the cluster.
+
+    :param raise_on_bulk_item_failure: raise a BulkOperationException for the
+        first bulk with a failed item, instead of yielding ``(False, item)``.
+    """
+    chunks = chunk_actions((serialize_action(action, conn.json_backend) for action in actions),
+                           chunk_size=chunk_size, chunk_bytes=chunk_bytes)
+    return _send_bodies(conn, (b"".join(chunk) for chunk in chunks), workers, raise_on_bulk_item_failure)
+
+
+# the JSON backends of the serialization processes
+_process_backends = {}
+
+
+def _serialize_chunk(backend_name, encoder, actions):
+    key = (backend_name, encoder)
+    backend = _process_backends.get(key)
+    if backend is None:
+        backend = _process_backends[key] = get_json_backend(backend_name, encoder=encoder)
+    return b"".join(serialize_action(action, backend) for action in actions)
+
+
+def _group(actions, chunk_size):
+    chunk = []
+    for action in actions:
+        chunk.append(action)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def process_bulk(conn, actions, processes=None, workers=1, chunk_size=500, raise_on_bulk_item_failure=False):
+    """
+    Like :func:`parallel_bulk`, but the actions are serialized to the bulk
+    bodies by a pool of processes: the main process only sends the bodies.
+    It's worth when the serialization of the documents keeps a core busy.
+
+    The actions are grouped in bulks of chunk_size actions, that are
+    serialized keeping their order. The actions and the encoder of the
+    connection must be picklable.
+
+    :param processes: the number of processes. Default: the number of cores.
+    :param workers: the number of bulks in flight.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    backend = conn.json_backend
+    serialize = functools.partial(_serialize_chunk, backend.name, backend.encoder)
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        max_pending = (processes or multiprocessing.cpu_count()) * 2
+        bodies = _map_ordered(pool, serialize, _group(actions, chunk_size), max_pending)
+        for result in _send_bodies(conn, bodies, workers, raise_on_bulk_item_failure):
+            yield result
+
+
+def file_actions(lines, loads):
+    """
+    Group the lines of a NDJSON bulk file in the lines of every action: the
+    header and, but for a delete, the document. Only the headers are decoded
+    (with loads), the documents are kept as they are.
+    """
+    lines = iter(lines)
+    for header in lines:
+        if not header.strip():
+            continue
+        if not header.endswith(b"\n"):
+            header += b"\n"
+        if "delete" in loads(header):
+            yield header
+            continue
+        document = next(lines, b"")
+        if not document.endswith(b"\n"):
+            document += b"\n"
+        yield header + document
+
+
+def _is_gzip(path):
+    with open(path, "rb") as fileobj:
+        return fileobj.read(2) == b"\x1f\x8b"
+
+
+def _mapped_bodies(data, loads, chunk_size, chunk_bytes):
+    """
+    Yield the bodies of the bulks of a memory mapped bulk file: the
+    boundaries of the actions are found from the newlines, only the headers
+    are decoded and every body is a single slice of data. A blank line ends
+    the current bulk.
+    """
+    def line_end(position):
+        end = data.find(b"\n", position)
+        return len(data) if end < 0 else end + 1
+
+    def body(start, end):
+        body = data[start:end]
+        return body if body.endswith(b"\n") else body + b"\n"
+
+    # the start of the current bulk, the end of its actions and their number
+    start = position = 0
+    count = 0
+    while position < len(data):
+        end = line_end(position)
+        header = data[position:end]
+        if not header.strip():
+            if count:
+                yield body(start, position)
+                count = 0
+            start = position = end
+            continue
+        if "delete" not in loads(header):
+            end = line_end(end)
+        if count and (count >= chunk_size or end - start > chunk_bytes):
+            yield body(start, position)
+            start = position
+            count = 0
+        count += 1
+        position = end
+    if count:
+        yield body(start, position)
+
+
+def _file_bodies(fileobj, compressed, loads, chunk_size, chunk_bytes):
+    """
+    Yield the bodies of the bulks of a bulk file: the slices of the memory
+    mapped file, or the actions read from the gzip stream joined
+    """
+    if compressed:
+        with gzip.GzipFile(fileobj=fileobj, mode="rb") as lines:
+            for chunk in chunk_actions(file_actions(lines, loads), chunk_size=chunk_size, chunk_bytes=chunk_bytes):
+                yield b"".join(chunk)
+        return
+    try:
+        data = mmap.mmap(fileobj.fileno(), 0, access=mmap.ACCESS_READ)
+    except ValueError:
+        # an empty file can't be mapped
+        return
+    try:
+        for body in _mapped_bodies(data, loads, chunk_size, chunk_bytes):
+            yield body
+    finally:
+        data.close()
+
+
+def _send_sized_body(conn, body):
+    return len(body), _send_body(conn, body)
+
+
+def bulk_file(conn, path, chunk_bytes=5 * 1024 * 1024, chunk_size=None, workers=1, compressed=None,
+              progress=None, raise_on_bulk_item_failure=False):
+    """
+    Send a NDJSON file of bulk actions (an action header, followed by the
+    document but for a delete, on every line) in bulks of chunk_bytes bytes,
+    without loading it in memory: the file is memory mapped and every bulk
+    is a single slice of it, cut on the boundaries of the actions (a gzip
+    file is decompressed as a stream, and its actions are joined). Only the
+    headers are decoded.
+
+    :param chunk_size: the max number of actions of a bulk, if given.
+    :param workers: the number of bulks in flight.
+    :param compressed: if the file is compressed with gzip. Default: guessed
+        from the first bytes of the file.
+    :param progress: called after every bulk, in order, with the
+        statistics of the bulks sent so far: a dict with ``actions``,
+        ``errors``, ``bytes``, ``seconds``, ``actions_per_second`` and
+        ``bytes_per_second``.
+    :param raise_on_bulk_item_failure: raise a BulkOperationException for the
+        first bulk with a failed item.
+
+    Return the final statistics.
+    """
+    if compressed is None:
+        compressed = _is_gzip(path)
+    stats = {"actions": 0, "errors": 0, "bytes": 0, "seconds": 0.0, "actions_per_second": 0.0,
+             "bytes_per_second": 0.0}
+    started = time.time()
+    with open(path, "rb") as fileobj:
+        bodies = _file_bodies(fileobj, compressed, conn.json_backend.loads_plain, chunk_size or float("inf"),
+                              chunk_bytes)
+        for size, bulk_result in _send_bulks(conn, bodies, workers, _send_sized_body):
+            if raise_on_bulk_item_failure:
+                _raise_exception_if_bulk_item_failed(bulk_result)
+            items = bulk_result["items"]
+            stats["actions"] += len(items)
+            stats["errors"] += len([item for item in items if not _is_bulk_item_ok(item)])
+            stats["bytes"] += size
+            stats["seconds"] = elapsed = max(time.time() - started, 1e-9)
+            stats["actions_per_second"] = stats["actions"] / elapsed
+            stats["bytes_per_second"] = stats["bytes"] / elapsed
+            if progress is not None:
+                progress(dict(stats))
+    return stats
+
+
+def _chunk_results(bulk_result, raise_on_bulk_item_failure):
+    if raise_on_bulk_item_failure:
+        _raise_exception_if_bulk_item_failed(bulk_result)
+    for item in bulk_result["items"]:
+        yield _is_bulk_item_ok(item), item
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""
+Client side cache of the search and count responses.
+
+:class:`SearchCache` keeps the responses of ``search_raw`` and ``count`` as
+the bytes received from the server, in least recently used order, for a
+limited time and within a limited number of entries and bytes. The entries
+of an index are dropped when this client writes to it or refreshes it.
+"""
+from __future__ import absolute_import
+
+import threading
+import time
+from collections import OrderedDict
+from fnmatch import fnmatch
+
+import six
+
+__all__ = ["SearchCache", "path_indices"]
+
+# estimated memory of an entry besides the response
+ENTRY_OVERHEAD = 256
+
+
+def path_indices(path):
+    """
+    Return the indices of a request path: ``("_all",)`` if the path doesn't
+    start with an index
+    """
+    segment = path.lstrip("/").split("/", 1)[0]
+    if not segment or segment.startswith("_"):
+        return ("_all",)
+    return tuple(segment.split(","))
+
+
+class _Entry(object):
+    __slots__ = ("response", "indices", "size", "expires")
+
+    def __init__(self, response, indices, size, expires):
+        self.response = response
+        self.indices = indices
+        self.size = size
+        self.expires = expires
+
+
+class SearchCache(object):
+    """
+    LRU cache with time to live of the search and count responses.
+
+    :param max_entries: the max number of responses kept.
+    :param max_bytes: the max size of the responses kept: the least recently
+        used responses are dropped to make room. A response bigger than
+        max_bytes is not cached.
+    :param ttl: seconds a response is served from the cache: it bounds how
+        stale a response can be when the index is changed by other clients.
+    """
+
+    def __init__(self, max_entries=1000, max_bytes=16 * 1024 * 1024, ttl=30.0):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._by_index = {}
+        self._lock = threading.Lock()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """
+        Return the response cached for key or None
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires <= time.time():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.pop(key)
+            self._entries[key] = entry
+            return entry.response
+
+    def put(self, key, response, indices, size):
+        """
+        Cache response for key.
+
+        :param indices: the indices searched: the entry is dropped when one of
+            them is invalidated.
+        :param size: the size in bytes of the response.
+        """
+        size += ENTRY_OVERHEAD
+        if size > self.max_bytes or self.max_entries <= 0:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            while self._entries and (len(self._entries) >= self.max_entries or
+                                     self.size + size > self.max_bytes):
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+            self._entries[key] = _Entry(response, indices, size, time.time() + self.ttl)
+            self.size += size
+            for index in indices:
+                self._by_index.setdefault(index, set()).add(key)
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self.size -= entry.size
+        for index in entry.indices:
+            keys = self._by_index.get(index)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_index[index]
+
+    def invalidate(self, indices=None):
+        """
+        Drop the responses of searches on indices: an index name or a list of
+        them. The searches on all the indices or on a matching wildcard are
+        dropped too. With None (or "_all") the whole cache is cleared.
+        """
+        if isinstance(indices, six.string_types):
+            indices = [indices]
+        with self._lock:
+            if not indices or "_all" in indices:
+                self.invalidations += len(self._entries)
+                self._entries.clear()
+                self._by_index.clear()
+                self.size = 0
+                return
+            keys = set()
+            for name, index_keys in self._by_index.items():
+                if name == "_all" or name in indices or \
+                        ("*" in name and any(fnmatch(index, name) for index in indices)):
+                    keys.update(index_keys)
+            for key in keys:
+                self._remove(key)
+            self.invalidations += len(keys)
+
+    def clear(self):
+        """
+        Drop all the responses
+        """
+        self.invalidate()
+
+    def get_stats(self):
+        """
+        Return the counters: ``hits``, ``misses``, ``evictions`` (responses
+        dropped to make room), ``invalidations`` (responses dropped by writes
+        and refreshes), ``entries`` and ``bytes``
+        """
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                    "invalidations": self.invalidations, "entries": len(self._entries), "bytes": self.size}
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+Coalescing of identical concurrent reads.
+
+When several threads (or tasks) send the same read at the same time, only
+the first one reaches the server: the others wait for its response (see
+:class:`pyes.es_async.AsyncSingleFlight` for the asyncio flavour). The
+response is shared as the bytes received from the server and every caller
+decodes its own copy, so that the callers can't change each other's data.
+"""
+from __future__ import absolute_import
+
+import json
+import threading
+
+__all__ = ["request_key", "SingleFlight"]
+
+
+def request_key(method, path, params, body, loads=json.loads):
+    """
+    Return the key of a request: the method, the path, the params and the
+    body with the keys of the objects sorted, so that the same query built
+    in a different order gets the same key.
+    """
+    if body:
+        try:
+            body = json.dumps(loads(body), sort_keys=True, separators=(",", ":"))
+        except (ValueError, TypeError):
+            pass
+    return method, path, tuple(sorted((key, repr(value)) for key, value in params.items())), body
+
+
+class _Call(object):
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """
+    Run a function once for all the threads that call it concurrently with
+    the same key.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.shared = 0
+
+    def do(self, key, function):
+        """
+        Return the result of function(), shared with the concurrent calls with
+        the same key. The exceptions are raised to all the callers.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.calls += 1
+            else:
+                self.shared += 1
+        if leader:
+            try:
+                call.result = function()
+            except Exception as e:
+                call.error = e
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.event.set()
+        else:
+            call.event.wait()
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def get_stats(self):
+        """
+        Return the counters: ``calls`` (requests sent) and ``shared`` (calls
+        that waited for the response of an identical request)
+        """
+        with self._lock:
+            return {"calls": self.calls, "shared": self.shared}
+
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+Gzip compression of the request and response bodies.
+
+A :class:`Compression` passed as ``ES(compression=...)`` compresses the
+request bodies of at least ``min_bytes`` bytes (``Content-Encoding: gzip``)
+and asks for compressed responses (``Accept-Encoding: gzip``), that are
+decompressed transparently. The cluster must have ``http.compression``
+enabled (the default since Elasticsearch 5) to decompress the requests.
+"""
+from __future__ import absolute_import
+
+import threading
+import zlib
+
+__all__ = ["Compression", "gzip_compress", "gzip_decompress"]
+
+# the zlib window bits of the gzip format, and of a gzip or zlib stream
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+AUTO_WBITS = 32 + zlib.MAX_WBITS
+
+
+def gzip_compress(data, level=6):
+    """
+    Return data (bytes, bytearray or memoryview) compressed with gzip
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, GZIP_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+def gzip_decompress(data):
+    """
+    Return the data of a gzip (or zlib) stream
+    """
+    return zlib.decompress(data, AUTO_WBITS)
+
+
+class Compression(object):
+    """
+    The compression policy of a connection.
+
+    :param min_bytes: the smallest request body compressed: smaller bodies
+        are sent as they are, their compression costs more than it saves.
+    :param level: the gzip compression level, from 1 (fastest) to 9
+        (smallest).
+    :param accept_compressed: ask for compressed responses.
+    """
+
+    def __init__(self, min_bytes=1024, level=6, accept_compressed=True):
+        if not 1 <= level <= 9:
+            raise ValueError("level must be between 1 and 9")
+        self.min_bytes = min_bytes
+        self.level = level
+        self.accept_compressed = accept_compressed
+        self._lock = threading.Lock()
+        self.compressed = 0
+        self.bytes = 0
+        self.compressed_bytes = 0
+
+    def encode_request(self, body):
+        """
+        Return the body to send and the headers of the request
+        """
+        headers = {"accept-encoding": "gzip"} if self.accept_compressed else {}
+        if body is None or len(body) < self.min_bytes:
+            return body, headers
+        size = len(body)
+        body = gzip_compress(body, self.level)
+        headers["content-encoding"] = "gzip"
+        with self._lock:
+            self.compressed += 1
+            self.bytes += size
+            self.compressed_bytes += len(body)
+        return body, headers
+
+    def decode_response(self, headers, data):
+        """
+        Return the data of a response, decompressed if it's compressed
+        """
+        if data and headers.get("content-encoding", "").lower() == "gzip":
+            return gzip_decompress(data)
+        return data
+
+    def get_stats(self):
+        """
+        Return the number of compressed request bodies, and their size before
+        and after the compression
+        """
+        with self._lock:
+            return {"compressed": self.compressed, "bytes": self.bytes, "compressed_bytes": self.compressed_bytes}
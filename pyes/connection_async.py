@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+"""
+Non-blocking HTTP transport used by :class:`pyes.es_async.AsyncES`.
+
+It speaks plain HTTP/1.1 on top of asyncio streams and keeps a pool of
+keep-alive connections for every server.
+"""
+import asyncio
+import base64
+import heapq
+import random
+import ssl
+from collections import deque
+from time import time
+from urllib.parse import urlencode
+
+from . import logger
+from . import connection_http
+from .exceptions import NoServerAvailable
+
+__all__ = ["AsyncConnectionPool"]
+
+
+class _HTTPConnection(object):
+    """A single keep-alive connection to a server"""
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.reused = False
+
+    def close(self):
+        try:
+            self.writer.close()
+        except Exception:
+            pass
+
+
+class _HostPool(object):
+    """Idle connections to a server, at most ``maxsize`` open at once"""
+
+    def __init__(self, scheme, host, port, maxsize):
+        self.scheme = scheme
+        self.host = host
+        self.port = port
+        self.idle = deque()
+        self.slots = asyncio.Semaphore(maxsize)
+
+    async def acquire(self, timeout=None):
+        await self.slots.acquire()
+        while self.idle:
+            conn = self.idle.pop()
+            if conn.reader.at_eof() or conn.writer.is_closing():
+                conn.close()
+                continue
+            conn.reused = True
+            return conn
+        try:
+            ssl_context = None
+            if self.scheme == "https":
+                ssl_context = ssl.create_default_context()
+                if connection_http.CERT_REQS == 'CERT_NONE':
+                    ssl_context.check_hostname = False
+                    ssl_context.verify_mode = ssl.CERT_NONE
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(self.host, self.port, ssl=ssl_context), timeout)
+        except BaseException:
+            self.slots.release()
+            raise
+        return _HTTPConnection(reader, writer)
+
+    def release(self, conn, reusable):
+        if reusable:
+            self.idle.append(conn)
+        else:
+            conn.close()
+        self.slots.release()
+
+    def close(self):
+        while self.idle:
+            self.idle.pop().close()
+
+
+class AsyncConnectionPool(object):
+    """An asyncio connection to a randomly chosen server of the list.
+
+    Connections are kept alive and reused, up to ``maxsize`` for every
+    server. Failing servers are moved on a separate list and retried no
+    sooner than ``retry_time`` seconds after the failure, like
+    :class:`pyes.connection_http.Connection` does.
+
+    Parameters
+    ----------
+
+    servers: List of servers as dict with `scheme`, `host` and `port` keys.
+
+    timeout: Timeout in seconds for a request. Default: None (wait forever)
+
+    maxsize: Number of connections per server. Default: 10
+
+    basic_auth: A dict with `username` and `password` keys.
+
+    selector: A `pyes.selector.LatencySelector` choosing the server of every
+              request by latency and requests in flight. Default: None (a
+              random server)
+
+    compression: A `pyes.compression.Compression` compressing the request
+                 bodies and asking for compressed responses, that are
+                 decompressed. Default: None (no compression)
+    """
+
+    def __init__(self, servers, timeout=None, maxsize=10, basic_auth=None,
+                 retry_time=60, max_retries=3, selector=None, compression=None):
+        self._pools = {}
+        for server in servers:
+            key = "%s://%s:%s" % (server.get("scheme", "http"), server["host"], server["port"])
+            self._pools[key] = _HostPool(server.get("scheme", "http"), server["host"],
+                                         int(server["port"]), maxsize)
+        self._active_servers = list(self._pools.keys())
+        self._inactive_servers = []
+        self._timeout = timeout
+        self._retry_time = retry_time
+        self._max_retries = max_retries
+        self._selector = selector
+        self._compression = compression
+        self._headers = {}
+        if basic_auth:
+            credentials = "%(username)s:%(password)s" % basic_auth
+            self._headers["Authorization"] = "Basic " + base64.b64encode(
+                credentials.encode("utf-8")).decode("ascii")
+
+    def _get_server(self, exclude=None):
+        try:
+            ts, server = heapq.heappop(self._inactive_servers)
+        except IndexError:
+            pass
+        else:
+            if ts > time():  # Not yet, put it back
+                heapq.heappush(self._inactive_servers, (ts, server))
+            else:
+                self._active_servers.append(server)
+                logger.info("Restored server %s into active pool", server)
+        servers = self._active_servers
+        if exclude is not None and len(servers) > 1:
+            servers = [server for server in servers if server != exclude]
+        try:
+            if self._selector is not None:
+                return self._selector.select(servers)
+            return random.choice(servers)
+        except IndexError as ex:
+            raise NoServerAvailable(ex)
+
+    def _drop_server(self, server):
+        try:
+            self._active_servers.remove(server)
+        except ValueError:
+            pass
+        else:
+            heapq.heappush(self._inactive_servers, (time() + self._retry_time, server))
+            logger.warning("Removed server %s from active pool", server)
+
+    async def perform_request(self, method, url, params=None, body=None, headers=None, server=None):
+        """
+        Execute a request and return a tuple (status, headers, data).
+
+        HTTP error statuses are returned as they are: pyes has its own error
+        management code.
+
+        :param server: the server of the first attempt. Default: a server
+            chosen by the selector or at random.
+        """
+        timeout = self._timeout
+        if params:
+            params = dict(params)
+            params.pop("ignore", None)
+            timeout = params.pop("request_timeout", timeout)
+            if params:
+                url = "%s?%s" % (url, urlencode(params))
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        request_headers = dict(self._headers)
+        if headers:
+            request_headers.update(headers)
+        if self._compression is not None:
+            body, compression_headers = self._compression.encode_request(body)
+            request_headers.update(compression_headers)
+
+        retry = 0
+        while True:
+            if retry or server is None:
+                server = self._get_server()
+            pool = self._pools[server]
+            started = self._selector.start(server) if self._selector is not None else None
+            try:
+                result = await asyncio.wait_for(
+                    self._exchange(pool, method, url, body, request_headers), timeout)
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError) as ex:
+                if started is not None:
+                    self._selector.finish(server, started, failed=True)
+                self._drop_server(server)
+                if retry >= self._max_retries:
+                    logger.error("Client error: bailing out after %d failed retries",
+                                 self._max_retries, exc_info=1)
+                    raise NoServerAvailable(ex)
+                logger.exception("Client error: %d retries left", self._max_retries - retry)
+                retry += 1
+            except BaseException:
+                if started is not None:
+                    self._selector.finish(server, started)
+                raise
+            else:
+                if started is not None:
+                    self._selector.finish(server, started)
+                if self._compression is not None:
+                    status, response_headers, data = result
+                    result = status, response_headers, self._compression.decode_response(response_headers, data)
+                return result
+
+    async def _exchange(self, pool, method, url, body, headers):
+        while True:
+            conn = await pool.acquire()
+            try:
+                result, reusable = await self._roundtrip(conn, pool, method, url, body, headers)
+            except (OSError, asyncio.IncompleteReadError):
+                pool.release(conn, False)
+                if conn.reused:
+                    # the server closed an idle keep-alive connection
+                    continue
+                raise
+            except BaseException:
+                pool.release(conn, False)
+                raise
+            pool.release(conn, reusable)
+            return result
+
+    async def _roundtrip(self, conn, pool, method, url, body, headers):
+        lines = ["%s %s HTTP/1.1" % (method, url),
+                 "Host: %s:%s" % (pool.host, pool.port),
+                 "Connection: keep-alive"]
+        if body is not None:
+            lines.append("Content-Type: application/json")
+            lines.append("Content-Length: %d" % len(body))
+        for name, value in headers.items():
+            lines.append("%s: %s" % (name, value))
+        conn.writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+        if body:
+            conn.writer.write(body)
+        await conn.writer.drain()
+
+        status_line = await conn.reader.readline()
+        if not status_line:
+            raise asyncio.IncompleteReadError(b"", None)
+        version, status = status_line.decode("latin-1").split(" ", 2)[:2]
+        status = int(status)
+        response_headers = {}
+        while True:
+            line = await conn.reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            response_headers[name.strip().lower()] = value.strip()
+
+        reusable = version != "HTTP/1.0" and response_headers.get("connection", "").lower() != "close"
+        if method == "HEAD" or status in (204, 304) or 100 <= status < 200:
+            data = b""
+        elif response_headers.get("transfer-encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size = int((await conn.reader.readline()).split(b";")[0].strip(), 16)
+                if size == 0:
+                    # skip trailers
+                    while (await conn.reader.readline()) not in (b"\r\n", b"\n", b""):
+                        pass
+                    break
+                chunks.append(await conn.reader.readexactly(size))
+                await conn.reader.readexactly(2)
+            data = b"".join(chunks)
+        elif "content-length" in response_headers:
+            data = await conn.reader.readexactly(int(response_headers["content-length"]))
+        else:
+            data = await conn.reader.read()
+            reusable = False
+        return (status, response_headers, data), reusable
+
+    async def close(self):
+        """
+        Close all the idle connections
+        """
+        for pool in self._pools.values():
+            pool.close()
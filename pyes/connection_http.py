@@ -65,10 +65,14 @@ class Connection(object):
 
     basic_auth: Use HTTP Basic Auth. A (`username`, `password`) tuple or a dict
                 with `username` and `password` keys.
+
+    selector: A `pyes.selector.LatencySelector` choosing the server of every
+              request by latency and requests in flight. Default: None (a
+              random server, kept by the thread until it fails)
     """
 
     def __init__(self, servers=None, retry_time=60, max_retries=3, timeout=None,
-                 basic_auth=None):
+                 basic_auth=None, selector=None):
         if servers is None:
             servers = [DEFAULT_SERVER]
         self._active_servers = [server.geturl() for server in servers]
@@ -82,6 +86,7 @@ class Connection(object):
             self._headers = {}
         self._lock = threading.RLock()
         self._local = threading.local()
+        self._selector = selector
 
     def execute(self, request):
         """Execute a request and return a response"""
@@ -98,8 +103,9 @@ class Connection(object):
         retry = 0
         server = getattr(self._local, "server", None)
         while True:
-            if not server:
+            if not server or self._selector is not None:
                 self._local.server = server = self._get_server()
+            started = self._selector.start(server) if self._selector is not None else None
             try:
                 parse_result = urlparse(server)
                 conn = get_pool().connection_from_host(parse_result.hostname,
@@ -114,10 +120,14 @@ class Connection(object):
                 )
 
                 response = conn.urlopen(**kwargs)
+                if started is not None:
+                    self._selector.finish(server, started)
                 return RestResponse(status=response.status,
                                     body=response.data,
                                     headers=response.headers)
             except (IOError, urllib3.exceptions.HTTPError) as ex:
+                if started is not None:
+                    self._selector.finish(server, started, failed=True)
                 self._drop_server(server)
                 self._local.server = server = None
                 if retry >= self._max_retries:
@@ -141,6 +151,8 @@ class Connection(object):
                     logger.info("Restored server %s into active pool", server)
 
             try:
+                if self._selector is not None:
+                    return self._selector.select(self._active_servers)
                 return random.choice(self._active_servers)
             except IndexError as ex:
                 raise NoServerAvailable(ex)
@@ -5,6 +5,7 @@ import six
 
 from datetime import date, datetime
 from decimal import Decimal
+from six.moves import queue
 
 if six.PY2:
     from six.moves.urllib.parse import urlencode, urlunsplit, urlparse
@@ -15,7 +16,13 @@ else:
 
 import base64
 import codecs
+import copy
+import functools
+import io
+import logging
 import random
+import threading
+import time
 import weakref
 
 try:
@@ -25,6 +32,8 @@ except ImportError:
 
 from . import logger
 from . import connection_http
+from .cache import path_indices
+from .coalescing import request_key, SingleFlight
 from .connection_http import connect as http_connect
 from .convert_errors import raise_if_error
 # from .decorators import deprecated
@@ -33,8 +42,11 @@ from .exceptions import ElasticSearchException, ReduceSearchPhaseException, \
 from .helpers import SettingsBuilder
 from .managers import Indices, Cluster
 from .mappings import Mapper
-from .models import ElasticSearchModel, DotDict, ListBulker
+from .models import ElasticSearchModel, DotDict, ListBulker, _is_bulk_item_ok
 from .query import Search, Query
+from .sort import SortFactory
+from .serializers import get_json_backend, apply_object_hook
+from .streaming import HitStream
 from .utils import make_path, get_unicode_string
 
 from .fakettypes import Method, RestRequest
@@ -164,6 +176,21 @@ class ESJsonDecoder(json.JSONDecoder):
         return DotDict(d)
 
 
+class DotDictJsonDecoder(json.JSONDecoder):
+    """
+    Decode the objects as DotDict and leave the strings as they are: used
+    when the dates are decoded with the mapping (``date_decoding="mapping"``)
+    """
+
+    def __init__(self, *args, **kwargs):
+        kwargs['object_hook'] = DotDict
+        super(DotDictJsonDecoder, self).__init__(*args, **kwargs)
+
+
+# request bodies of these types are already serialized and are sent as they are
+SERIALIZED_TYPES = six.string_types + (six.binary_type, bytearray, memoryview)
+
+
 class JSONSerializer(object):
     mimetype = 'application/json'
 
@@ -179,16 +206,49 @@ class JSONSerializer(object):
 
 
     def dumps(self, data):
-        # don't serialize strings
-        if isinstance(data, six.string_types):
+        # don't serialize strings or already encoded bodies
+        if isinstance(data, SERIALIZED_TYPES):
             return data
 
         try:
-            json.dumps(data, cls=ES.encoder)
+            return json.dumps(data, cls=ES.encoder)
         except (ValueError, TypeError) as e:
             raise SerializationError(data, e)
 
 
+def _transport_logs_body():
+    """
+    Return True if the elasticsearch client logs the request bodies
+    """
+    return logging.getLogger("elasticsearch").isEnabledFor(logging.DEBUG) or \
+        logging.getLogger("elasticsearch.trace").isEnabledFor(logging.INFO)
+
+
+class _TransportSelector(object):
+    """
+    Adapter of a :class:`pyes.selector.LatencySelector` to the selector
+    interface of the elasticsearch connection pool
+    """
+
+    def __init__(self, selector, connections_opts=None):
+        self.selector = selector
+
+    def select(self, connections):
+        return self.selector.select(connections, key=_node_name)
+
+
+def _node_name(connection):
+    return connection.host
+
+
+def _is_scroll(params):
+    """
+    Return True if a search with these params opens a scroll: its response
+    carries a scroll id, that can't be reused by another search
+    """
+    return "scroll" in params or params.get("search_type") in ("scan", "scroll")
+
+
 def get_id(text):
     import uuid
 
@@ -202,8 +262,12 @@ class ES(object):
     # static to easy overwrite
     encoder = ESJsonEncoder
     decoder = ESJsonDecoder
+    # seconds between two reloads of the mapping of an index missing a document type
+    MAPPING_RELOAD_INTERVAL = 5.0
+    # max attempts of hedged reads in flight, and threads sending them
+    HEDGE_WORKERS = 8
 
-    def __init__(self, server="localhost:9200", timeout=30.0, bulk_size=400,
+    def __init__(self, server="localhost:9200", timeout=30.0, bulk_size=400, bulk_max_bytes=None,
                  encoder=None, decoder=None,
                  max_retries=3,
                  retry_time=60,
@@ -219,7 +283,15 @@ class ES(object):
                  cert_reqs='CERT_OPTIONAL',
                  sniff_on_start=False,
                  sniff_on_connection_fail=True,
-                 sniffer_timeout=60
+                 sniffer_timeout=60,
+                 json_backend=None,
+                 date_decoding="heuristic",
+                 response_mode="dotdict",
+                 selector=None,
+                 hedge_policy=None,
+                 coalesce_reads=False,
+                 search_cache=None,
+                 compression=None
     ):
         """
         Init a es object.
@@ -234,7 +306,10 @@ class ES(object):
 
         :param server: the server name, it can be a list of servers.
         :param timeout: timeout for a call
-        :param bulk_size: size of bulk operation
+        :param bulk_size: size of bulk operation: the max number of actions of a bulk
+        :param bulk_max_bytes: the max size in bytes of a bulk: a bulk is sent when
+        it reaches bulk_size actions or bulk_max_bytes, whichever comes first.
+        Default: no size limit.
         :param encoder: tojson encoder
         :param max_retries: number of max retries for server if a server is down
         :param retry_time: number of seconds between retries
@@ -254,6 +329,39 @@ class ES(object):
         :param sniff_on_start: sniff before doing anything
         :param sniff_on_connection_fail: refresh nodes after a node fails to respond
         :param sniffer_timeout: sniffer timeout
+        :param json_backend: the name of the JSON codec used to encode requests and
+        decode responses, i.e. "json" (the default) or "orjson". The encoder
+        and decoder semantics are kept and "json" is used if the codec
+        library is not installed (see :mod:`pyes.serializers`).
+        :param date_decoding: how date strings in the responses are converted to
+        datetime. "heuristic" (the default) tries every string that looks like
+        a date, "mapping" converts only the date fields of the index mapping,
+        when a hit is turned into a model.
+        :param response_mode: "dotdict" (the default) decodes every object of the
+        responses as DotDict. "dict" decodes plain dicts with the C decoder:
+        the top level of a response is a DotDict whose nested dicts are wrapped
+        when they are read as attributes, and the decoder (DotDict and dates)
+        is applied to a hit only when it's turned into a model.
+        :param selector: a :class:`pyes.selector.LatencySelector` that routes
+        every request to the least loaded of two random nodes, using the
+        latency and the requests in flight of every node. By default the
+        nodes are used round robin.
+        :param hedge_policy: a :class:`pyes.hedging.HedgePolicy` to hedge the
+        reads (get, mget, count and search_raw): if the first node doesn't
+        answer within the policy delay, the read is sent to a second node
+        and the first response wins. Default: no hedging.
+        :param coalesce_reads: if True, the identical reads (get, mget, count
+        and search_raw with the same path, params and body) sent concurrently
+        by several threads share a single request; every caller decodes its
+        own copy of the response. The searches that open a scroll are never
+        coalesced.
+        :param search_cache: a :class:`pyes.cache.SearchCache` that keeps the
+        responses of search_raw (but the scrolls) and count. The responses of an index are
+        dropped when this client indexes, updates or deletes documents in it,
+        sends a bulk on it or refreshes it.
+        :param compression: a :class:`pyes.compression.Compression` that
+        compresses the large request bodies with gzip and asks for compressed
+        responses. Default: no compression.
 
         """
         if default_indices is None:
@@ -266,6 +374,14 @@ class ES(object):
         self.debug_dump = False
         self.cluster_name = "undefined"
         self.basic_auth = basic_auth
+        self.selector = selector
+        self.hedge_policy = hedge_policy
+        self._hedge_executor = None
+        self._hedge_lock = threading.Lock()
+        self._hedge_slots = threading.BoundedSemaphore(self.HEDGE_WORKERS)
+        self.single_flight = self._create_single_flight() if coalesce_reads else None
+        self.search_cache = search_cache
+        self.compression = compression
 
         from elasticsearch import Elasticsearch
         self.connection = Elasticsearch()
@@ -294,8 +410,10 @@ class ES(object):
 
         # used in bulk
         self._bulk_size = bulk_size  # size of the bulk
+        self.bulk_max_bytes = bulk_max_bytes
         self.bulker = bulker_class(weakref.proxy(self), bulk_size=bulk_size,
-                                   raise_on_bulk_item_failure=raise_on_bulk_item_failure)
+                                   raise_on_bulk_item_failure=raise_on_bulk_item_failure,
+                                   **self._bulker_options())
         self.bulker_class = bulker_class
         self._raise_on_bulk_item_failure = raise_on_bulk_item_failure
 
@@ -304,8 +422,20 @@ class ES(object):
         self.info = {}  # info about the current server
         if encoder:
             self.encoder = encoder
+        if date_decoding not in ("heuristic", "mapping"):
+            raise ValueError("Invalid date_decoding: %s" % date_decoding)
+        self.date_decoding = date_decoding
+        self._date_fields = {}
+        self._mapping_reloads = {}
         if decoder:
             self.decoder = decoder
+        elif date_decoding == "mapping":
+            self.decoder = DotDictJsonDecoder
+        if response_mode not in ("dotdict", "dict"):
+            raise ValueError("Invalid response_mode: %s" % response_mode)
+        self.response_mode = response_mode
+        self._object_hook = self.decoder().object_hook
+        self.json_backend = get_json_backend(json_backend, encoder=self.encoder, decoder=self.decoder)
         if isinstance(server, six.string_types):
             self.servers = [server]
         elif isinstance(server, tuple):
@@ -424,6 +554,9 @@ class ES(object):
                                             max_retries=self.max_retries, serializer=JSONSerializer())
         else:
             server = random.choice(self.servers)
+            kwargs = {}
+            if self.selector is not None:
+                kwargs["selector_class"] = functools.partial(_TransportSelector, self.selector)
             if server.get("scheme", "http") in ["http", "https"]:
                 # self.connection = http_connect(
                 # [server for server in self.servers if server.scheme in ["http", "https"]],
@@ -432,13 +565,13 @@ class ES(object):
                 self.connection = Elasticsearch([server for server in self.servers if server.get("scheme", "http") in ["http", "https"]],
                                                 sniff_on_start=self._sniff_on_start, sniffer_timeout=self._sniffer_timeout,
                                                 sniff_on_connection_fail=self._sniff_on_connection_fail,
-                                                max_retries=self.max_retries, serializer=JSONSerializer())
+                                                max_retries=self.max_retries, serializer=JSONSerializer(), **kwargs)
 
         #monkey patching transport
         self.connection.transport.perform_request=self.__perform_request
 
 
-    def __perform_request(self, method, url, params=None, body=None):
+    def __perform_request(self, method, url, params=None, body=None, first_connection=None):
         """
         we monkey-patch the elasticsearch default client for better manage the pyes responses
 
@@ -458,10 +591,11 @@ class ES(object):
             underlying :class:`~elasticsearch.Connection` class for serialization
         :arg body: body of the request, will be serializes using serializer and
             passed to the connection
+        :arg first_connection: the connection used by the first attempt
         """
         from elasticsearch.exceptions import ConnectionError
         if body is not None:
-            body = self.connection.transport.serializer.dumps(body)
+            body = self._encode_body(body)
 
             # some clients or environments don't support sending GET with body
             if method == 'GET' and self.connection.transport.send_get_body_as != 'GET':
@@ -476,13 +610,6 @@ class ES(object):
                     params['source'] = body
                     body = None
 
-        if body is not None:
-            try:
-                body = body.encode('utf-8')
-            except UnicodeDecodeError:
-                # Python 2 and str, no need to re-encode
-                pass
-
         ignore = ()
         timeout = None
         if params:
@@ -491,12 +618,29 @@ class ES(object):
             if isinstance(ignore, int):
                 ignore = (ignore, )
 
+        headers = None
+        if self.compression is not None:
+            # the responses are decompressed by urllib3
+            body, headers = self.compression.encode_request(body)
+
+        if body is not None and not _transport_logs_body():
+            # the elasticsearch connection decodes a bytes body back to str
+            # only to log it: a memoryview is sent as it is, without copies
+            body = memoryview(body)
+
         for attempt in range(self.connection.transport.max_retries + 1):
-            connection = self.connection.transport.get_connection()
+            if attempt == 0 and first_connection is not None:
+                connection = first_connection
+            else:
+                connection = self.connection.transport.get_connection()
+            started = self.selector.start(connection.host) if self.selector is not None else None
+            failed = False
 
             try:
-                status, headers, data = connection.perform_request(method, url, params, body, ignore=ignore, timeout=timeout)
+                status, headers, data = connection.perform_request(method, url, params, body, ignore=ignore,
+                                                                   timeout=timeout, headers=headers)
             except ConnectionError:
+                failed = True
                 self.connection.transport.mark_dead(connection)
 
                 # raise exception on last retry
@@ -508,6 +652,9 @@ class ES(object):
                 # if data:
                 #     data = self.connection.transport.deserializer.loads(data, headers.get('content-type'))
                 return status, headers, data
+            finally:
+                if started is not None:
+                    self.selector.finish(connection.host, started, failed=failed)
 
 
     def _discovery(self):
@@ -561,7 +708,176 @@ class ES(object):
 
     raise_on_bulk_item_failure = property(_get_raise_on_bulk_item_failure, _set_raise_on_bulk_item_failure)
 
-    def _send_request(self, method, path, body=None, params=None, headers=None, raw=False, return_response=False):
+    def _send_request(self, method, path, body=None, params=None, headers=None, raw=False, return_response=False,
+                      read=False, cached=False, invalidate=None, connection=None):
+        """
+        Send a request and decode its response.
+
+        :param read: the request is an idempotent read, that can be hedged
+            and coalesced.
+        :param cached: the response of the read can be served by the search
+            cache.
+        :param invalidate: the indices changed by the request, whose cached
+            responses are dropped.
+        :param connection: the connection of the first attempt of a write.
+            Default: the next connection of the pool.
+        """
+        method, path, body, params = self._prepare_request(method, path, body, params, headers)
+        if read:
+            status, headers, data = self._read(method, path, params, body, cached=cached)
+        elif connection is not None:
+            status, headers, data = self.connection.transport.perform_request(method, path, params=params, body=body,
+                                                                              first_connection=connection)
+        else:
+            status, headers, data = self.connection.transport.perform_request(method, path, params=params, body=body)
+            if invalidate is not None:
+                self._invalidate_cache(invalidate)
+        return self._process_response(method, body, status, headers, data, raw=raw,
+                                      return_response=return_response)
+
+    def _create_single_flight(self):
+        return SingleFlight()
+
+    def _read(self, method, path, params, body, cached=False):
+        """
+        Send a read through the search cache (if cached) and the coalescing
+        of the identical reads and return the raw response
+        """
+        scroll = _is_scroll(params)
+        cache = self.search_cache if cached and not scroll else None
+        single_flight = self.single_flight if not scroll else None
+        key = None
+        if cache is not None or single_flight is not None:
+            key = request_key(method, path, params, body, loads=self.json_backend.loads_plain)
+        if cache is not None:
+            response = cache.get(key)
+            if response is not None:
+                return response
+        if single_flight is not None:
+            response = single_flight.do(key, lambda: self._perform_read(method, path, params, body))
+        else:
+            response = self._perform_read(method, path, params, body)
+        if cache is not None and response[0] == 200:
+            cache.put(key, response, path_indices(path), len(response[2]))
+        return response
+
+    def _invalidate_cache(self, indices):
+        """
+        Drop the cached responses of indices (None for all the indices)
+        """
+        if self.search_cache is not None:
+            self.search_cache.invalidate(indices)
+
+    def _invalidate_bulk(self, bulk_result):
+        """
+        Drop the cached responses of the indices changed by a bulk
+        """
+        if self.search_cache is not None and bulk_result:
+            indices = set()
+            for item in bulk_result.get("items", []):
+                for action in item.values():
+                    indices.add(action.get("_index"))
+            indices.discard(None)
+            if indices:
+                self.search_cache.invalidate(list(indices))
+
+    def _perform_read(self, method, path, params, body):
+        if self.hedge_policy is not None:
+            return self._perform_hedged(method, path, params, body)
+        return self.connection.transport.perform_request(method, path, params=params, body=body)
+
+    def _perform_hedged(self, method, path, params, body):
+        """
+        Send a read to a node and, if it isn't answered within the delay of
+        the hedge policy, to a second node: the first response wins. The
+        attempts run on a shared pool of HEDGE_WORKERS threads; when the
+        budget can't pay a hedge or the pool is busy, the read is sent on the
+        calling thread without hedge. The request of the loser can't be
+        interrupted: it ends in background and its response is discarded.
+        """
+        policy = self.hedge_policy
+        transport = self.connection.transport
+        connections = getattr(transport.connection_pool, "connections", [])
+        if len(connections) < 2:
+            return transport.perform_request(method, path, params=params, body=body)
+
+        policy.add_read()
+        primary = transport.get_connection()
+        delay = policy.get_delay(primary.host)
+        if not policy.can_hedge():
+            started = time.time()
+            response = self._send_attempt(primary, method, path, params, body)
+            if time.time() - started > delay:
+                # a hedge would have been sent
+                policy.add_over_budget()
+            return response
+        if not self._hedge_slots.acquire(False):
+            return self._send_attempt(primary, method, path, params, body)
+
+        results = queue.Queue()
+        self._start_attempt(results, primary, False, method, path, params, body)
+        pending = 0
+        try:
+            hedged, error, response = results.get(timeout=delay)
+        except queue.Empty:
+            others = [connection for connection in connections if connection is not primary]
+            if others and self._hedge_slots.acquire(False):
+                if policy.acquire():
+                    if self.selector is not None:
+                        secondary = self.selector.select(others, key=_node_name)
+                    else:
+                        secondary = random.choice(others)
+                    self._start_attempt(results, secondary, True, method, path, params, body)
+                    pending = 1
+                else:
+                    self._hedge_slots.release()
+            hedged, error, response = results.get()
+        if error is not None and pending:
+            # the other attempt can still succeed
+            hedged, error, response = results.get()
+        if error is not None:
+            raise error
+        if hedged:
+            policy.add_win()
+        return response
+
+    def _send_attempt(self, connection, method, path, params, body):
+        started = time.time()
+        response = self.connection.transport.perform_request(method, path, params=dict(params), body=body,
+                                                             first_connection=connection)
+        self.hedge_policy.record_latency(connection.host, time.time() - started)
+        return response
+
+    def _start_attempt(self, results, connection, hedged, method, path, params, body):
+        """
+        Send an attempt on the hedge pool, holding a slot of _hedge_slots
+        until it ends
+        """
+        def attempt():
+            try:
+                response = self._send_attempt(connection, method, path, params, body)
+            except Exception as e:
+                results.put((hedged, e, None))
+            else:
+                results.put((hedged, None, response))
+            finally:
+                self._hedge_slots.release()
+
+        if self._hedge_executor is None:
+            from concurrent.futures import ThreadPoolExecutor
+
+            with self._hedge_lock:
+                if self._hedge_executor is None:
+                    self._hedge_executor = ThreadPoolExecutor(max_workers=self.HEDGE_WORKERS)
+        self._hedge_executor.submit(attempt)
+
+    def _prepare_request(self, method, path, body=None, params=None, headers=None):
+        """
+        Normalize path, body and params of a request before it is sent and
+        dump it if curl logging is active.
+
+        :return a tuple (method, path, body, params)
+        """
         if params is None:
             params = {}
         elif "routing" in params and params["routing"] is None:
@@ -577,10 +893,9 @@ class ES(object):
         if body:
             if not isinstance(body, dict) and hasattr(body, "as_dict"):
                 body = body.as_dict()
-            if isinstance(body, dict):
-                body = json.dumps(body, cls=self.encoder)
+            body = self._encode_body(body)
         else:
-            body = ""
+            body = b""
 
         if params:
             for k in params:
@@ -595,16 +910,35 @@ class ES(object):
         if self.log_curl:
             logger.debug(self._get_curl_request(request))
 
-        # execute the request
-        #response = self.connection.execute(request)
         #pyes has its own error management code
-        params["ignore"]=(400,404,409)
+        params["ignore"] = (400, 404, 409)
+        return method, path, body, params
 
-        status, headers, data=self.connection.transport.perform_request(method, path, params=params, body=body)
+    def _encode_body(self, body):
+        """
+        Encode a request body to bytes in a single step.
 
+        Bodies which are already serialized are not encoded again: bytes,
+        bytearray and memoryview are returned as they are and str is only
+        encoded to utf-8.
+        """
+        if isinstance(body, (six.binary_type, bytearray, memoryview)):
+            return body
+        if isinstance(body, six.text_type):
+            return body.encode('utf-8')
+        try:
+            return self.json_backend.dumps_bytes(body)
+        except (ValueError, TypeError) as e:
+            raise SerializationError(body, e)
+
+    def _process_response(self, method, body, status, headers, data, raw=False, return_response=False):
+        """
+        Decode the response of a request, raising the matching pyes exception
+        for error statuses.
+        """
         if self.dump_curl is not None:
             self.dump_curl.write(("# response status: %s" % status).encode('utf-8'))
-            self.dump_curl.write(("# response body: %s" % body).encode('utf-8'))
+            self.dump_curl.write(("# response body: %s" % get_unicode_string(body)).encode('utf-8'))
 
         if return_response:
             return DotDict({"status":status, "body":data, "headers":headers})
@@ -612,13 +946,13 @@ class ES(object):
         if method == "HEAD":
             return status == 200
 
-        # handle the response
+        # handle the response: the json backend decodes bytes directly
         response_body = data
-        if six.PY3:
-            response_body = response_body.decode(encoding='UTF-8')
-
         try:
-            decoded = json.loads(response_body, cls=self.decoder)
+            if self.response_mode == "dict":
+                decoded = self.json_backend.loads_plain(response_body)
+            else:
+                decoded = self.json_backend.loads(response_body)
         except ValueError:
             try:
                 decoded = json.loads(response_body, cls=ESJsonDecoder)
@@ -627,6 +961,8 @@ class ES(object):
                 # parsed as JSON is when no handler is found for a request URI.
                 # In this case, the body is actually a good message to return
                 # in the exception.
+                if isinstance(response_body, six.binary_type) and six.PY3:
+                    response_body = response_body.decode(encoding='UTF-8')
                 raise ElasticSearchException(response_body, status, response_body)
         if status not in [200, 201]:
             raise_if_error(status, decoded)
@@ -634,6 +970,63 @@ class ES(object):
             decoded = DotDict(decoded)
         return decoded
 
+    def _stream_request(self, method, path, body=None, params=None, headers=None):
+        """
+        Send a search or scroll request and return a HitStream that reads the
+        response while its hits are iterated.
+        """
+        from elasticsearch.exceptions import ConnectionError
+        from urllib3.util.retry import Retry
+
+        method, path, body, params = self._prepare_request(method, path, body, params, headers)
+        params.pop("ignore", None)
+        transport = self.connection.transport
+        if method == 'GET' and body and transport.send_get_body_as == 'POST':
+            method = 'POST'
+
+        extra_headers = {}
+        if body and self.compression is not None:
+            body, extra_headers = self.compression.encode_request(self._encode_body(body))
+
+        for attempt in range(transport.max_retries + 1):
+            connection = transport.get_connection()
+            url = connection.url_prefix + path
+            if params:
+                url = "%s?%s" % (url, urlencode(params))
+            started = self.selector.start(connection.host) if self.selector is not None else None
+            request_headers = connection.headers.copy()
+            request_headers.update(extra_headers)
+            try:
+                response = connection.pool.urlopen(method, url, body or None, retries=Retry(False),
+                                                   headers=request_headers, preload_content=False)
+            except Exception as e:
+                if started is not None:
+                    self.selector.finish(connection.host, started, failed=True)
+                transport.mark_dead(connection)
+                # raise exception on last retry
+                if attempt == transport.max_retries:
+                    raise ConnectionError("N/A", str(e), e)
+            else:
+                # the latency until the response headers
+                if started is not None:
+                    self.selector.finish(connection.host, started)
+                transport.connection_pool.mark_live(connection)
+                break
+
+        if self.response_mode == "dict":
+            decoder = json.JSONDecoder()
+        else:
+            decoder = self.decoder()
+        if response.status not in [200, 201]:
+            try:
+                data = response.read()
+            finally:
+                response.release_conn()
+            # raises the matching pyes exception
+            self._process_response(method, body, response.status, response.headers, data)
+            return HitStream(io.BytesIO(data), decoder)
+        return HitStream(response, decoder)
+
     def _make_path(self, indices, doc_types, *components, **kwargs):
         indices = self._validate_indices(indices)
         if 'allow_all_indices' in kwargs:
@@ -705,12 +1098,103 @@ class ES(object):
                                     document_object_field=self.document_object_field)
         return self._mappings
 
+    def decode_objects(self, obj):
+        """
+        Apply the decoder to a part of a response decoded as plain dicts
+        (``response_mode="dict"``): the objects become DotDict and the dates
+        are decoded. In the default mode obj is returned as it is.
+        """
+        if self.response_mode != "dict" or self._object_hook is None:
+            return obj
+        return apply_object_hook(obj, self._object_hook)
+
+    def get_selector_stats(self):
+        """
+        Return the statistics of the nodes collected by the selector, as a
+        dict node -> dict (see :meth:`pyes.selector.LatencySelector.get_stats`)
+        """
+        if self.selector is None:
+            return {}
+        return self.selector.get_stats()
+
+    def get_date_fields(self, index, doc_type):
+        """
+        Return the date fields of a document type as a list of (path tokens, DateField).
+
+        The list is empty unless the dates are decoded with the mapping
+        (``date_decoding="mapping"``). The mapping is loaded once and kept
+        until :meth:`invalidate_mappings`; a document type missing from it
+        reloads the mapping of its index, at most every
+        ``MAPPING_RELOAD_INTERVAL`` seconds.
+        """
+        if self.date_decoding != "mapping" or not index:
+            return []
+        key = (index, doc_type)
+        fields = self._date_fields.get(key)
+        if fields is None:
+            mapping = self.mappings.get_doctype(index, doc_type)
+            if mapping is None and self._reload_mapping(index):
+                mapping = self.mappings.get_doctype(index, doc_type)
+            if mapping is None:
+                # not kept: the document type can be created later
+                return []
+            fields = mapping.get_datetime_properties()
+            fields = self._date_fields[key] = [(path.split("."), field) for path, field in sorted(fields.items())]
+        return fields
+
+    def _reload_mapping(self, index):
+        """
+        Reload the mapping of an index, unless it was reloaded less than
+        MAPPING_RELOAD_INTERVAL seconds ago. Return True if it was reloaded.
+        """
+        now = time.time()
+        if now - self._mapping_reloads.get(index, 0) < self.MAPPING_RELOAD_INTERVAL:
+            return False
+        self._mapping_reloads[index] = now
+        try:
+            self.mappings.update_indices(self.indices.get_mapping(indices=index, raw=True))
+        except ElasticSearchException:
+            return False
+        return True
+
+    def invalidate_mappings(self, indices=None):
+        """
+        Drop the loaded mappings (and date fields) of indices, None for all
+        the indices: they are reloaded when a hit of theirs is decoded. It's
+        called by ``indices.create_index`` and ``indices.put_mapping``.
+        """
+        if indices is not None:
+            indices = self._validate_indices(indices)
+            if "_all" in indices:
+                indices = None
+        if indices is None:
+            self._date_fields = {}
+            self._mapping_reloads = {}
+            self._mappings = None
+            return
+        for key in list(self._date_fields):
+            if key[0] in indices:
+                del self._date_fields[key]
+        for index in indices:
+            self._mapping_reloads.pop(index, None)
+            if self._mappings is not None:
+                self._mappings.indices.pop(index, None)
+
     def create_bulker(self):
         """
         Create a bulker object and return it to allow to manage custom bulk policies
         """
         return self.bulker_class(self, bulk_size=self.bulk_size,
-                                 raise_on_bulk_item_failure=self.raise_on_bulk_item_failure)
+                                 raise_on_bulk_item_failure=self.raise_on_bulk_item_failure,
+                                 **self._bulker_options())
+
+    def _bulker_options(self):
+        # only the options that are set, to support the bulkers written
+        # before they were introduced
+        options = {}
+        if self.bulk_max_bytes is not None:
+            options["max_bytes"] = self.bulk_max_bytes
+        return options
 
     def ensure_index(self, index, mappings=None, settings=None, clear=False):
         """
@@ -780,7 +1264,7 @@ class ES(object):
             info['server']['name'] = res['name']
             info['server']['version'] = res['version']
             info['allinfo'] = res
-            info['status'] = self.cluster.status()
+            info['status'] = self.indices.status()
             info['aliases'] = self.indices.aliases()
             self.info = info
             return True
@@ -788,20 +1272,29 @@ class ES(object):
             self.info = {}
             return False
 
-    def index_raw_bulk(self, header, document):
+    def index_raw_bulk(self, header, document, callback=None):
         """
         Function helper for fast inserting
 
         :param header: a string with the bulk header must be ended with a newline
         :param document: a json document string must be ended with a newline
+        :param callback: called with ``(ok, item)`` (or resolved, if it's a
+        future) with the item of the action in the bulk response
         """
-        self.bulker.add("%s%s" % (header, document))
+        if callback is None:
+            self.bulker.add("%s%s" % (header, document))
+        else:
+            self.bulker.add("%s%s" % (header, document), callback=callback)
         return self.flush_bulk()
 
     def index(self, doc, index, doc_type, id=None, parent=None, force_insert=False,
-              op_type=None, bulk=False, version=None, querystring_args=None, ttl=None):
+              op_type=None, bulk=False, version=None, querystring_args=None, ttl=None, callback=None):
         """
         Index a typed JSON document into a specific index and make it searchable.
+
+        :param callback: with bulk, called with ``(ok, item)`` (or resolved, if
+        it's a future) with the item of the document in the bulk response. See
+        :meth:`pyes.models.BaseBulker.add`.
         """
         if querystring_args is None:
             querystring_args = {}
@@ -825,10 +1318,7 @@ class ES(object):
             if ttl is not None:
                 cmd[op_type]['_ttl'] = ttl
 
-            if isinstance(doc, dict):
-                doc = json.dumps(doc, cls=self.encoder)
-            command = "%s\n%s" % (json.dumps(cmd, cls=self.encoder), doc)
-            self.bulker.add(command)
+            self.bulker.add_action(op_type, cmd[op_type], doc, callback=callback)
             return self.flush_bulk()
 
         if force_insert:
@@ -857,7 +1347,7 @@ class ES(object):
             request_method = 'PUT'
 
         path = make_path(index, doc_type, id)
-        return self._send_request(request_method, path, doc, querystring_args)
+        return self._send_request(request_method, path, doc, querystring_args, invalidate=index)
 
     def flush_bulk(self, forced=False):
         """
@@ -873,6 +1363,22 @@ class ES(object):
         """
         return self.flush_bulk(True)
 
+    def bulk_from_file(self, path, chunk_bytes=5 * 1024 * 1024, workers=1, compressed=None, progress=None,
+                       **kwargs):
+        """
+        Send a NDJSON file of bulk actions, optionally compressed with gzip,
+        in bulks of chunk_bytes bytes without loading it in memory.
+
+        :param workers: the number of bulks in flight.
+        :param progress: called after every bulk with the statistics of the
+        bulks sent so far (actions, errors, bytes, throughput).
+
+        Return the statistics. See :func:`pyes.bulk.bulk_file`.
+        """
+        from .bulk import bulk_file
+        return bulk_file(self, path, chunk_bytes=chunk_bytes, workers=workers, compressed=compressed,
+                         progress=progress, **kwargs)
+
     def put_file(self, filename, index, doc_type, id=None, name=None):
         """
         Store a file in a index
@@ -910,7 +1416,8 @@ class ES(object):
 
 
     def update(self, index, doc_type, id, script=None, lang="groovy", params=None, document=None, upsert=None,
-               model=None, bulk=False, querystring_args=None, retry_on_conflict=None, routing=None, doc_as_upsert=None):
+               model=None, bulk=False, querystring_args=None, retry_on_conflict=None, routing=None, doc_as_upsert=None,
+               callback=None):
         if querystring_args is None:
             querystring_args = {}
 
@@ -937,8 +1444,7 @@ class ES(object):
                 if arg in querystring_args:
                     cmd["update"]['_%s' % arg] = querystring_args[arg]
 
-            command = "%s\n%s" % (json.dumps(cmd, cls=self.encoder), json.dumps(body, cls=self.encoder))
-            self.bulker.add(command)
+            self.bulker.add_action("update", cmd["update"], body, callback=callback)
             return self.flush_bulk()
         else:
             if routing is not None:
@@ -948,7 +1454,7 @@ class ES(object):
 
         path = make_path(index, doc_type, id, "_update")
         model = model or self.model
-        return model(self, self._send_request('POST', path, body, querystring_args))
+        return model(self, self._send_request('POST', path, body, querystring_args, invalidate=index))
 
     def update_by_function(self, extra_doc, index, doc_type, id, querystring_args=None,
                            update_func=None, attempts=2):
@@ -983,7 +1489,107 @@ class ES(object):
             except VersionConflictEngineException:
                 if attempt <= 0:
                     raise
-                self.refresh(index)
+                self.indices.refresh(index)
+
+    def update_by_function_batch(self, extra_docs, index, doc_type, querystring_args=None,
+                                 update_func=None, attempts=2, chunk_size=500):
+        """
+        Update many already indexed typed JSON documents client-side, like
+        :meth:`update_by_function` does for one: the current documents are
+        retrieved with a ``_mget`` for every chunk of chunk_size ids, updated
+        locally and written back with a ``_bulk`` of versioned index
+        actions. Only the documents with a version conflict are retrieved and
+        written again, up to ``attempts`` times.
+
+        :param extra_docs: a dict id -> extra_doc, or a list of (id, extra_doc)
+            pairs.
+        :param update_func: A callable ``update_func(current_doc, extra_doc)``
+            that computes and returns the updated doc, or updates
+            ``current_doc`` in place and returns None. The default
+            ``update_func`` is ``dict.update``.
+
+        Return a bulk response with the item of every document, in the order
+        of extra_docs: the missing documents have an item with status 404,
+        the documents that the ``_mget`` failed to read an item with its
+        error.
+        """
+        if querystring_args is None:
+            querystring_args = {}
+        if update_func is None:
+            update_func = dict.update
+        if isinstance(extra_docs, dict):
+            extra_docs = list(extra_docs.items())
+        else:
+            extra_docs = list(extra_docs)
+
+        items = []
+        took = 0
+        for start in range(0, len(extra_docs), chunk_size):
+            chunk = extra_docs[start:start + chunk_size]
+            chunk_items = [None] * len(chunk)
+            positions = list(range(len(chunk)))
+            for attempt in range(attempts):
+                bulk_result = self._update_chunk(chunk, positions, chunk_items, index, doc_type, querystring_args,
+                                                 update_func)
+                if bulk_result is not None:
+                    took += bulk_result.get("took", 0)
+                positions = [position for position in positions
+                             if chunk_items[position]["index"].get("status") == 409]
+                if not positions:
+                    break
+            items.extend(chunk_items)
+        return DotDict(took=took, errors=not all(_is_bulk_item_ok(item) for item in items), items=items)
+
+    def _update_chunk(self, chunk, positions, items, index, doc_type, querystring_args, update_func):
+        """
+        Read the documents at positions of chunk, update them and write them
+        back in a bulk, setting their items
+        """
+        current_docs = self.mget([chunk[position][0] for position in positions], index, doc_type,
+                                 **querystring_args)
+        lines, written = self._update_documents(chunk, positions, items, current_docs, index, doc_type,
+                                                querystring_args, update_func)
+        if not lines:
+            return None
+        bulk_result = self._send_request("POST", "/_bulk", "\n".join(lines) + "\n")
+        self._invalidate_bulk(bulk_result)
+        for position, item in zip(written, bulk_result["items"]):
+            items[position] = item
+        return bulk_result
+
+    def _update_documents(self, chunk, positions, items, current_docs, index, doc_type, querystring_args,
+                          update_func):
+        """
+        Update the current documents of the positions of chunk: return the
+        lines of their bulk and their positions. The documents missing or
+        that can't be read get a failed item.
+        """
+        header = {"_index": index, "_type": doc_type}
+        if "routing" in querystring_args:
+            header["_routing"] = querystring_args["routing"]
+        lines = []
+        written = []
+        for position, current_doc in zip(positions, current_docs):
+            id, extra_doc = chunk[position]
+            meta = current_doc._meta
+            if "error" in meta:
+                error = meta.error
+                status = error.get("status", 500) if isinstance(error, dict) else 500
+            elif not meta.get("found", True):
+                error, status = "document missing", 404
+            else:
+                error = None
+            if error is not None:
+                items[position] = {"index": {"_index": index, "_type": doc_type, "_id": id, "status": status,
+                                             "error": error}}
+                continue
+            new_doc = update_func(current_doc, extra_doc)
+            if new_doc is None:
+                new_doc = current_doc
+            lines.append(self.json_backend.dumps({"index": dict(header, _id=id, _version=meta.version)}))
+            lines.append(self.json_backend.dumps(new_doc))
+            written.append(position)
+        return lines, written
 
     def partial_update(self, index, doc_type, id, doc=None, script=None, params=None,
                        upsert=None, querystring_args=None, lang=None):
@@ -1006,21 +1612,20 @@ class ES(object):
             cmd = {"doc": doc }
         path = make_path(index, doc_type, id, "_update")
 
-        return self._send_request('POST', path, cmd, querystring_args)
+        return self._send_request('POST', path, cmd, querystring_args, invalidate=index)
 
-    def delete(self, index, doc_type, id, bulk=False, **query_params):
+    def delete(self, index, doc_type, id, bulk=False, callback=None, **query_params):
         """
         Delete a typed JSON document from a specific index based on its id.
-        If bulk is True, the delete operation is put in bulk mode.
+        If bulk is True, the delete operation is put in bulk mode and
+        callback, if given, gets the item of the delete in the bulk response.
         """
         if bulk:
-            cmd = {"delete": {"_index": index, "_type": doc_type,
-                              "_id": id}}
-            self.bulker.add(json.dumps(cmd, cls=self.encoder))
+            self.bulker.add_action("delete", {"_index": index, "_type": doc_type, "_id": id}, callback=callback)
             return self.flush_bulk()
 
         path = make_path(index, doc_type, id)
-        return self._send_request('DELETE', path, params=query_params)
+        return self._send_request('DELETE', path, params=query_params, invalidate=index)
 
     def delete_by_query(self, indices, doc_types, query, **query_params):
         """
@@ -1028,7 +1633,7 @@ class ES(object):
         """
         path = self._make_path(indices, doc_types, '_query')
         body = {"query": query.serialize()}
-        return self._send_request('DELETE', path, body, query_params)
+        return self._send_request('DELETE', path, body, query_params, invalidate=self._validate_indices(indices))
 
     def exists(self, index, doc_type, id, **query_params):
         """
@@ -1045,7 +1650,7 @@ class ES(object):
         if fields is not None:
             query_params["fields"] = ",".join(fields)
         model = model or self.model
-        return model(self, self._send_request('GET', path, params=query_params))
+        return model(self, self._send_request('GET', path, params=query_params, read=True))
 
     def factory_object(self, index, doc_type, data=None, id=None):
         """
@@ -1098,7 +1703,7 @@ class ES(object):
                              "_id": value})
 
         results = self._send_request('GET', "/_mget", body={'docs': body},
-                                     params=query_params)
+                                     params=query_params, read=True)
         if 'docs' in results:
             model = self.model
             return [model(self, item) for item in results['docs']]
@@ -1119,7 +1724,21 @@ class ES(object):
             query = query.serialize()
         body = self._encode_query(query)
         path = self._make_path(indices, doc_types, "_search")
-        return self._send_request('GET', path, body, params=query_params, headers=headers)
+        return self._send_request('GET', path, body, params=query_params, headers=headers, read=True, cached=True)
+
+    def search_raw_stream(self, query, indices=None, doc_types=None, headers=None, **query_params):
+        """Execute a search like search_raw, but return a :class:`pyes.streaming.HitStream`
+        that decodes the hits one at a time while the response is read.
+        """
+        from .query import Search, Query
+
+        if isinstance(query, Query):
+            query = query.search()
+        if isinstance(query, Search):
+            query = query.serialize()
+        body = self._encode_query(query)
+        path = self._make_path(indices, doc_types, "_search")
+        return self._stream_request('GET', path, body, params=query_params, headers=headers)
 
     def search_raw_multi(self, queries, indices_list=None, doc_types_list=None,
                          routing_list=None, search_type_list=None):
@@ -1158,7 +1777,7 @@ class ES(object):
             else:
                 headers.append('')
 
-        headers = [json.dumps(header) for header in headers]
+        headers = [self.json_backend.dumps(header) for header in headers]
 
         body = '\n'.join(['%s\n%s' % (h_q[0], h_q[1]) for h_q in zip(headers, queries)])
         body = '%s\n' % body
@@ -1166,12 +1785,23 @@ class ES(object):
 
         return body, self._send_request('GET', path, body)
 
-    def search(self, query, indices=None, doc_types=None, model=None, scan=False, headers=None, **query_params):
+    def search(self, query, indices=None, doc_types=None, model=None, scan=False, headers=None, stream=False,
+               search_after=False, tiebreaker=None, **query_params):
         """Execute a search against one or more indices to get the resultset.
 
         `query` must be a Search object, a Query object, or a custom
         dictionary of search parameters using the query DSL to be passed
         directly.
+
+        If `stream` is True a :class:`StreamingResultSet` is returned: the
+        responses are read while the hits are iterated.
+
+        If `search_after` is True a :class:`SearchAfterResultSet` is
+        returned: the pages are read with ``search_after`` instead of
+        ``from``, so that every page costs the same however deep it is. The
+        sort is completed with `tiebreaker`, required: a field with doc
+        values and a unique value for every document (not ``_id``, that
+        can't be sorted on without fielddata).
         """
         if isinstance(query, Search):
             search = query
@@ -1184,8 +1814,12 @@ class ES(object):
             query_params.setdefault("search_type", "scan")
             query_params.setdefault("scroll", "10m")
 
-        return ResultSet(self, search, indices=indices, doc_types=doc_types,
-                         model=model, query_params=query_params, headers=headers)
+        if search_after:
+            return SearchAfterResultSet(self, search, indices=indices, doc_types=doc_types, model=model,
+                                        query_params=query_params, headers=headers, tiebreaker=tiebreaker)
+        resultset_class = StreamingResultSet if stream else ResultSet
+        return resultset_class(self, search, indices=indices, doc_types=doc_types,
+                               model=model, query_params=query_params, headers=headers)
 
     def search_multi(self, queries, indices_list=None, doc_types_list=None,
                      routing_list=None, search_type_list=None, models=None, scans=None):
@@ -1220,6 +1854,12 @@ class ES(object):
         """
         return self._send_request('GET', "_search/scroll", scroll_id, {"scroll": scroll})
 
+    def search_scroll_stream(self, scroll_id, scroll="10m"):
+        """
+        Executes a scrolling given an scroll_id and return a :class:`pyes.streaming.HitStream`
+        """
+        return self._stream_request('GET', "_search/scroll", scroll_id, {"scroll": scroll})
+
     def suggest_from_object(self, suggest, indices=None, preference=None,
                             routing=None, raw=False, **kwargs):
         indices = self._validate_indices(indices)
@@ -1271,7 +1911,7 @@ class ES(object):
             query = MatchAllQuery()
         body = {"query": query.serialize()}
         path = self._make_path(indices, doc_types, "_count")
-        return self._send_request('GET', path, body, params=query_params)
+        return self._send_request('GET', path, body, params=query_params, read=True, cached=True)
 
     #--- river management
     def create_river(self, river, river_name=None):
@@ -1336,7 +1976,7 @@ class ES(object):
             query.update(kwargs)
 
         path = make_path(index, '.percolator', name)
-        body = json.dumps(query, cls=self.encoder)
+        body = self.json_backend.dumps(query)
         return self._send_request('PUT', path, body)
 
     def delete_percolator(self, index, name):
@@ -1360,7 +2000,7 @@ class ES(object):
         """
         Serialize to json a serializable object (Search, Query, Filter, etc).
         """
-        return json.dumps(serializable.serialize(), cls=self.encoder)
+        return self.json_backend.dumps(serializable.serialize())
 
     def _encode_query(self, query):
         from .query import Query
@@ -1368,7 +2008,7 @@ class ES(object):
         if isinstance(query, Query):
             query = query.serialize()
         if isinstance(query, dict):
-            return json.dumps(query, cls=self.encoder)
+            return self.json_backend.dumps(query)
 
         raise InvalidQuery("`query` must be Query or dict instance, not %s"
                            % query.__class__)
@@ -1512,6 +2152,7 @@ class ResultSet(object):
 
         self.iterpos = 0  # keep track of iterator position
         self.start = query_params.get("start", search.start) or 0
+        self._first_start = self.start
         self._max_item = query_params.get("size", search.size)
         self._current_item = 0
         if search.bulk_read is not None:
@@ -1556,15 +2197,15 @@ class ResultSet(object):
             self._post_process_query()
 
     def _post_process_query(self):
-        self._facets = self._results.get('facets', {})
-        self._aggs = self._results.get('aggregations', {})
+        self._facets = self.connection.decode_objects(self._results.get('facets', {}))
+        self._aggs = self.connection.decode_objects(self._results.get('aggregations', {}))
         if 'hits' in self._results:
             self.valid = True
             self._hits = self._results['hits']['hits']
         else:
             self._hits = []
         if self.auto_fix_keys:
-            self._fix_keys()
+            self.fix_keys()
         if self.auto_clean_highlight:
             self.clean_highlight()
 
@@ -1644,10 +2285,13 @@ class ResultSet(object):
             return
 
         for hit in self._results['hits']['hits']:
-            for key, item in list(hit.items()):
-                if key.startswith("_"):
-                    hit[key[1:]] = item
-                    del hit[key]
+            self._fix_hit_keys(hit)
+
+    def _fix_hit_keys(self, hit):
+        for key, item in list(hit.items()):
+            if key.startswith("_"):
+                hit[key[1:]] = item
+                del hit[key]
 
     def clean_highlight(self):
         """
@@ -1657,11 +2301,14 @@ class ResultSet(object):
             return
 
         for hit in self._results['hits']['hits']:
-            if 'highlight' in hit:
-                hl = hit['highlight']
-                for key, item in list(hl.items()):
-                    if not item:
-                        del hl[key]
+            self._clean_hit_highlight(hit)
+
+    def _clean_hit_highlight(self, hit):
+        if 'highlight' in hit:
+            hl = hit['highlight']
+            for key, item in list(hl.items()):
+                if not item:
+                    del hl[key]
 
     def __getattr__(self, name):
         if self._results is None:
@@ -1684,36 +2331,49 @@ class ResultSet(object):
             return self._results["_shards"]
         return self._results['hits'][name]
 
-    def __getitem__(self, val):
+    def _get_start_end(self, val):
         if not isinstance(val, (int, slice)):
             raise TypeError('%s indices must be integers, not %s' % (
                 self.__class__.__name__, val.__class__.__name__))
 
-        def get_start_end(val):
-            if isinstance(val, slice):
-                start = val.start
-                if not start:
-                    start = 0
-                end = val.stop or self.total
-                if end < 0:
-                    end = self.total + end
-                if self._max_item is not None and end > self._max_item:
-                    end = self._max_item
-                return start, end
-            return val, val + 1
+        if isinstance(val, slice):
+            start = val.start
+            if not start:
+                start = 0
+            end = val.stop or self.total
+            if end < 0:
+                end = self.total + end
+            if self._max_item is not None and end > self._max_item:
+                end = self._max_item
+            return start, end
+        return val, val + 1
 
-        start, end = get_start_end(val)
+    def _get_loaded_items(self, val, start, end):
+        """
+        Return the requested items if they are in the current page, else None
+        """
         model = self.model
-
         if self._results:
-            if start >= 0 and end <= self.start + self.chuck_size and len(self._results['hits']['hits']) > 0 and \
-                    ("_source" in self._results['hits']['hits'][0] or "_fields" in self._results['hits']['hits'][0]):
+            hits = self._results['hits']['hits']
+            # offset of the loaded page from the first requested item
+            offset = self.start - self._first_start
+            if offset <= start and end <= offset + len(hits) and len(hits) > 0 and \
+                    ("_source" in hits[0] or "_fields" in hits[0]):
                 if not isinstance(val, slice):
-                    return model(self.connection, self._results['hits']['hits'][val - self.start])
+                    return model(self.connection, hits[val - offset])
                 else:
-                    return [model(self.connection, hit) for hit in self._results['hits']['hits'][start:end]]
+                    return [model(self.connection, hit) for hit in hits[start - offset:end - offset]]
+        return None
+
+    def __getitem__(self, val):
+        start, end = self._get_start_end(val)
+        model = self.model
+
+        items = self._get_loaded_items(val, start, end)
+        if items is not None:
+            return items
 
-        results = self._search_raw(start + self.start, end - start)
+        results = self._search_raw(start + self._first_start, end - start)
         hits = results['hits']['hits']
         if not isinstance(val, slice):
             if len(hits) == 1:
@@ -1755,7 +2415,10 @@ class ResultSet(object):
     def __iter__(self):
         self.iterpos = 0
         if self._current_item != 0:
+            # restart from the first page
             self._results = None
+            self.start = self._first_start
+            self.scroller_id = None
         self._current_item = 0
 
         return self
@@ -1777,6 +2440,213 @@ class ResultSet(object):
         return expand_suggest_text(self.suggest)
 
 
+class SearchAfterResultSet(ResultSet):
+    """
+    A ResultSet that iterates the pages with ``search_after``: every page
+    starts after the sort values of the last hit of the previous page, so
+    its cost doesn't grow with the depth and it isn't limited by
+    ``index.max_result_window``.
+
+    The sort of the search is completed with ``tiebreaker``, a field with a
+    unique value for every document, so that the hits with the same sort
+    values aren't skipped or repeated across the pages. It must have doc
+    values: sorting on ``_id`` needs fielddata on Elasticsearch 6, is
+    deprecated from 7.6 and disabled by default on 8 (5 needs ``_uid``).
+    Indexing and slicing still run a ``from``/``size`` search.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.tiebreaker = kwargs.pop("tiebreaker", None)
+        if not self.tiebreaker:
+            raise InvalidQuery("search_after needs a tiebreaker: a field with doc values and a unique value for "
+                               "every document")
+        super(SearchAfterResultSet, self).__init__(*args, **kwargs)
+        if self.query_params.get("search_type") == "scan" or "scroll" in self.query_params:
+            raise InvalidQuery("search_after can't be used with scan or scroll")
+        self._search_after = None
+        self._paged_search = copy.copy(self.search)
+        self._paged_search.sort = self._get_sort()
+        self._paged_search.start = None
+
+    def _get_sort(self):
+        sort = self.search.sort
+        if isinstance(sort, SortFactory):
+            sort = sort.serialize()
+        if not sort:
+            sort = ["_score"]
+        elif not isinstance(sort, list):
+            sort = [sort]
+        fields = set()
+        for order in sort:
+            if isinstance(order, dict):
+                fields.update(order.keys())
+            else:
+                fields.add(order)
+        if self.tiebreaker not in fields:
+            sort = sort + [{self.tiebreaker: "asc"}]
+        return sort
+
+    def _do_search(self, auto_increment=False):
+        self.iterpos = 0
+        if auto_increment:
+            self.start += self.chuck_size
+            hits = self._results['hits']['hits']
+            if hits:
+                self._search_after = hits[-1].get("sort")
+        self._paged_search.search_after = self._search_after
+        query_params = dict(self.query_params)
+        query_params["size"] = self.chuck_size
+        if self._search_after is None and self._first_start:
+            # the first page can start from an offset
+            query_params["from"] = self._first_start
+        self._results = self.connection.search_raw(self._paged_search, indices=self.indices,
+                                                   doc_types=self.doc_types, headers=self.headers, **query_params)
+        self._post_process_query()
+
+    def __iter__(self):
+        if self._current_item != 0:
+            self._search_after = None
+        return super(SearchAfterResultSet, self).__iter__()
+
+
+class StreamingResultSet(ResultSet):
+    """
+    A ResultSet that reads the search and scroll responses as streams: the
+    hits of a page are decoded one at a time while they are iterated, so the
+    memory used is about a hit instead of a page and the first hit is
+    returned before the page is fully received.
+
+    ``total`` and ``max_score`` are known when the first page is opened,
+    facets and aggregations when its hits have been read (if they are asked
+    before, the remaining hits of the page are loaded in memory). Indexing
+    and slicing run a new search.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(StreamingResultSet, self).__init__(*args, **kwargs)
+        self._stream = None
+        self._pending_hits = None
+
+    def _stream_search(self, start, size):
+        query_params = dict(self.query_params)
+        query_params["from"] = start
+        query_params["size"] = size
+        return self.connection.search_raw_stream(self.search, indices=self.indices,
+                                                 doc_types=self.doc_types, headers=self.headers, **query_params)
+
+    def _open(self, stream):
+        self._stream = stream
+        self._pending_hits = None
+        self._results = stream.results
+        self._post_process_query()
+
+    def _do_search(self, auto_increment=False):
+        self.iterpos = 0
+        self.close()
+        if self.scroller_id is None:
+            if auto_increment:
+                self.start += self.chuck_size
+
+            do_scan = self.query_params.get("search_type", None) == "scan"
+            self._open(self._stream_search(self.start, self.chuck_size))
+            if do_scan:
+                self.query_params.pop("search_type")
+                self.scroller_parameters['search_type'] = "scan"
+                if 'scroll' in self.query_params:
+                    self.scroller_parameters['scroll'] = self.query_params.pop('scroll')
+                if 'size' in self.query_params:
+                    self.chuck_size = self.scroller_parameters['size'] = self.query_params.pop('size')
+                # the first response of a scan has no hits
+                self._stream.read_all()
+
+            self._update_scroll_id()
+            if do_scan and self.scroller_id is not None:
+                self._do_search()
+        else:
+            self._open(self.connection.search_scroll_stream(self.scroller_id,
+                                                            self.scroller_parameters.get("scroll", "10m")))
+            self._update_scroll_id()
+
+    def _update_scroll_id(self):
+        # the scroll id can be before or after the hits
+        if '_scroll_id' in self._results:
+            self.scroller_id = self._results['_scroll_id']
+            if 'scroll' in self.query_params:
+                self.scroller_parameters.setdefault('scroll', self.query_params['scroll'])
+
+    def _end_page(self):
+        """
+        Collect the members of the response after the hits
+        """
+        self._update_scroll_id()
+        self._facets = self.connection.decode_objects(self._results.get('facets', {}))
+        self._aggs = self.connection.decode_objects(self._results.get('aggregations', {}))
+
+    def _load_page(self):
+        if self._stream is not None and not self._stream.finished:
+            self._pending_hits = iter(self._stream.read_all())
+            self._end_page()
+
+    @property
+    def facets(self):
+        if self._results is None:
+            self._do_search()
+        self._load_page()
+        return self._facets
+
+    @property
+    def aggs(self):
+        if self._results is None:
+            self._do_search()
+        self._load_page()
+        return self._aggs
+
+    def _next_hit(self):
+        hits = self._pending_hits if self._pending_hits is not None else self._stream
+        try:
+            return next(hits)
+        except StopIteration:
+            self._end_page()
+            raise
+
+    def __next__(self):
+        if self._max_item is not None and self._current_item == self._max_item:
+            self.close()
+            raise StopIteration
+        if self._results is None:
+            self._do_search()
+        while True:
+            try:
+                hit = self._next_hit()
+                break
+            except StopIteration:
+                if self.iterpos == 0 or (self.scroller_id is None and self.start + self.iterpos >= self.total):
+                    raise
+                self._do_search(auto_increment=True)
+        self.iterpos += 1
+        self._current_item += 1
+        if self.auto_fix_keys:
+            self._fix_hit_keys(hit)
+        if self.auto_clean_highlight:
+            self._clean_hit_highlight(hit)
+        return self.model(self.connection, hit)
+
+    if six.PY2:
+        next = __next__
+
+    def __iter__(self):
+        if self._current_item != 0:
+            self.close()
+        return super(StreamingResultSet, self).__iter__()
+
+    def close(self):
+        """
+        Release the connection of the page being read
+        """
+        if self._stream is not None:
+            self._stream.close()
+
+
 class EmptyResultSet(object):
     def __init__(self, *args, **kwargs):
         """
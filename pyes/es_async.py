@@ -0,0 +1,887 @@
+# -*- coding: utf-8 -*-
+"""
+asyncio flavour of the :class:`pyes.es.ES` connection object.
+
+Example::
+
+    conn = AsyncES(("http", "127.0.0.1", 9200))
+    await conn.index({"name": "Joe"}, "test-index", "test-type", 1)
+    async for hit in conn.search(TermQuery("name", "joe")):
+        print(hit)
+    await conn.close()
+"""
+import asyncio
+import base64
+import time
+import weakref
+
+from . import logger
+from .cache import path_indices
+from .coalescing import request_key, SingleFlight
+from .connection_async import AsyncConnectionPool
+from .es import ES, ResultSet, ResultSetMulti, _is_scroll, expand_suggest_text
+from .exceptions import InvalidQuery, IndexAlreadyExistsException, IndexMissingException, \
+    ReduceSearchPhaseException, VersionConflictEngineException
+from .helpers import SettingsBuilder
+from .managers import Indices, Cluster
+from .mappings import Mapper
+from .models import DotDict, ListBulker, _is_bulk_item_ok, _merge_bulk_results, \
+    _raise_exception_if_bulk_item_failed
+from .query import Search, Query
+from .utils import make_path
+
+__all__ = ["AsyncES", "AsyncResultSet", "AsyncResultSetMulti", "AsyncListBulker", "AsyncSingleFlight"]
+
+
+class AsyncSingleFlight(SingleFlight):
+    """
+    Await a coroutine once for all the tasks that call it concurrently with
+    the same key. The coroutine runs in its own task: a cancelled caller
+    doesn't cancel the others.
+    """
+
+    async def do(self, key, function):
+        """
+        Await function() and return its result, shared with the concurrent
+        calls with the same key
+        """
+        with self._lock:
+            task = self._calls.get(key)
+            if task is None:
+                task = self._calls[key] = asyncio.ensure_future(function())
+                task.add_done_callback(lambda _: self._calls.pop(key, None))
+                self.calls += 1
+            else:
+                self.shared += 1
+        return await asyncio.shield(task)
+
+
+class AsyncListBulker(ListBulker):
+    """
+    A bulker that store data in a list and sends it without blocking the loop
+    """
+
+    def get_bulk_size(self):
+        return self._bulk_size
+
+    def set_bulk_size(self, bulk_size):
+        """
+        Set the bulk size. The pending actions are sent by the next flush_bulk.
+        """
+        self._bulk_size = bulk_size
+
+    bulk_size = property(get_bulk_size, set_bulk_size)
+
+    async def _post_batch(self, batch):
+        bulk_result = await self.conn._send_request("POST",
+                                                    "/_bulk",
+                                                    "\n".join(batch) + "\n")
+        self.conn._invalidate_bulk(bulk_result)
+        return bulk_result
+
+    async def _send_batch(self, batch):
+        try:
+            bulk_result = await self._post_batch(batch)
+            positions = self._get_retry_positions(bulk_result.get("items", []))
+            for attempt in range(self.max_item_retries):
+                if not positions:
+                    break
+                await asyncio.sleep(self.get_retry_delay(attempt))
+                retry_result = await self._post_batch([batch[position] for position in positions])
+                positions = self._update_items(bulk_result, positions, retry_result)
+        except Exception as e:
+            self._resolve_callbacks(batch, error=e)
+            raise
+        self._resolve_callbacks(batch, bulk_result)
+
+        if self.raise_on_bulk_item_failure:
+            _raise_exception_if_bulk_item_failed(bulk_result)
+
+        return bulk_result
+
+    async def flush_bulk(self, forced=False):
+        results = []
+        batch = self._take_batch(forced)
+        while batch:
+            results.append(await self._send_batch(batch))
+            batch = self._take_batch(forced)
+        return _merge_bulk_results(results)
+
+
+class AsyncIndices(Indices):
+    """
+    Indices manager for :class:`AsyncES`: every method returns an awaitable.
+    """
+
+    async def get_alias(self, alias):
+        status = await self.status([alias])
+        return status['indices'].keys()
+
+    async def set_alias(self, alias, indices, **kwargs):
+        indices = self.conn._validate_indices(indices)
+        try:
+            old_indices = await self.get_alias(alias)
+        except IndexMissingException:
+            old_indices = []
+        commands = [['remove', index, alias, {}] for index in old_indices]
+        commands.extend([['add', index, alias,
+                          self._get_alias_params(**kwargs)] for index in indices])
+        if len(commands) > 0:
+            return await self.change_aliases(commands)
+
+    async def create_index(self, index, settings=None):
+        result = await self.conn._send_request('PUT', index, settings)
+        self.conn.invalidate_mappings(index)
+        return result
+
+    async def create_index_if_missing(self, index, settings=None):
+        try:
+            return await self.create_index(index, settings)
+        except IndexAlreadyExistsException as e:
+            return e.result
+
+    async def delete_index_if_exists(self, index):
+        if await self.exists_index(index):
+            return await self.delete_index(index)
+
+    async def get_indices(self, include_aliases=False):
+        state = await self.conn.cluster.state()
+        status = await self.status()
+        result = {}
+        indices_status = status['indices']
+        indices_metadata = state['metadata']['indices']
+        for index in sorted(indices_status.keys()):
+            info = indices_status[index]
+            try:
+                num_docs = info['docs']['num_docs']
+            except KeyError:
+                num_docs = 0
+            result[index] = dict(num_docs=num_docs)
+
+            if not include_aliases:
+                continue
+            for alias in indices_metadata.get(index, {}).get('aliases', []):
+                alias_obj = result.setdefault(alias, {})
+                alias_obj['num_docs'] = alias_obj.get('num_docs', 0) + num_docs
+                alias_obj.setdefault('alias_for', []).append(index)
+        return result
+
+    async def get_closed_indices(self):
+        state = await self.conn.cluster.state()
+        status = await self.status()
+
+        indices_metadata = set(state['metadata']['indices'].keys())
+        indices_status = set(status['indices'].keys())
+
+        return indices_metadata.difference(indices_status)
+
+    async def flush(self, indices=None, refresh=None):
+        await self.conn.force_bulk()
+        path = self.conn._make_path(indices, '_flush')
+        args = {}
+        if refresh is not None:
+            args['refresh'] = refresh
+        return await self.conn._send_request('POST', path, params=args)
+
+    async def refresh(self, indices=None, timesleep=None, timeout=0):
+        await self.conn.force_bulk()
+        path = self.conn._make_path(indices, (), '_refresh', allow_all_indices=False)
+        result = await self.conn._send_request('POST', path, invalidate=self.conn._validate_indices(indices))
+        if timesleep:
+            await asyncio.sleep(timesleep)
+        await self.conn.cluster.health(wait_for_status='yellow', timeout=timeout)
+        return result
+
+    async def put_mapping(self, doc_type=None, mapping=None, indices=None, ignore_conflicts=None):
+        if not isinstance(mapping, dict):
+            if mapping is None:
+                mapping = {}
+            if hasattr(mapping, "as_dict"):
+                mapping = mapping.as_dict()
+
+        if doc_type:
+            path = self.conn._make_path(indices, doc_type, "_mapping")
+            if doc_type not in mapping:
+                mapping = {doc_type: mapping}
+        else:
+            path = self.conn._make_path(indices, (), "_mapping")
+
+        parameters = {}
+
+        if ignore_conflicts is not None:
+            parameters['ignore_conflicts'] = ignore_conflicts
+
+        result = await self.conn._send_request('PUT', path, mapping, params=parameters)
+        self.conn.invalidate_mappings(indices)
+        return result
+
+    async def get_mapping(self, doc_type=None, indices=None, raw=False):
+        if doc_type is None and indices is None:
+            path = make_path("_mapping")
+        else:
+            indices = self.conn._validate_indices(indices)
+            if doc_type:
+                path = make_path(','.join(indices), doc_type, "_mapping")
+            else:
+                path = make_path(','.join(indices), "_mapping")
+        result = await self.conn._send_request('GET', path)
+        if raw:
+            return result
+        mapper = Mapper(result, is_mapping=False,
+                        connection=self.conn,
+                        document_object_field=self.conn.document_object_field)
+        if doc_type:
+            if indices and len(indices) == 1 and len(doc_type) == 1:
+                return mapper.get_doctype(indices[0], doc_type)
+
+        return mapper
+
+
+class AsyncCluster(Cluster):
+    """
+    Cluster manager for :class:`AsyncES`: every method returns an awaitable.
+    """
+
+
+class AsyncES(ES):
+    """
+    ES connection object working on asyncio.
+
+    It accepts the same parameters of :class:`pyes.es.ES` plus `pool_maxsize`,
+    the number of keep-alive connections for every server. ``index``,
+    ``get``, ``mget``, ``delete``, ``count``, ``search_raw``, bulk operations
+    and the ``indices``/``cluster`` managers return awaitables; ``search``
+    returns an :class:`AsyncResultSet` to be consumed with ``async for``.
+    """
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault("bulker_class", AsyncListBulker)
+        self._pool_maxsize = kwargs.pop("pool_maxsize", 10)
+        super(AsyncES, self).__init__(*args, **kwargs)
+        self.indices = AsyncIndices(weakref.proxy(self))
+        self.cluster = AsyncCluster(weakref.proxy(self))
+
+    def __del__(self):
+        if self.bulker and self.bulker.bulk_data:
+            logger.error("pyes object %s is being destroyed, but bulk "
+                         "operations have not been flushed. Await force_bulk()!",
+                         self)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    def _init_connection(self):
+        """
+        Create initial connection pool
+        """
+        servers = [server for server in self.servers if server.get("scheme", "http") in ["http", "https"]]
+        if not servers:
+            servers = [{"scheme": "http", "host": "localhost", "port": 9200}]
+        self.connection = AsyncConnectionPool(servers, timeout=self.timeout, maxsize=self._pool_maxsize,
+                                              basic_auth=self.basic_auth, retry_time=self.retry_time,
+                                              max_retries=self.max_retries, selector=self.selector,
+                                              compression=self.compression)
+
+    async def close(self):
+        """
+        Send the pending bulk operations and close the idle connections
+        """
+        if self.bulker and self.bulker.bulk_data:
+            await self.force_bulk()
+        await self.connection.close()
+
+    async def ensure_index(self, index, mappings=None, settings=None, clear=False):
+        """
+        Ensure if an index with mapping exists
+        """
+        mappings = mappings or []
+        if isinstance(mappings, dict):
+            mappings = [mappings]
+        exists = await self.indices.exists_index(index)
+        if exists and not mappings and not clear:
+            return
+        if exists and clear:
+            await self.indices.delete_index(index)
+            exists = False
+
+        if exists:
+            if isinstance(mappings, SettingsBuilder):
+                for name, data in list(mappings.mappings.items()):
+                    await self.indices.put_mapping(doc_type=name, mapping=data, indices=index)
+
+            else:
+                from pyes.mappings import DocumentObjectField, ObjectField
+
+                for maps in mappings:
+                    if isinstance(maps, tuple):
+                        name, mapping = maps
+                        await self.indices.put_mapping(doc_type=name, mapping=mapping, indices=index)
+                    elif isinstance(maps, dict):
+                        for name, data in list(maps.items()):
+                            await self.indices.put_mapping(doc_type=name, mapping=maps, indices=index)
+                    elif isinstance(maps, (DocumentObjectField, ObjectField)):
+                        await self.indices.put_mapping(doc_type=maps.name, mapping=maps.as_dict(), indices=index)
+
+                return
+
+        if settings:
+            if isinstance(settings, dict):
+                settings = SettingsBuilder(settings, mappings)
+        else:
+            if isinstance(mappings, SettingsBuilder):
+                settings = mappings
+            else:
+                settings = SettingsBuilder(mappings=mappings)
+        if not exists:
+            await self.indices.create_index(index, settings)
+            await self.indices.refresh(index, timesleep=1)
+
+    async def collect_info(self):
+        """
+        Collect info about the connection and fill the info dictionary.
+        """
+        try:
+            info = {}
+            res = await self._send_request('GET', "/")
+            info['server'] = {}
+            info['server']['name'] = res['name']
+            info['server']['version'] = res['version']
+            info['allinfo'] = res
+            info['status'] = await self.indices.status()
+            info['aliases'] = await self.indices.aliases()
+            self.info = info
+            return True
+        except Exception:
+            self.info = {}
+            return False
+
+    @property
+    def mappings(self):
+        if self._mappings is None:
+            raise RuntimeError("The mappings are not loaded: await load_mappings() first")
+        return self._mappings
+
+    async def load_mappings(self):
+        """
+        Load the mappings of the default indices. With ``date_decoding="mapping"``
+        it must be awaited before the hits are turned into models.
+        """
+        result = await self.indices.get_mapping(indices=self.default_indices, raw=True)
+        self._mappings = Mapper(result, connection=self, document_object_field=self.document_object_field)
+        self._mappings.full_mappings = True
+        self._date_fields = {}
+        self._mapping_reloads = {}
+        return self._mappings
+
+    def _reload_mapping(self, index):
+        # the mappings are only loaded by load_mappings, that is awaited
+        return False
+
+    def invalidate_mappings(self, indices=None):
+        """
+        Drop the loaded mappings (and date fields) of indices, None for all
+        the indices: ``await load_mappings()`` loads them again.
+        """
+        mappings = self._mappings
+        super(AsyncES, self).invalidate_mappings(indices)
+        if mappings is not None and self._mappings is None:
+            mappings.indices.clear()
+            self._mappings = mappings
+
+    async def _send_request(self, method, path, body=None, params=None, headers=None, raw=False,
+                            return_response=False, read=False, cached=False, invalidate=None):
+        method, path, body, params = self._prepare_request(method, path, body, params, headers)
+        if read:
+            status, headers, data = await self._read(method, path, params, body, cached=cached)
+        else:
+            status, headers, data = await self.connection.perform_request(method, path, params=params, body=body)
+            if invalidate is not None:
+                self._invalidate_cache(invalidate)
+        return self._process_response(method, body, status, headers, data, raw=raw,
+                                      return_response=return_response)
+
+    def _create_single_flight(self):
+        return AsyncSingleFlight()
+
+    async def _read(self, method, path, params, body, cached=False):
+        scroll = _is_scroll(params)
+        cache = self.search_cache if cached and not scroll else None
+        single_flight = self.single_flight if not scroll else None
+        key = None
+        if cache is not None or single_flight is not None:
+            key = request_key(method, path, params, body, loads=self.json_backend.loads_plain)
+        if cache is not None:
+            response = cache.get(key)
+            if response is not None:
+                return response
+        if single_flight is not None:
+            response = await single_flight.do(key, lambda: self._perform_read(method, path, params, body))
+        else:
+            response = await self._perform_read(method, path, params, body)
+        if cache is not None and response[0] == 200:
+            cache.put(key, response, path_indices(path), len(response[2]))
+        return response
+
+    async def _perform_read(self, method, path, params, body):
+        if self.hedge_policy is not None:
+            return await self._perform_hedged(method, path, params, body)
+        return await self.connection.perform_request(method, path, params=params, body=body)
+
+    async def _perform_hedged(self, method, path, params, body):
+        """
+        Send a read to a server and, if it isn't answered within the delay of
+        the hedge policy, to a second server: the first response wins and
+        the other request is cancelled.
+        """
+        policy = self.hedge_policy
+        if len(self.connection._active_servers) < 2:
+            return await self.connection.perform_request(method, path, params=params, body=body)
+
+        policy.add_read()
+        primary = self.connection._get_server()
+        tasks = [asyncio.ensure_future(self._attempt(primary, method, path, params, body))]
+        try:
+            done, pending = await asyncio.wait(tasks, timeout=policy.get_delay(primary))
+            if not done and policy.acquire():
+                secondary = self.connection._get_server(exclude=primary)
+                tasks.append(asyncio.ensure_future(self._attempt(secondary, method, path, params, body)))
+            pending = set(tasks)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not tasks[0]:
+                            policy.add_win()
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _attempt(self, server, method, path, params, body):
+        started = time.time()
+        response = await self.connection.perform_request(method, path, params=params, body=body, server=server)
+        self.hedge_policy.record_latency(server, time.time() - started)
+        return response
+
+    async def get(self, index, doc_type, id, fields=None, model=None, **query_params):
+        """
+        Get a typed JSON document from an index based on its id.
+        """
+        path = make_path(index, doc_type, id)
+        if fields is not None:
+            query_params["fields"] = ",".join(fields)
+        model = model or self.model
+        return model(self, await self._send_request('GET', path, params=query_params, read=True))
+
+    async def mget(self, ids, index=None, doc_type=None, **query_params):
+        """
+        Get multi JSON documents.
+
+        ids can be:
+            list of tuple: (index, type, id)
+            list of ids: index and doc_type are required
+        """
+        if not ids:
+            return []
+
+        body = []
+        for value in ids:
+            if isinstance(value, tuple):
+                if len(value) == 3:
+                    a, b, c = value
+                    body.append({"_index": a,
+                                 "_type": b,
+                                 "_id": c})
+                elif len(value) == 4:
+                    a, b, c, d = value
+                    body.append({"_index": a,
+                                 "_type": b,
+                                 "_id": c,
+                                 "fields": d})
+
+            else:
+                if index is None:
+                    raise InvalidQuery("index value is required for id")
+                if doc_type is None:
+                    raise InvalidQuery("doc_type value is required for id")
+                body.append({"_index": index,
+                             "_type": doc_type,
+                             "_id": value})
+
+        results = await self._send_request('GET', "/_mget", body={'docs': body}, read=True,
+                                           params=query_params)
+        if 'docs' in results:
+            model = self.model
+            return [model(self, item) for item in results['docs']]
+        return []
+
+    async def get_file(self, index, doc_type, id=None):
+        """
+        Return the filename and memory data stream
+        """
+        data = await self.get(index, doc_type, id)
+        return data['_name'], base64.standard_b64decode(data['content'])
+
+    async def update(self, index, doc_type, id, model=None, bulk=False, **kwargs):
+        if bulk:
+            return await super(AsyncES, self).update(index, doc_type, id, bulk=True, **kwargs)
+        result = await super(AsyncES, self).update(index, doc_type, id, model=lambda conn, data: data,
+                                                   **kwargs)
+        model = model or self.model
+        return model(self, result)
+
+    async def update_by_function(self, extra_doc, index, doc_type, id, querystring_args=None,
+                                 update_func=None, attempts=2):
+        """
+        Like :meth:`pyes.es.ES.update_by_function`: update_func is a plain
+        function, the requests are awaited.
+        """
+        if querystring_args is None:
+            querystring_args = {}
+
+        if update_func is None:
+            update_func = dict.update
+
+        for attempt in range(attempts - 1, -1, -1):
+            current_doc = await self.get(index, doc_type, id, **querystring_args)
+            new_doc = update_func(current_doc, extra_doc)
+            if new_doc is None:
+                new_doc = current_doc
+            try:
+                return await self.index(new_doc, index, doc_type, id,
+                                        version=current_doc._meta.version, querystring_args=querystring_args)
+            except VersionConflictEngineException:
+                if attempt <= 0:
+                    raise
+                await self.indices.refresh(index)
+
+    async def update_by_function_batch(self, extra_docs, index, doc_type, querystring_args=None,
+                                       update_func=None, attempts=2, chunk_size=500):
+        """
+        Like :meth:`pyes.es.ES.update_by_function_batch`: update_func is a
+        plain function, the requests are awaited.
+        """
+        if querystring_args is None:
+            querystring_args = {}
+        if update_func is None:
+            update_func = dict.update
+        if isinstance(extra_docs, dict):
+            extra_docs = list(extra_docs.items())
+        else:
+            extra_docs = list(extra_docs)
+
+        items = []
+        took = 0
+        for start in range(0, len(extra_docs), chunk_size):
+            chunk = extra_docs[start:start + chunk_size]
+            chunk_items = [None] * len(chunk)
+            positions = list(range(len(chunk)))
+            for attempt in range(attempts):
+                bulk_result = await self._update_chunk(chunk, positions, chunk_items, index, doc_type,
+                                                       querystring_args, update_func)
+                if bulk_result is not None:
+                    took += bulk_result.get("took", 0)
+                positions = [position for position in positions
+                             if chunk_items[position]["index"].get("status") == 409]
+                if not positions:
+                    break
+            items.extend(chunk_items)
+        return DotDict(took=took, errors=not all(_is_bulk_item_ok(item) for item in items), items=items)
+
+    async def _update_chunk(self, chunk, positions, items, index, doc_type, querystring_args, update_func):
+        current_docs = await self.mget([chunk[position][0] for position in positions], index, doc_type,
+                                       **querystring_args)
+        lines, written = self._update_documents(chunk, positions, items, current_docs, index, doc_type,
+                                                querystring_args, update_func)
+        if not lines:
+            return None
+        bulk_result = await self._send_request("POST", "/_bulk", "\n".join(lines) + "\n")
+        self._invalidate_bulk(bulk_result)
+        for position, item in zip(written, bulk_result["items"]):
+            items[position] = item
+        return bulk_result
+
+    async def search_raw_multi(self, queries, indices_list=None, doc_types_list=None,
+                               routing_list=None, search_type_list=None):
+        body, result = super(AsyncES, self).search_raw_multi(queries, indices_list=indices_list,
+                                                             doc_types_list=doc_types_list,
+                                                             routing_list=routing_list,
+                                                             search_type_list=search_type_list)
+        return body, await result
+
+    async def suggest_from_object(self, suggest, indices=None, preference=None,
+                                  routing=None, raw=False, **kwargs):
+        indices = self._validate_indices(indices)
+
+        path = make_path(','.join(indices), "_suggest")
+        querystring_args = {}
+        if routing:
+            querystring_args["routing"] = routing
+        if preference:
+            querystring_args["preference"] = preference
+
+        result = await self._send_request('POST', path, suggest.serialize(), querystring_args)
+        if raw:
+            return result
+        return expand_suggest_text(result)
+
+    async def update_mapping_meta(self, doc_type, values, indices=None):
+        """
+        Update mapping meta: the mappings must be loaded by
+        ``await load_mappings()``
+        """
+        indices = self._validate_indices(indices)
+        for index in indices:
+            mapping = self.mappings.get_doctype(index, doc_type)
+            if mapping is None:
+                continue
+            meta = mapping.get_meta()
+            meta.update(values)
+            mapping = {doc_type: {"_meta": meta}}
+            await self.indices.put_mapping(doc_type=doc_type, mapping=mapping, indices=indices)
+
+    def search(self, query, indices=None, doc_types=None, model=None, scan=False, headers=None, **query_params):
+        """Execute a search against one or more indices to get an
+        :class:`AsyncResultSet`.
+        """
+        if isinstance(query, Search):
+            search = query
+        elif isinstance(query, (Query, dict)):
+            search = Search(query)
+        else:
+            raise InvalidQuery("search() must be supplied with a Search or Query object, or a dict")
+
+        if scan:
+            query_params.setdefault("search_type", "scan")
+            query_params.setdefault("scroll", "10m")
+
+        return AsyncResultSet(self, search, indices=indices, doc_types=doc_types,
+                              model=model, query_params=query_params, headers=headers)
+
+    def search_multi(self, queries, indices_list=None, doc_types_list=None,
+                     routing_list=None, search_type_list=None, models=None, scans=None):
+        searches = [query if isinstance(query, Search) else Search(query) for query in queries]
+
+        return AsyncResultSetMulti(self, searches, indices_list=indices_list,
+                                   doc_types_list=doc_types_list,
+                                   routing_list=routing_list, search_type_list=None, models=models)
+
+
+class AsyncResultSet(ResultSet):
+    """
+    A ResultSet to be consumed with ``async for``.
+
+    The first page is loaded by ``await resultset.fetch()`` or by starting the
+    iteration; after that ``total``, ``facets``, ``aggs`` and the other
+    attributes of the response are available. Indexing returns an awaitable:
+    ``await resultset[10]``, ``await resultset[0:20]``.
+    """
+
+    async def fetch(self):
+        """
+        Load the first page of results if it's not already available
+        """
+        if self._results is None:
+            await self._do_search()
+        return self
+
+    def _check_results(self):
+        if self._results is None:
+            raise RuntimeError("%s is not loaded: await fetch() or iterate it with async for"
+                               % self.__class__.__name__)
+
+    @property
+    def total(self):
+        self._check_results()
+        return super(AsyncResultSet, self).total
+
+    @property
+    def max_score(self):
+        self._check_results()
+        return super(AsyncResultSet, self).max_score
+
+    @property
+    def facets(self):
+        self._check_results()
+        return self._facets
+
+    @property
+    def aggs(self):
+        self._check_results()
+        return self._aggs
+
+    def __getattr__(self, name):
+        if name.startswith("__") or name == "_results":
+            raise AttributeError(name)
+        self._check_results()
+        return super(AsyncResultSet, self).__getattr__(name)
+
+    async def _do_search(self, auto_increment=False):
+        self.iterpos = 0
+        process_post_query = True  # used to skip results in first scan
+        if self.scroller_id is None:
+            if auto_increment:
+                self.start += self.chuck_size
+
+            self._results = await self._search_raw(self.start, self.chuck_size)
+
+            do_scan = self.query_params.pop("search_type", None) == "scan"
+            if do_scan:
+                self.scroller_parameters['search_type'] = "scan"
+                if 'scroll' in self.query_params:
+                    self.scroller_parameters['scroll'] = self.query_params.pop('scroll')
+                if 'size' in self.query_params:
+                    self.chuck_size = self.scroller_parameters['size'] = self.query_params.pop('size')
+
+            if '_scroll_id' in self._results:
+                # scan query, let's load the first bulk of data
+                self.scroller_id = self._results['_scroll_id']
+                await self._do_search()
+                process_post_query = False
+        else:
+            try:
+                self._results = await self.connection.search_scroll(self.scroller_id,
+                                                                    self.scroller_parameters.get("scroll", "10m"))
+                self.scroller_id = self._results['_scroll_id']
+            except ReduceSearchPhaseException:
+                # bad hack, should be not hits on the last iteration
+                self._results['hits']['hits'] = []
+
+        if process_post_query:
+            self._post_process_query()
+
+    async def __getitem__(self, val):
+        await self.fetch()
+        start, end = self._get_start_end(val)
+        model = self.model
+
+        items = self._get_loaded_items(val, start, end)
+        if items is not None:
+            return items
+
+        results = await self._search_raw(start + self._first_start, end - start)
+        hits = results['hits']['hits']
+        if not isinstance(val, slice):
+            if len(hits) == 1:
+                return model(self.connection, hits[0])
+            raise IndexError
+        return [model(self.connection, hit) for hit in hits]
+
+    def __iter__(self):
+        raise TypeError("%s must be iterated with async for" % self.__class__.__name__)
+
+    def __aiter__(self):
+        self.iterpos = 0
+        if self._current_item != 0:
+            # restart from the first page
+            self._results = None
+            self.start = self._first_start
+            self.scroller_id = None
+        self._current_item = 0
+        return self
+
+    async def __anext__(self):
+        if self._max_item is not None and self._current_item == self._max_item:
+            raise StopAsyncIteration
+        if self._results is None:
+            await self._do_search()
+        if "_scroll_id" in self._results and self._total != 0 and self._current_item == 0 and len(
+                self._results["hits"].get("hits", [])) == 0:
+            await self._do_search()
+        if len(self.hits) == 0:
+            raise StopAsyncIteration
+        if self.iterpos < len(self.hits):
+            res = self.hits[self.iterpos]
+            self.iterpos += 1
+            self._current_item += 1
+            return self.model(self.connection, res)
+
+        if self.start + self.iterpos == self.total:
+            raise StopAsyncIteration
+        await self._do_search(auto_increment=True)
+        self.iterpos = 0
+        if len(self.hits) == 0:
+            raise StopAsyncIteration
+        res = self.hits[self.iterpos]
+        self.iterpos += 1
+        self._current_item += 1
+        return self.model(self.connection, res)
+
+
+class AsyncResultSetMulti(ResultSetMulti):
+    """
+    A multi search resultset to be consumed with ``async for``; every item is
+    an already loaded :class:`AsyncResultSet`.
+    """
+
+    async def fetch(self):
+        """
+        Execute the multi search if it's not already done
+        """
+        if self._results_list is None:
+            await self._do_search()
+        return self
+
+    async def _do_search(self):
+        self.iterpos = 0
+
+        self.multi_search_query, response = await self.connection.search_raw_multi(
+            self.searches, indices_list=self.indices_list,
+            doc_types_list=self.doc_types_list, routing_list=self.routing_list,
+            search_type_list=self.search_type_list)
+
+        if 'responses' in response:
+            responses = response['responses']
+            self._results_list = [AsyncResultSet(self.connection, search,
+                                                 indices=indices, query_params={},
+                                                 doc_types=doc_types)
+                                  for search, indices, doc_types in
+                                  zip(self.searches, self.indices_list,
+                                      self.doc_types_list)]
+
+            for rs, rsp in zip(self._results_list, responses):
+                if 'error' in rsp:
+                    rs.error = rsp['error']
+                else:
+                    rs._results = rsp
+                    rs._post_process_query()
+
+            self.valid = True
+
+            self._max_item = len(self._results_list or [])
+        else:
+            self.error = response
+
+    def _check_results(self):
+        if self._results_list is None:
+            raise RuntimeError("%s is not loaded: await fetch() or iterate it with async for"
+                               % self.__class__.__name__)
+
+    def __len__(self):
+        self._check_results()
+        return len(self._results_list)
+
+    def __getitem__(self, val):
+        self._check_results()
+        return super(AsyncResultSetMulti, self).__getitem__(val)
+
+    def __iter__(self):
+        raise TypeError("%s must be iterated with async for" % self.__class__.__name__)
+
+    def __aiter__(self):
+        self.iterpos = 0
+        return self
+
+    async def __anext__(self):
+        await self.fetch()
+        if self._max_item and self.iterpos < self._max_item:
+            res = self._results_list[self.iterpos]
+            self.iterpos += 1
+            return res
+        raise StopAsyncIteration
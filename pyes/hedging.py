@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+Policy of the hedged reads.
+
+With hedging, a read (``get``, ``mget``, ``count``, ``search_raw``) that
+isn't answered within a delay is sent again to a second node and the first
+response wins. :class:`HedgePolicy` decides the delay, caps the extra load
+with a budget and counts how often the hedges fired and won.
+"""
+from __future__ import absolute_import
+
+import threading
+from collections import deque
+
+__all__ = ["HedgePolicy"]
+
+
+class HedgePolicy(object):
+    """
+    When and how often the reads are hedged.
+
+    :param delay: seconds to wait for the first node before the hedge. If
+        None, the ``percentile`` of the latencies observed on that node is
+        used, or ``default_delay`` until ``min_samples`` latencies are known.
+    :param budget: the ratio of extra requests allowed: every read earns
+        ``budget`` hedges, i.e. 0.05 allows up to one hedge every 20 reads.
+    :param burst: the max number of hedges that can be saved up by the
+        budget, so that a quiet period doesn't allow a storm of hedges.
+    :param percentile: the percentile of the node latency used as delay.
+    :param window: the number of latencies kept for every node.
+    """
+
+    def __init__(self, delay=None, budget=0.05, burst=5, percentile=95, window=200,
+                 min_samples=20, default_delay=0.1):
+        self.delay = delay
+        self.budget = budget
+        self.burst = burst
+        self.percentile = percentile
+        self.window = window
+        self.min_samples = min_samples
+        self.default_delay = default_delay
+        self._latencies = {}
+        self._tokens = 1.0
+        self._lock = threading.Lock()
+        self.reads = 0
+        self.hedged = 0
+        self.won = 0
+        self.over_budget = 0
+
+    def get_delay(self, node):
+        """
+        Return the seconds to wait for node before hedging a read
+        """
+        if self.delay is not None:
+            return self.delay
+        with self._lock:
+            latencies = self._latencies.get(node)
+            if latencies is None or len(latencies) < self.min_samples:
+                return self.default_delay
+            latencies = sorted(latencies)
+        return latencies[int(round((len(latencies) - 1) * self.percentile / 100.0))]
+
+    def record_latency(self, node, latency):
+        """
+        Record the latency of a read answered by node
+        """
+        with self._lock:
+            latencies = self._latencies.get(node)
+            if latencies is None:
+                latencies = self._latencies[node] = deque(maxlen=self.window)
+            latencies.append(latency)
+
+    def add_read(self):
+        """
+        Count a hedgeable read: it earns ``budget`` hedges
+        """
+        with self._lock:
+            self.reads += 1
+            self._tokens = min(self.burst, self._tokens + self.budget)
+
+    def can_hedge(self):
+        """
+        Return True if the budget allows a hedge, without spending it
+        """
+        with self._lock:
+            return self._tokens >= 1
+
+    def add_over_budget(self):
+        """
+        Count a hedge not fired because the budget was exhausted
+        """
+        with self._lock:
+            self.over_budget += 1
+
+    def acquire(self):
+        """
+        Return True if the budget allows a hedge, and count it
+        """
+        with self._lock:
+            if self._tokens < 1:
+                self.over_budget += 1
+                return False
+            self._tokens -= 1
+            self.hedged += 1
+            return True
+
+    def add_win(self):
+        """
+        Count a read won by the hedge
+        """
+        with self._lock:
+            self.won += 1
+
+    def get_stats(self):
+        """
+        Return the counters: ``reads``, ``hedged`` (hedges fired), ``won``
+        (hedges answered first) and ``over_budget`` (hedges not fired
+        because the budget was exhausted)
+        """
+        with self._lock:
+            return {"reads": self.reads, "hedged": self.hedged, "won": self.won,
+                    "over_budget": self.over_budget}
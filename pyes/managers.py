@@ -162,7 +162,9 @@ class Indices(object):
         :keyword settings: a settings object or a dict containing settings
 
         """
-        return self.conn._send_request('PUT', index, settings)
+        result = self.conn._send_request('PUT', index, settings)
+        self.conn.invalidate_mappings(index)
+        return result
 
     def create_index_if_missing(self, index, settings=None):
         """Creates an index if it doesn't already exist.
@@ -317,7 +319,7 @@ class Indices(object):
         """
         self.conn.force_bulk()
         path = self.conn._make_path(indices, (), '_refresh', allow_all_indices=False)
-        result = self.conn._send_request('POST', path)
+        result = self.conn._send_request('POST', path, invalidate=self.conn._validate_indices(indices))
         if timesleep:
             time.sleep(timesleep)
         self.conn.cluster.health(wait_for_status='yellow', timeout=timeout)
@@ -437,7 +439,9 @@ class Indices(object):
         if ignore_conflicts is not None:
             parameters['ignore_conflicts'] = ignore_conflicts
 
-        return self.conn._send_request('PUT', path, mapping, params=parameters)
+        result = self.conn._send_request('PUT', path, mapping, params=parameters)
+        self.conn.invalidate_mappings(indices)
+        return result
 
     def get_mapping(self, doc_type=None, indices=None, raw=False):
         """
@@ -369,10 +369,23 @@ class DateField(NumericFieldAbstract):
             return date.isoformat()
 
     def to_python(self, value):
-        if isinstance(value, six.string_types) and len(value) == 19:
-            return datetime.strptime(value, "%Y-%m-%dT%H:%M:%S")
-        elif isinstance(value, six.string_types) and len(value) == 10:
-            return date.strptime(value, "%Y-%m-%d")
+        """
+        Convert a date string (or a list of them) to datetime, or to date for
+        the %Y-%m-%d format. Values in other formats are returned as they are.
+        """
+        if isinstance(value, list):
+            return [self.to_python(v) for v in value]
+        if isinstance(value, six.string_types):
+            try:
+                if len(value) == 19:
+                    return datetime.strptime(value, "%Y-%m-%dT%H:%M:%S")
+                elif len(value) > 20:
+                    return datetime.strptime(value, "%Y-%m-%dT%H:%M:%S.%f")
+                elif len(value) == 10:
+                    return datetime.strptime(value, "%Y-%m-%d").date()
+            except ValueError:
+                pass
+        return value
 
 class BooleanField(AbstractField):
     def __init__(self, null_value=None, include_in_all=None, *args, **kwargs):
@@ -642,7 +655,7 @@ class ObjectField(object):
             if isinstance(field, DateField):
                 res[name] = field
             elif recursive and isinstance(field, ObjectField):
-                for n, f in field.get_datetime_properties(recursive=recursive):
+                for n, f in field.get_datetime_properties(recursive=recursive).items():
                     res[name + "." + n] = f
         return res
 
@@ -899,11 +912,20 @@ class Mapper(object):
                 o.index_name = indexname
                 idata.append((docname, o))
             idata.sort()
-            indices.append((indexname, idata))
+            indices.append((indexname, OrderedDict(idata)))
         indices.sort()
         self.indices = OrderedDict(indices)
 
 
+    def update_indices(self, data):
+        """
+        Replace the mappings of the indices of data, keeping the other indices
+        """
+        indices = self.indices
+        self._process(data)
+        indices.update(self.indices)
+        self.indices = OrderedDict(sorted(indices.items()))
+
     def get_doctypes(self, index, edges=True):
         """
         Returns a list of doctypes given an index
@@ -4,13 +4,18 @@ from __future__ import absolute_import
 from __future__ import with_statement
 
 import copy
+import os
+import random
 import threading
-try:
-    import simplejson as json
-except ImportError:
-    import json
+import time
+from bisect import bisect_right
+from collections import deque
 from types import GeneratorType
 
+import six
+from six.moves import queue
+
+from . import logger
 from .exceptions import BulkOperationException
 
 __author__ = 'alberto'
@@ -19,7 +24,11 @@ class DotDict(dict):
     def __getattr__(self, attr):
         if attr.startswith('__'):
             raise AttributeError
-        return self.get(attr, None)
+        value = self.get(attr, None)
+        if type(value) is dict:
+            # a plain dict of a response decoded with response_mode="dict"
+            value = self[attr] = DotDict(value)
+        return value
 
     __setattr__ = dict.__setitem__
 
@@ -29,18 +38,45 @@ class DotDict(dict):
         return DotDict([(copy.deepcopy(k, memo), copy.deepcopy(v, memo)) for k, v in self.items()])
 
 
+def decode_dates(document, date_fields):
+    """
+    Convert in place the date values of a document.
+
+    :param date_fields: a list of (path tokens, DateField) as returned by
+        ES.get_date_fields
+    """
+    for tokens, field in date_fields:
+        _decode_date(document, tokens, field)
+    return document
+
+
+def _decode_date(value, tokens, field):
+    if isinstance(value, list):
+        # a list of objects or nested documents
+        for item in value:
+            _decode_date(item, tokens, field)
+    elif isinstance(value, dict) and tokens[0] in value:
+        if len(tokens) == 1:
+            value[tokens[0]] = field.to_python(value[tokens[0]])
+        else:
+            _decode_date(value[tokens[0]], tokens[1:], field)
+
+
 class ElasticSearchModel(DotDict):
     def __init__(self, *args, **kwargs):
         from pyes import ES
         self._meta = DotDict()
         self.__initialised = True
         if len(args) == 2 and isinstance(args[0], ES):
-            item = args[1]
+            item = args[0].decode_objects(args[1])
             self.update(item.pop("_source", DotDict()))
             self.update(item.pop("fields", {}))
             self._meta = DotDict([(k.lstrip("_"), v) for k, v in item.items()])
             self._meta.parent = self.pop("_parent", None)
             self._meta.connection = args[0]
+            date_fields = args[0].get_date_fields(self._meta.index, self._meta.type)
+            if date_fields:
+                decode_dates(self, date_fields)
         else:
             self.update(dict(*args, **kwargs))
 
@@ -116,9 +152,10 @@ class ElasticSearchModel(DotDict):
             cmd[op_type]['_version'] = meta.version
         if meta.id:
             cmd[op_type]['_id'] = meta.id
-        result.append(json.dumps(cmd, cls=self._meta.connection.encoder))
+        json_backend = self._meta.connection.json_backend
+        result.append(json_backend.dumps(cmd))
         result.append("\n")
-        result.append(json.dumps(self, cls=self._meta.connection.encoder))
+        result.append(json_backend.dumps(self))
         result.append("\n")
         return ''.join(result)
 
@@ -133,15 +170,27 @@ class BaseBulker(object):
     """
     Base class to implement a bulker strategy
 
+    A batch is sent when it reaches ``bulk_size`` actions or ``max_bytes``
+    bytes, whichever comes first.
+
+    The items rejected by a busy cluster (status 429 or 503) are sent again,
+    up to ``max_item_retries`` times, after a random wait growing
+    exponentially from ``retry_backoff`` up to ``max_retry_backoff`` seconds.
     """
 
-    def __init__(self, conn, bulk_size=400, raise_on_bulk_item_failure=False):
+    def __init__(self, conn, bulk_size=400, raise_on_bulk_item_failure=False, max_bytes=None,
+                 max_item_retries=3, retry_backoff=0.5, max_retry_backoff=30.0):
         self.conn = conn
         self._bulk_size = bulk_size
+        self.max_bytes = max_bytes
+        self.max_item_retries = max_item_retries
+        self.retry_backoff = retry_backoff
+        self.max_retry_backoff = max_retry_backoff
         # protects bulk_data
         self.bulk_lock = threading.RLock()
         with self.bulk_lock:
             self.bulk_data = []
+            self.bulk_bytes = 0
         self.raise_on_bulk_item_failure = raise_on_bulk_item_failure
 
     def __bool__(self):
@@ -166,50 +215,916 @@ class BaseBulker(object):
 
     bulk_size = property(get_bulk_size, set_bulk_size)
 
-    def add(self, content):
+    def is_full(self):
+        """
+        Return True if the pending actions reached bulk_size or max_bytes
+        """
+        return len(self.bulk_data) >= self.bulk_size or \
+            (self.max_bytes is not None and self.bulk_bytes >= self.max_bytes)
+
+    def add(self, content, callback=None):
+        """
+        Queue an action.
+
+        :param callback: called with ``(ok, item)`` when the batch of the
+            action is sent: ``item`` is the item of the action in the bulk
+            response, or the exception raised by the request. It can be a
+            future (an object with ``set_result``): it's resolved with the
+            item, or with the exception.
+        """
         raise NotImplementedError
 
+    def add_action(self, op_type, meta, document=None, callback=None):
+        """
+        Queue the action op_type ("index", "create", "update" or "delete").
+
+        :param meta: the metadata of the action header (``_index``, ``_type``,
+            ``_id``, ...).
+        :param document: the source of the action: a dict, or a serialized JSON
+            string. None for a delete.
+        :param callback: see :meth:`add`.
+        """
+        content = self._format_action(op_type, meta, document)
+        if callback is None:
+            # the bulkers written before the callbacks implement add(content)
+            self.add(content)
+        else:
+            self.add(content, callback=callback)
+
+    def _format_action(self, op_type, meta, document=None):
+        """
+        Return the lines of an action as a string, without the last newline
+        """
+        json_backend = self.conn.json_backend
+        command = json_backend.dumps({op_type: meta})
+        if document is not None:
+            if isinstance(document, dict):
+                document = json_backend.dumps(document)
+            elif isinstance(document, six.binary_type):
+                document = document.decode("utf-8")
+            command = "%s\n%s" % (command, document)
+        return command
+
     def flush_bulk(self, forced=False):
         raise NotImplementedError
 
+    def _resolve_callbacks(self, batch, bulk_result=None, error=None):
+        """
+        Call the callbacks of the actions of batch with their items of
+        bulk_result, or with the error of the request
+        """
+        callbacks = getattr(batch, "callbacks", None)
+        if not callbacks:
+            return
+        items = bulk_result.get("items", []) if bulk_result is not None else []
+        for position, callback in enumerate(callbacks):
+            if callback is None:
+                continue
+            item = items[position] if position < len(items) else None
+            # the actions merged by a CoalescingBulker share a position
+            for callback in (callback if isinstance(callback, list) else [callback]):
+                try:
+                    if hasattr(callback, "set_result"):
+                        if error is not None or item is None:
+                            callback.set_exception(error or BulkOperationException([], bulk_result))
+                        else:
+                            callback.set_result(item)
+                    elif error is not None or item is None:
+                        callback(False, error)
+                    else:
+                        callback(_is_bulk_item_ok(item), item)
+                except Exception:
+                    logger.exception("Error in the callback of a bulk action")
+
+    def get_retry_delay(self, attempt):
+        """
+        Return the seconds to wait before the retry number attempt (from 0):
+        full jitter exponential backoff
+        """
+        return random.uniform(0, min(self.max_retry_backoff, self.retry_backoff * 2 ** attempt))
+
+    def _get_retry_positions(self, items, positions=None):
+        """
+        Return the positions of the items rejected with a retryable status.
+
+        :param positions: the positions in the batch of the items.
+        """
+        if positions is None:
+            positions = range(len(items))
+        return [position for position, item in zip(positions, items) if _is_bulk_item_retryable(item)]
+
+    def _update_items(self, bulk_result, positions, retry_result):
+        """
+        Replace the items at positions of bulk_result with the items of the
+        retry and return the positions still to retry
+        """
+        items = retry_result["items"]
+        for position, item in zip(positions, items):
+            bulk_result["items"][position] = item
+        bulk_result["errors"] = not all(_is_bulk_item_ok(item) for item in bulk_result["items"])
+        return self._get_retry_positions(items, positions)
+
+
+class Batch(list):
+    """
+    The actions of a bulk request, with their callbacks (None if no action
+    has a callback), their size in bytes and if the batch was full (it
+    reached bulk_size or max_bytes) or was sent before
+    """
+    callbacks = None
+    bytes = None
+    full = False
+
+
+def _action_size(content):
+    """
+    Return the size in bytes of an action in the bulk body, with its newline
+    """
+    if isinstance(content, six.text_type):
+        content = content.encode("utf-8")
+    return len(content) + 1
+
 
 class ListBulker(BaseBulker):
     """
     A bulker that store data in a list
     """
 
-    def __init__(self, conn, bulk_size=400, raise_on_bulk_item_failure=False):
+    def __init__(self, conn, bulk_size=400, raise_on_bulk_item_failure=False, **kwargs):
         super(ListBulker, self).__init__(conn=conn, bulk_size=bulk_size,
-                                         raise_on_bulk_item_failure=raise_on_bulk_item_failure)
+                                         raise_on_bulk_item_failure=raise_on_bulk_item_failure, **kwargs)
         with self.bulk_lock:
             self.bulk_data = []
+            self._sizes = []
+            self._callbacks = []
 
     def __nonzero__(self):
         # This is needed for __del__ in ES to correctly detect if there is
         # unsaved bulk data left over.
         return not not self.bulk_data
 
-    def add(self, content):
+    def add(self, content, callback=None):
+        size = _action_size(content)
         with self.bulk_lock:
             self.bulk_data.append(content)
+            self._sizes.append(size)
+            self._callbacks.append(callback)
+            self.bulk_bytes += size
+
+    def _take_batch(self, forced=False):
+        """
+        Remove from the pending actions and return the next batch to send:
+        at most bulk_size actions and max_bytes bytes (but at least an
+        action). Return None if there is no batch to send.
+        """
+        with self.bulk_lock:
+            if not self.bulk_data or not (forced or self.is_full()):
+                return None
+            count = min(len(self.bulk_data), max(self.bulk_size, 1))
+            full = count >= self.bulk_size
+            size = 0
+            for position in range(count):
+                if self.max_bytes is not None and position > 0 and size + self._sizes[position] > self.max_bytes:
+                    count = position
+                    full = True
+                    break
+                size += self._sizes[position]
+            batch = Batch(self.bulk_data[:count])
+            batch.bytes = size
+            batch.full = full or (self.max_bytes is not None and size >= self.max_bytes)
+            callbacks = self._callbacks[:count]
+            if any(callback is not None for callback in callbacks):
+                batch.callbacks = callbacks
+            self.bulk_bytes -= size
+            self.bulk_data = self.bulk_data[count:]
+            self._sizes = self._sizes[count:]
+            self._callbacks = self._callbacks[count:]
+            return batch
+
+    def _post_batch(self, batch):
+        bulk_result = self.conn._send_request("POST",
+                                              "/_bulk",
+                                              "\n".join(batch) + "\n")
+        self.conn._invalidate_bulk(bulk_result)
+        return bulk_result
+
+    def _send_batch(self, batch):
+        try:
+            bulk_result = self._post_batch(batch)
+            positions = self._get_retry_positions(bulk_result.get("items", []))
+            for attempt in range(self.max_item_retries):
+                if not positions:
+                    break
+                time.sleep(self.get_retry_delay(attempt))
+                retry_result = self._post_batch([batch[position] for position in positions])
+                positions = self._update_items(bulk_result, positions, retry_result)
+        except Exception as e:
+            self._resolve_callbacks(batch, error=e)
+            raise
+        self._resolve_callbacks(batch, bulk_result)
+
+        if self.raise_on_bulk_item_failure:
+            _raise_exception_if_bulk_item_failed(bulk_result)
+
+        return bulk_result
 
     def flush_bulk(self, forced=False):
+        results = []
+        batch = self._take_batch(forced)
+        while batch:
+            results.append(self._send_batch(batch))
+            batch = self._take_batch(forced)
+        return _merge_bulk_results(results)
+
+
+class BytesBatch(object):
+    """
+    The actions of a :class:`BytesBulker` bulk: the body and the end offset
+    of every action in it
+    """
+
+    def __init__(self, body, ends, callbacks=None):
+        self.body = body
+        self.ends = ends
+        self.callbacks = callbacks
+
+    def __len__(self):
+        return len(self.ends)
+
+    def __getitem__(self, position):
+        start = self.ends[position - 1] if position > 0 else 0
+        return bytes(self.body[start:self.ends[position]])
+
+
+class BytesBulker(ListBulker):
+    """
+    A bulker that encodes the actions straight into a bytearray.
+
+    The headers are built from a template cached for every (operation, index,
+    type) and the documents are encoded once, with the JSON backend of the
+    connection: the buffer is sent as the body of the bulk, without joins
+    or encodings, and reused for the next bulk. ``bulk_data`` is the buffer.
+    """
+
+    # max number of cached header templates
+    max_templates = 1000
+
+    def __init__(self, conn, bulk_size=400, raise_on_bulk_item_failure=False, **kwargs):
+        super(BytesBulker, self).__init__(conn=conn, bulk_size=bulk_size,
+                                          raise_on_bulk_item_failure=raise_on_bulk_item_failure, **kwargs)
         with self.bulk_lock:
-            if forced or len(self.bulk_data) >= self.bulk_size:
-                batch = self.bulk_data
-                self.bulk_data = []
+            self.bulk_data = bytearray()
+            self._ends = []
+            self._callbacks = []
+            self._spare = None
+        self._templates = {}
+
+    def __nonzero__(self):
+        return len(self._ends) > 0
+
+    def is_full(self):
+        return len(self._ends) >= self.bulk_size or \
+            (self.max_bytes is not None and len(self.bulk_data) >= self.max_bytes)
+
+    def _end_action(self, callback):
+        self._ends.append(len(self.bulk_data))
+        self._callbacks.append(callback)
+        self.bulk_bytes = len(self.bulk_data)
+
+    def add(self, content, callback=None):
+        if isinstance(content, six.text_type):
+            content = content.encode("utf-8")
+        with self.bulk_lock:
+            self.bulk_data += content
+            if not content.endswith(b"\n"):
+                self.bulk_data += b"\n"
+            self._end_action(callback)
+
+    def _get_template(self, op_type, index, doc_type):
+        """
+        Return the start of the header of the actions op_type on index and
+        doc_type, without the closing braces, and if it has metadata
+        """
+        key = (op_type, index, doc_type)
+        template = self._templates.get(key)
+        if template is None:
+            meta = {}
+            if index is not None:
+                meta["_index"] = index
+            if doc_type is not None:
+                meta["_type"] = doc_type
+            header = self.conn.json_backend.dumps_bytes({op_type: meta}).rstrip()
+            template = (header[:-2].rstrip(), bool(meta))
+            if len(self._templates) >= self.max_templates:
+                self._templates.clear()
+            self._templates[key] = template
+        return template
+
+    def add_action(self, op_type, meta, document=None, callback=None):
+        dumps_bytes = self.conn.json_backend.dumps_bytes
+        template, separator = self._get_template(op_type, meta.get("_index"), meta.get("_type"))
+        header = [template]
+        for key, value in meta.items():
+            if key == "_index" or key == "_type":
+                continue
+            if separator:
+                header.append(b",")
+            header.append(dumps_bytes(key) + b":" + dumps_bytes(value))
+            separator = True
+        header.append(b"}}\n")
+        if isinstance(document, dict):
+            document = dumps_bytes(document)
+        elif isinstance(document, six.text_type):
+            document = document.encode("utf-8")
+        with self.bulk_lock:
+            buffer = self.bulk_data
+            for part in header:
+                buffer += part
+            if document is not None:
+                buffer += document
+                buffer += b"\n"
+            self._end_action(callback)
+
+    def _take_batch(self, forced=False):
+        with self.bulk_lock:
+            if not self._ends or not (forced or self.is_full()):
+                return None
+            count = min(len(self._ends), max(self.bulk_size, 1))
+            if self.max_bytes is not None:
+                count = max(1, min(count, bisect_right(self._ends, self.max_bytes)))
+            callbacks = self._callbacks[:count]
+            if not any(callback is not None for callback in callbacks):
+                callbacks = None
+            if count == len(self._ends):
+                batch = BytesBatch(self.bulk_data, self._ends, callbacks)
+                self.bulk_data = self._spare if self._spare is not None else bytearray()
+                self._spare = None
+                self._ends = []
+                self._callbacks = []
             else:
+                end = self._ends[count - 1]
+                batch = BytesBatch(bytes(self.bulk_data[:end]), self._ends[:count], callbacks)
+                del self.bulk_data[:end]
+                self._ends = [offset - end for offset in self._ends[count:]]
+                self._callbacks = self._callbacks[count:]
+            self.bulk_bytes = len(self.bulk_data)
+            return batch
+
+    def _post_batch(self, batch):
+        if isinstance(batch, BytesBatch):
+            body = batch.body
+        else:
+            # the actions to retry
+            body = b"".join(batch)
+        bulk_result = self.conn._send_request("POST", "/_bulk", body)
+        self.conn._invalidate_bulk(bulk_result)
+        return bulk_result
+
+    def _send_batch(self, batch):
+        try:
+            return super(BytesBulker, self)._send_batch(batch)
+        finally:
+            body = batch.body
+            if isinstance(body, bytearray):
+                try:
+                    body.clear()
+                except BufferError:
+                    # still referenced by the request
+                    body = None
+                if body is not None:
+                    with self.bulk_lock:
+                        self._spare = body
+
+
+class ThreadedBulker(ListBulker):
+    """
+    A bulker that sends the batches from background threads.
+
+    The full batches are handed to ``workers`` sender threads through a
+    queue of ``queue_size`` batches: the producers block only when the queue
+    is full. ``flush_bulk(True)`` (``force_bulk``) queues the pending actions,
+    waits until all the batches are sent and returns the merged response of
+    the batches it queued, like the other bulkers; ``flush_bulk()`` returns
+    None, its batches are still in flight. The errors of the background
+    sends are raised by the next ``flush_bulk``.
+
+    With more than a worker the batches can be applied out of order. To
+    choose the threads and the queue size::
+
+        ES(bulker_class=functools.partial(ThreadedBulker, workers=2, queue_size=4))
+    """
+
+    def __init__(self, conn, bulk_size=400, raise_on_bulk_item_failure=False, workers=1, queue_size=2,
+                 **kwargs):
+        super(ThreadedBulker, self).__init__(conn=conn, bulk_size=bulk_size,
+                                             raise_on_bulk_item_failure=raise_on_bulk_item_failure, **kwargs)
+        self.workers = workers
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._threads = []
+        self._errors = []
+
+    def __nonzero__(self):
+        return not not self.bulk_data or self._queue.unfinished_tasks > 0
+
+    def _start_workers(self):
+        with self.bulk_lock:
+            if self._threads:
+                return
+            for _ in range(self.workers):
+                thread = threading.Thread(target=self._work)
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+
+    def _work(self):
+        while True:
+            task = self._queue.get()
+            try:
+                if task is None:
+                    return
+                batch, results, position = task
+                bulk_result = self._send_batch(batch)
+                if results is not None:
+                    results[position] = bulk_result
+            except Exception as e:
+                with self.bulk_lock:
+                    self._errors.append(e)
+            finally:
+                self._queue.task_done()
+
+    def _raise_errors(self):
+        with self.bulk_lock:
+            errors = self._errors
+            self._errors = []
+        if errors:
+            raise errors[0]
+
+    def flush_bulk(self, forced=False):
+        self._raise_errors()
+        # the responses of the batches of a forced flush, in their order
+        results = [] if forced else None
+        batch = self._take_batch(forced)
+        while batch:
+            self._start_workers()
+            if results is not None:
+                results.append(None)
+                self._queue.put((batch, results, len(results) - 1))
+            else:
+                self._queue.put((batch, None, None))
+            batch = self._take_batch(forced)
+        if forced:
+            self._queue.join()
+            self._raise_errors()
+            return _merge_bulk_results([result for result in results if result is not None])
+        return None
+
+    def close(self):
+        """
+        Send the pending actions and stop the sender threads
+        """
+        try:
+            self.flush_bulk(True)
+        finally:
+            with self.bulk_lock:
+                threads = self._threads
+                self._threads = []
+            for _ in threads:
+                self._queue.put(None)
+            for thread in threads:
+                thread.join()
+
+
+class AdaptiveBulker(ListBulker):
+    """
+    A bulker that adapts the size in bytes of the batches to the cluster.
+
+    The latency and the rate of rejected items (status 429 or 503) of every
+    ``_bulk`` request drive an AIMD controller: the size grows by
+    ``increase_bytes`` while the full batches are sent faster than
+    ``target_latency`` seconds and without rejections, and it is multiplied
+    by ``decrease_factor`` otherwise, within ``min_batch_bytes`` and
+    ``max_batch_bytes``. The current size is ``max_bytes``; the last
+    ``history_size`` requests are returned by :meth:`get_history`.
+
+    ``bulk_size`` still caps the number of actions of a batch: use a high
+    value so that the batches are sized by bytes::
+
+        ES(bulk_size=100000, bulker_class=AdaptiveBulker)
+    """
+
+    def __init__(self, conn, bulk_size=400, raise_on_bulk_item_failure=False, target_latency=1.0,
+                 min_batch_bytes=256 * 1024, max_batch_bytes=32 * 1024 * 1024, increase_bytes=512 * 1024,
+                 decrease_factor=0.5, max_rejection_rate=0.0, history_size=100, **kwargs):
+        if not min_batch_bytes <= max_batch_bytes:
+            raise ValueError("min_batch_bytes must not be greater than max_batch_bytes")
+        if not 0 < decrease_factor < 1:
+            raise ValueError("decrease_factor must be in (0, 1)")
+        kwargs["max_bytes"] = min(max(kwargs.get("max_bytes") or min_batch_bytes, min_batch_bytes),
+                                  max_batch_bytes)
+        super(AdaptiveBulker, self).__init__(conn=conn, bulk_size=bulk_size,
+                                             raise_on_bulk_item_failure=raise_on_bulk_item_failure, **kwargs)
+        self.target_latency = target_latency
+        self.min_batch_bytes = min_batch_bytes
+        self.max_batch_bytes = max_batch_bytes
+        self.increase_bytes = increase_bytes
+        self.decrease_factor = decrease_factor
+        self.max_rejection_rate = max_rejection_rate
+        self._history = deque(maxlen=history_size)
+
+    def _post_batch(self, batch):
+        started = time.time()
+        bulk_result = super(AdaptiveBulker, self)._post_batch(batch)
+        latency = time.time() - started
+        items = bulk_result.get("items", [])
+        rejected = len([item for item in items if _is_bulk_item_retryable(item)])
+        size = getattr(batch, "bytes", None)
+        if size is None:
+            # the rejected items sent again
+            size = sum(_action_size(action) for action in batch)
+        self.update_size(latency, float(rejected) / len(items) if items else 0.0,
+                         actions=len(batch), size=size, full=getattr(batch, "full", False))
+        return bulk_result
+
+    def update_size(self, latency, rejection_rate, actions=0, size=0, full=True):
+        """
+        Update the batch size with the latency and the rejection rate of a
+        ``_bulk`` request and return the new size. The size only grows after
+        a full batch: a batch sent before reaching it says nothing of the
+        capacity of the cluster.
+        """
+        with self.bulk_lock:
+            if latency > self.target_latency or rejection_rate > self.max_rejection_rate:
+                max_bytes = int(self.max_bytes * self.decrease_factor)
+            elif full:
+                max_bytes = self.max_bytes + self.increase_bytes
+            else:
+                max_bytes = self.max_bytes
+            self.max_bytes = min(max(max_bytes, self.min_batch_bytes), self.max_batch_bytes)
+            self._history.append({"time": time.time(), "latency": latency, "rejection_rate": rejection_rate,
+                                  "actions": actions, "bytes": size, "max_bytes": self.max_bytes})
+            return self.max_bytes
+
+    def get_history(self):
+        """
+        Return the last requests, oldest first, as dicts with ``time``,
+        ``latency``, ``rejection_rate``, ``actions``, ``bytes`` (the size of
+        the request) and ``max_bytes`` (the batch size after the request)
+        """
+        with self.bulk_lock:
+            return list(self._history)
+
+
+class CoalescingBulker(ListBulker):
+    """
+    A bulker that coalesces the pending actions on the same document, keyed
+    by ``_index``, ``_type``, ``_id`` and routing (or parent): an ``index``
+    or a ``delete`` replaces the pending action, and consecutive partial
+    updates (``{"doc": ...}``) are merged in a single update. The batches
+    shrink and the cluster indexes every document once.
+
+    Only the actions of :meth:`add_action` are coalesced: ``create``, the
+    versioned actions and the raw actions of :meth:`add` are sent as they
+    are (a ``create`` or a versioned action ends the coalescing of its
+    document, a raw action the coalescing of every pending action). The
+    callbacks of a dropped action get the item of the action
+    that replaced it. :meth:`get_stats` returns the number of actions added
+    and dropped.
+    """
+
+    def __init__(self, conn, bulk_size=400, raise_on_bulk_item_failure=False, **kwargs):
+        super(CoalescingBulker, self).__init__(conn=conn, bulk_size=bulk_size,
+                                               raise_on_bulk_item_failure=raise_on_bulk_item_failure, **kwargs)
+        with self.bulk_lock:
+            # the (op_type, meta, document) of the pending actions
+            self._actions = []
+            # the position of the pending action of every document
+            self._positions = {}
+            self._added = 0
+            self._dropped = 0
+
+    def add(self, content, callback=None):
+        with self.bulk_lock:
+            self._append(content, callback)
+            # the document of a raw action is unknown: it ends the coalescing
+            # of the pending actions, else a later action could replace one
+            # that is sent before the raw action
+            self._positions.clear()
+
+    def _append(self, content, callback):
+        super(CoalescingBulker, self).add(content, callback=callback)
+        self._actions.append(None)
+        self._added += 1
+
+    def add_action(self, op_type, meta, document=None, callback=None):
+        key = _document_key(meta)
+        with self.bulk_lock:
+            if key is not None and (op_type not in ("index", "update", "delete") or
+                                    "_version" in meta or "version" in meta):
+                self._positions.pop(key, None)
+                key = None
+            position = self._positions.get(key) if key is not None else None
+            if position is not None:
+                previous_op, previous_meta, previous_document = self._actions[position]
+                if op_type in ("index", "delete"):
+                    self._replace(position, op_type, meta, document, callback)
+                    return
+                if previous_op == "update" and meta == previous_meta:
+                    merged = _merge_updates(previous_document, document)
+                    if merged is not None:
+                        self._replace(position, op_type, meta, merged, callback)
+                        return
+            self._append(self._format_action(op_type, meta, document), callback)
+            if key is not None:
+                self._actions[-1] = (op_type, meta, document)
+                self._positions[key] = len(self._actions) - 1
+
+    def _replace(self, position, op_type, meta, document, callback):
+        command = self._format_action(op_type, meta, document)
+        size = _action_size(command)
+        self.bulk_data[position] = command
+        self.bulk_bytes += size - self._sizes[position]
+        self._sizes[position] = size
+        self._actions[position] = (op_type, meta, document)
+        previous = self._callbacks[position]
+        if callback is not None:
+            if previous is None:
+                self._callbacks[position] = callback
+            else:
+                self._callbacks[position] = (previous if isinstance(previous, list) else [previous]) + [callback]
+        self._added += 1
+        self._dropped += 1
+
+    def _take_batch(self, forced=False):
+        with self.bulk_lock:
+            batch = super(CoalescingBulker, self)._take_batch(forced)
+            if batch:
+                count = len(batch)
+                self._actions = self._actions[count:]
+                self._positions = dict((key, position - count) for key, position in self._positions.items()
+                                       if position >= count)
+            return batch
+
+    def get_stats(self):
+        """
+        Return the number of actions added and of the actions dropped by
+        the coalescing
+        """
+        with self.bulk_lock:
+            return {"actions": self._added, "dropped": self._dropped}
+
+
+def _document_key(meta):
+    """
+    Return the key of the document of an action, or None without ``_id``
+    """
+    if meta.get("_id") is None:
+        return None
+    routing = meta.get("_routing", meta.get("routing", meta.get("_parent", meta.get("parent"))))
+    return meta.get("_index"), meta.get("_type"), meta["_id"], routing
+
+
+def _merge_updates(previous, update):
+    """
+    Return a partial update with the docs of the partial updates previous
+    and update, or None if they can't be merged
+    """
+    for body in (previous, update):
+        if not isinstance(body, dict) or not isinstance(body.get("doc"), dict) or \
+                not set(body).issubset(("doc", "doc_as_upsert")):
+            return None
+    if previous.get("doc_as_upsert") != update.get("doc_as_upsert"):
+        return None
+    merged = dict(previous)
+    merged["doc"] = _merge_documents(previous["doc"], update["doc"])
+    return merged
+
+
+def _merge_documents(document, update):
+    # the objects are merged recursively, like Elasticsearch does
+    merged = dict(document)
+    for name, value in update.items():
+        if isinstance(value, dict) and isinstance(merged.get(name), dict):
+            value = _merge_documents(merged[name], value)
+        merged[name] = value
+    return merged
+
+
+class _Segment(object):
+    """
+    A sealed segment of the log of a :class:`SpillBulker`: its path, and its
+    actions and callbacks if they are kept in memory
+    """
+
+    def __init__(self, path, actions=None, callbacks=None, size=0):
+        self.path = path
+        self.actions = actions
+        self.callbacks = callbacks
+        self.size = size
+
+
+class SpillBulker(ListBulker):
+    """
+    A bulker that writes the pending actions to a write-ahead log on disk,
+    so that they survive a crash or a restart and the memory stays bounded
+    while the cluster is slow or down.
+
+    Every action is appended to the open segment of the log, a file of
+    ``directory``. The segment is sealed when it reaches ``bulk_size``
+    actions or ``max_bytes`` bytes, and it's deleted once its ``_bulk``
+    request succeeds (even with failed items): a failed request leaves it on
+    disk to be sent by the next flush, after a backoff. Only ``force_bulk``
+    raises the error of a failed request, the other flushes log it, and the
+    callbacks of the actions wait for the request that succeeds. The sealed
+    segments are kept in memory up to ``max_memory_bytes`` bytes, and read
+    back from disk past it. The segments found in ``directory`` at startup were not
+    acknowledged: they are sent, oldest first, before the new actions.
+
+    With ``fsync`` every action is synced to the disk, to survive the crash
+    of the machine and not only of the process::
+
+        ES(bulker_class=functools.partial(SpillBulker, directory="/var/lib/indexer/bulk"))
+    """
+
+    suffix = ".bulk"
+
+    def __init__(self, conn, bulk_size=400, raise_on_bulk_item_failure=False, directory=None,
+                 max_memory_bytes=64 * 1024 * 1024, fsync=False, **kwargs):
+        if directory is None:
+            raise ValueError("SpillBulker needs a directory")
+        super(SpillBulker, self).__init__(conn=conn, bulk_size=bulk_size,
+                                          raise_on_bulk_item_failure=raise_on_bulk_item_failure, **kwargs)
+        self.directory = directory
+        self.max_memory_bytes = max_memory_bytes
+        self.fsync = fsync
+        # serializes the sends, a segment is sent once
+        self._send_lock = threading.Lock()
+        self._failures = 0
+        self._retry_at = 0
+        self._file = None
+        self._memory_bytes = 0
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self._segments = deque()
+        self._sequence = 0
+        for name in sorted(os.listdir(directory)):
+            if name.endswith(self.suffix):
+                self._sequence = int(name[:-len(self.suffix)]) + 1
+                self._replay(os.path.join(directory, name))
+
+    def __nonzero__(self):
+        return not not self.bulk_data or not not self._segments
+
+    def _replay(self, path):
+        size = os.path.getsize(path)
+        with open(path, "rb+") as segment:
+            data = segment.read()
+            # an action torn by a crash is dropped
+            end = data.rfind(b"\n") + 1
+            if end < size:
+                logger.warning("Dropping %d bytes of a torn action at the end of %s", size - end, path)
+                segment.truncate(end)
+        if end == 0:
+            os.remove(path)
+            return
+        self._segments.append(_Segment(path, size=end))
+
+    def _read_segment(self, segment):
+        from .bulk import file_actions
+
+        with open(segment.path, "rb") as data:
+            return [action[:-1].decode("utf-8")
+                    for action in file_actions(data, self.conn.json_backend.loads_plain)]
+
+    def add(self, content, callback=None):
+        line = content.encode("utf-8") if isinstance(content, six.text_type) else content
+        with self.bulk_lock:
+            if self._file is None:
+                path = os.path.join(self.directory, "%020d%s" % (self._sequence, self.suffix))
+                self._sequence += 1
+                self._file = open(path, "ab")
+            self._file.write(line + b"\n")
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            super(SpillBulker, self).add(content, callback=callback)
+            if self.is_full():
+                self._seal()
+
+    def _seal(self):
+        """
+        Close the open segment and queue it to be sent
+        """
+        with self.bulk_lock:
+            if self._file is None:
+                return
+            self._file.close()
+            segment = _Segment(self._file.name, size=self.bulk_bytes)
+            if self._memory_bytes + self.bulk_bytes <= self.max_memory_bytes:
+                segment.actions = self.bulk_data
+                self._memory_bytes += self.bulk_bytes
+            if any(callback is not None for callback in self._callbacks):
+                segment.callbacks = self._callbacks
+            self._segments.append(segment)
+            self._file = None
+            self.bulk_data = []
+            self._sizes = []
+            self._callbacks = []
+            self.bulk_bytes = 0
+
+    def _take_batch(self, forced=False):
+        """
+        Return the oldest sealed segment as a batch, without removing it
+        """
+        with self.bulk_lock:
+            if forced:
+                self._seal()
+            elif time.time() < self._retry_at:
+                return None
+            if not self._segments:
                 return None
+            segment = self._segments[0]
+        batch = Batch(segment.actions if segment.actions is not None else self._read_segment(segment))
+        batch.callbacks = segment.callbacks
+        batch.segment = segment
+        return batch
+
+    def _resolve_callbacks(self, batch, bulk_result=None, error=None):
+        # a failed request is sent again: the callbacks wait for its response
+        if error is None:
+            super(SpillBulker, self)._resolve_callbacks(batch, bulk_result)
+
+    def _acknowledge(self, segment):
+        with self.bulk_lock:
+            self._segments.popleft()
+            if segment.actions is not None:
+                self._memory_bytes -= segment.size
+            os.remove(segment.path)
+            self._failures = 0
+            self._retry_at = 0
+
+    def flush_bulk(self, forced=False):
+        results = []
+        with self._send_lock:
+            batch = self._take_batch(forced)
+            while batch:
+                try:
+                    results.append(self._send_batch(batch))
+                except BulkOperationException:
+                    # the request succeeded, with failed items
+                    self._acknowledge(batch.segment)
+                    raise
+                except Exception:
+                    with self.bulk_lock:
+                        self._retry_at = time.time() + self.get_retry_delay(self._failures)
+                        self._failures += 1
+                    if forced:
+                        raise
+                    # the actions are in the log: the producers don't see the
+                    # error, the segment is sent again after the backoff
+                    logger.exception("Error sending the bulk segment %s", batch.segment.path)
+                    break
+                self._acknowledge(batch.segment)
+                batch = self._take_batch(forced)
+        return _merge_bulk_results(results)
+
+    def get_stats(self):
+        """
+        Return the number of sealed segments waiting to be sent, of the
+        pending actions of the open segment and the bytes kept in memory
+        """
+        with self.bulk_lock:
+            return {"segments": len(self._segments), "actions": len(self.bulk_data),
+                    "memory_bytes": self._memory_bytes + self.bulk_bytes}
+
+    def close(self):
+        """
+        Seal the open segment, without sending it: the actions not sent yet
+        are sent by the next bulker on the directory
+        """
+        self._seal()
+
+
+def _merge_bulk_results(results):
+    """
+    Merge the responses of the batches sent by a flush in a single response
+    """
+    if not results:
+        return None
+    if len(results) == 1:
+        return results[0]
+    return DotDict(took=sum(result.get("took", 0) for result in results),
+                   errors=any(result.get("errors", False) for result in results),
+                   items=[item for result in results for item in result.get("items", [])])
 
-        if len(batch) > 0:
-            bulk_result = self.conn._send_request("POST",
-                                                  "/_bulk",
-                                                  "\n".join(batch) + "\n")
 
-            if self.raise_on_bulk_item_failure:
-                _raise_exception_if_bulk_item_failed(bulk_result)
+# the statuses of the bulk items rejected by a busy cluster, that can be sent again
+RETRYABLE_ITEM_STATUSES = (429, 503)
 
-            return bulk_result
+
+def _is_bulk_item_retryable(item):
+    for result in item.values():
+        return result.get("status") in RETRYABLE_ITEM_STATUSES
+    return False
 
 
 def _is_bulk_item_ok(item):
@@ -184,9 +184,11 @@ class Search(EqualityComparableUsingAttributeDictionary):
     def __init__(self, query=None, filter=None, fields=None, start=None,
                  size=None, highlight=None, sort=None, explain=False, agg=None, rescore=None,
                  window_size=None, version=None, track_scores=None, script_fields=None, index_boost=None,
-                 min_score=None, stats=None, bulk_read=None, partial_fields=None, _source=None, timeout=None):
+                 min_score=None, stats=None, bulk_read=None, partial_fields=None, _source=None, timeout=None,
+                 search_after=None):
         """
         fields: if is [], the _source is not returned
+        search_after: the sort values of the hit after which the results start
         """
         if not index_boost: index_boost = {}
         self.query = query
@@ -210,6 +212,7 @@ class Search(EqualityComparableUsingAttributeDictionary):
         self.partial_fields = partial_fields
         self._source = _source
         self.timeout = timeout
+        self.search_after = search_after
 
     def get_agg_factory(self):
         """
@@ -275,6 +278,8 @@ class Search(EqualityComparableUsingAttributeDictionary):
             res['_source'] = self._source
         if self.timeout:
             res['timeout'] = self.timeout
+        if self.search_after is not None:
+            res['search_after'] = self.search_after
         return res
 
     @property
@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+"""
+Shard-aware routing of the bulk actions.
+
+Elasticsearch sends a document to the shard given by the murmur3 hash of its
+routing (the ``_id`` by default): a :class:`ShardRouter` computes it from the
+cluster state, so that a :class:`RoutingBulker` sends every action straight
+to the node holding the primary shard of its document, without the extra hop
+through a coordinating node.
+"""
+from __future__ import absolute_import
+
+import re
+import struct
+import threading
+import time
+
+import six
+
+from . import logger
+from .models import ListBulker, _merge_bulk_results
+
+__all__ = ["murmur3_hash", "ShardRouter", "RoutingBulker"]
+
+_MASK = 0xffffffff
+
+
+def _rotl(value, bits):
+    return ((value << bits) | (value >> (32 - bits))) & _MASK
+
+
+def murmur3_32(data, seed=0):
+    """
+    Return the unsigned 32 bit murmur3 (x86) hash of the bytes data
+    """
+    data = bytearray(data)
+    length = len(data)
+    blocks = length // 4
+    h = seed
+    for k in struct.unpack_from("<%dI" % blocks, bytes(data)):
+        k = _rotl((k * 0xcc9e2d51) & _MASK, 15)
+        h ^= (k * 0x1b873593) & _MASK
+        h = (_rotl(h, 13) * 5 + 0xe6546b64) & _MASK
+    tail = blocks * 4
+    k = 0
+    remainder = length & 3
+    if remainder == 3:
+        k ^= data[tail + 2] << 16
+    if remainder >= 2:
+        k ^= data[tail + 1] << 8
+    if remainder >= 1:
+        k ^= data[tail]
+        k = _rotl((k * 0xcc9e2d51) & _MASK, 15)
+        h ^= (k * 0x1b873593) & _MASK
+    h ^= length
+    h ^= h >> 16
+    h = (h * 0x85ebca6b) & _MASK
+    h ^= h >> 13
+    h = (h * 0xc2b2ae35) & _MASK
+    h ^= h >> 16
+    return h
+
+
+def murmur3_hash(routing):
+    """
+    Return the hash of a routing value as Elasticsearch computes it: the
+    signed murmur3 hash of its UTF-16LE code units
+    """
+    if not isinstance(routing, six.text_type):
+        routing = six.text_type(routing)
+    h = murmur3_32(routing.encode("utf-16-le"))
+    return h - (1 << 32) if h & 0x80000000 else h
+
+
+class _IndexRouting(object):
+    """
+    The routing settings of an index
+    """
+
+    def __init__(self, number_of_shards, routing_num_shards=None, partition_size=1):
+        self.number_of_shards = number_of_shards
+        self.routing_num_shards = routing_num_shards or number_of_shards
+        self.partition_size = partition_size
+
+    def get_shard(self, id, routing=None):
+        if routing is None:
+            value = murmur3_hash(id)
+        else:
+            value = murmur3_hash(routing)
+            if self.partition_size > 1:
+                # an int addition, overflowing like in Java
+                value += murmur3_hash(id) % self.partition_size
+                value = (value + (1 << 31)) % (1 << 32) - (1 << 31)
+        # the routing factor of the indices that can be split
+        return (value % self.routing_num_shards) // (self.routing_num_shards // self.number_of_shards)
+
+
+_STATE_FILTER = ",".join(["metadata.indices.*.settings", "metadata.indices.*.routing_num_shards",
+                          "metadata.indices.*.aliases", "routing_table.indices"])
+
+
+def _http_address(address):
+    """
+    Return host:port of a publish address ("host/ip:port" or "inet[/ip:port]")
+    """
+    address = re.sub(r"^inet\[|\]$", "", address)
+    return address.rsplit("/", 1)[-1]
+
+
+class ShardRouter(object):
+    """
+    The primary shards of the indices and their nodes, read from the
+    ``metadata`` and ``routing_table`` of the cluster state and refreshed every ``refresh_interval`` seconds (or when an
+    action names an unknown index, at most every ``min_refresh_interval``
+    seconds).
+    """
+
+    def __init__(self, conn, refresh_interval=60.0, min_refresh_interval=5.0):
+        self.conn = conn
+        self.refresh_interval = refresh_interval
+        self.min_refresh_interval = min_refresh_interval
+        self._lock = threading.Lock()
+        self._indices = {}
+        self._aliases = {}
+        self._primaries = {}
+        self._addresses = {}
+        self._loaded_at = None
+
+    def refresh(self):
+        """
+        Read the routing table of the cluster
+        """
+        # only the parts of the state read below: not the mappings
+        state = self.conn._send_request("GET", "/_cluster/state/metadata,routing_table",
+                                        params={"filter_path": _STATE_FILTER})
+        nodes = self.conn._send_request("GET", "/_nodes/http")
+        indices = {}
+        aliases = {}
+        for name, metadata in state.get("metadata", {}).get("indices", {}).items():
+            settings = metadata.get("settings", {})
+            index_settings = settings.get("index", settings)
+            number_of_shards = int(index_settings.get("number_of_shards",
+                                                      settings.get("index.number_of_shards", 1)))
+            partition_size = int(index_settings.get("routing_partition_size", 1))
+            indices[name] = _IndexRouting(number_of_shards, metadata.get("routing_num_shards"), partition_size)
+            for alias in metadata.get("aliases", []):
+                # an alias on several indices can't be routed
+                aliases[alias] = None if alias in aliases else name
+        primaries = {}
+        for name, table in state.get("routing_table", {}).get("indices", {}).items():
+            for shard, copies in table.get("shards", {}).items():
+                for copy in copies:
+                    if copy.get("primary") and copy.get("state") == "STARTED":
+                        primaries[name, int(shard)] = copy.get("node")
+        addresses = {}
+        for node, info in nodes.get("nodes", {}).items():
+            address = info.get("http", {}).get("publish_address") or info.get("http_address")
+            if address:
+                addresses[node] = _http_address(address)
+        with self._lock:
+            self._indices = indices
+            self._aliases = aliases
+            self._primaries = primaries
+            self._addresses = addresses
+            self._loaded_at = time.time()
+
+    def _ensure_loaded(self, index=None):
+        now = time.time()
+        loaded_at = self._loaded_at
+        if loaded_at is not None and now - loaded_at < self.refresh_interval and \
+                (index is None or index in self._indices or index in self._aliases or
+                 now - loaded_at < self.min_refresh_interval):
+            return
+        try:
+            self.refresh()
+        except Exception:
+            logger.exception("Unable to read the routing table of the cluster")
+            with self._lock:
+                self._loaded_at = now
+
+    def get_node(self, index, id, routing=None):
+        """
+        Return the address (host:port) of the node of the primary shard of a
+        document, or None if it's unknown
+        """
+        if index is None or id is None:
+            return None
+        self._ensure_loaded(index)
+        with self._lock:
+            index = self._aliases.get(index, index)
+            settings = self._indices.get(index)
+            if settings is None:
+                return None
+            node = self._primaries.get((index, settings.get_shard(id, routing)))
+            return self._addresses.get(node)
+
+
+class RoutingBulker(ListBulker):
+    """
+    A bulker that splits every batch by the node of the primary shard of its
+    actions and sends the parts in parallel, each straight to its node. The
+    actions without ``_id``, on unknown indices or on nodes that aren't in
+    the connection pool are sent to any node. The items of the parts are
+    merged in the order of the batch.
+
+    To route by shard::
+
+        ES(servers, bulker_class=functools.partial(RoutingBulker, refresh_interval=60))
+    """
+
+    def __init__(self, conn, bulk_size=400, raise_on_bulk_item_failure=False, refresh_interval=60.0,
+                 **kwargs):
+        super(RoutingBulker, self).__init__(conn=conn, bulk_size=bulk_size,
+                                            raise_on_bulk_item_failure=raise_on_bulk_item_failure, **kwargs)
+        self.router = ShardRouter(conn, refresh_interval=refresh_interval)
+
+    def _get_connections(self):
+        connections = {}
+        for connection in getattr(self.conn.connection.transport.connection_pool, "connections", []):
+            connections[connection.host.split("://", 1)[-1]] = connection
+        return connections
+
+    def _group_batch(self, batch):
+        """
+        Return the positions of the actions of batch grouped by the
+        connection to their node (None for any node)
+        """
+        loads = self.conn.json_backend.loads_plain
+        connections = self._get_connections()
+        groups = {}
+        for position, action in enumerate(batch):
+            if isinstance(action, six.binary_type):
+                action = action.decode("utf-8")
+            header = loads(action.split("\n", 1)[0])
+            meta = list(header.values())[0] if len(header) == 1 else {}
+            routing = meta.get("_routing", meta.get("routing", meta.get("_parent", meta.get("parent"))))
+            node = self.router.get_node(meta.get("_index"), meta.get("_id"), routing)
+            groups.setdefault(connections.get(node), []).append(position)
+        return groups
+
+    def _post_batch(self, batch):
+        groups = self._group_batch(batch)
+        if len(groups) == 1:
+            connection = list(groups)[0]
+            bulk_result = self._post_part(connection, batch)
+        else:
+            from concurrent.futures import ThreadPoolExecutor
+
+            with ThreadPoolExecutor(max_workers=len(groups)) as pool:
+                futures = [(positions, pool.submit(self._post_part, connection,
+                                                   [batch[position] for position in positions]))
+                           for connection, positions in groups.items()]
+                parts = [(positions, future.result()) for positions, future in futures]
+            items = [None] * len(batch)
+            for positions, result in parts:
+                for position, item in zip(positions, result.get("items", [])):
+                    items[position] = item
+            bulk_result = _merge_bulk_results([result for positions, result in parts])
+            bulk_result["items"] = items
+        self.conn._invalidate_bulk(bulk_result)
+        return bulk_result
+
+    def _post_part(self, connection, actions):
+        return self.conn._send_request("POST", "/_bulk", "\n".join(actions) + "\n", connection=connection)
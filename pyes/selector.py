@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+Latency-aware choice of the node that serves a request.
+
+:class:`LatencySelector` keeps, for every node, an exponentially weighted
+moving average (EWMA) of the response time and the number of requests in
+flight, and routes every request with the power of two choices: two random
+nodes are compared and the least loaded one is used.
+"""
+from __future__ import absolute_import
+
+import random
+import threading
+from time import time
+
+__all__ = ["NodeStats", "LatencySelector"]
+
+
+class NodeStats(object):
+    """
+    Latency and load statistics of a node
+    """
+
+    def __init__(self):
+        self.ewma = None
+        self.in_flight = 0
+        self.requests = 0
+        self.failures = 0
+        self.last_latency = None
+
+    def score(self):
+        """
+        The expected wait of a new request: lower is better. Nodes without
+        samples score 0, so that they are tried.
+        """
+        if self.ewma is None:
+            return 0.0
+        return self.ewma * (self.in_flight + 1)
+
+    def as_dict(self):
+        return {"ewma": self.ewma, "in_flight": self.in_flight, "requests": self.requests,
+                "failures": self.failures, "last_latency": self.last_latency}
+
+
+class LatencySelector(object):
+    """
+    Pick the nodes with the power of two choices over the EWMA of their
+    latency weighted by their requests in flight.
+
+    A selector can be shared by several connections (see the ``selector``
+    parameter of :class:`pyes.es.ES`) and is thread safe.
+
+    :param decay: the weight of a new latency sample in the EWMA, between 0
+        and 1. Higher values follow load changes faster.
+    :param failure_penalty: the latency in seconds recorded for a failed
+        request.
+    """
+
+    def __init__(self, decay=0.3, failure_penalty=1.0):
+        if not 0 < decay <= 1:
+            raise ValueError("decay must be in (0, 1]")
+        self.decay = decay
+        self.failure_penalty = failure_penalty
+        self._stats = {}
+        self._lock = threading.Lock()
+        self._random = random.Random()
+
+    def _get(self, node):
+        stats = self._stats.get(node)
+        if stats is None:
+            stats = self._stats[node] = NodeStats()
+        return stats
+
+    def select(self, nodes, key=None):
+        """
+        Return one of nodes.
+
+        :param key: a function returning the name of a node used for the
+            statistics. Default: the node itself.
+        """
+        if len(nodes) == 1:
+            return nodes[0]
+        if not nodes:
+            raise IndexError("no node available")
+        first, second = self._random.sample(nodes, 2)
+        with self._lock:
+            first_score = self._get(key(first) if key else first).score()
+            second_score = self._get(key(second) if key else second).score()
+        return first if first_score <= second_score else second
+
+    def start(self, node):
+        """
+        Record the start of a request on node and return the start time, to
+        be passed to :meth:`finish`
+        """
+        with self._lock:
+            self._get(node).in_flight += 1
+        return time()
+
+    def finish(self, node, started, failed=False):
+        """
+        Record the end of a request started at time started
+        """
+        latency = time() - started
+        with self._lock:
+            stats = self._get(node)
+            stats.in_flight -= 1
+            stats.requests += 1
+            if failed:
+                stats.failures += 1
+                latency = max(latency, self.failure_penalty)
+            stats.last_latency = latency
+            if stats.ewma is None:
+                stats.ewma = latency
+            else:
+                stats.ewma += self.decay * (latency - stats.ewma)
+        return latency
+
+    def get_stats(self):
+        """
+        Return a dict node -> dict of the statistics of the node
+        (``ewma``, ``in_flight``, ``requests``, ``failures``, ``last_latency``)
+        """
+        with self._lock:
+            return dict((node, stats.as_dict()) for node, stats in self._stats.items())
+
+    def reset(self):
+        """
+        Forget the statistics of every node
+        """
+        with self._lock:
+            self._stats.clear()
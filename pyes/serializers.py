@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+Registry of the JSON codecs used by :class:`pyes.es.ES` to encode requests
+and decode responses.
+
+A backend is selected by name with ``ES(json_backend="orjson")``. Every
+backend keeps the semantics of the encoder and decoder classes of the
+connection (``ES.encoder`` and ``ES.decoder``): datetime, date, Decimal and
+set values are converted by the encoder ``default`` method and decoded
+objects go through the decoder ``object_hook``. If the library of a backend
+is not installed, the standard ``json`` backend is used.
+"""
+from __future__ import absolute_import
+
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+from . import logger
+
+__all__ = ["JSONBackend", "StdlibJSONBackend", "OrjsonBackend", "register_json_backend",
+           "get_json_backend", "JSON_BACKENDS", "apply_object_hook"]
+
+
+class JSONBackend(object):
+    """
+    Base class of the JSON backends
+
+    :param encoder: the json.JSONEncoder class used for the values that the
+        backend doesn't know how to serialize.
+    :param decoder: the json.JSONDecoder class whose ``object_hook`` is
+        applied to the decoded objects.
+    """
+    name = None
+
+    def __init__(self, encoder=None, decoder=None):
+        self.encoder = encoder or json.JSONEncoder
+        self.decoder = decoder or json.JSONDecoder
+
+    def dumps(self, obj):
+        """
+        Serialize obj to a str
+        """
+        raise NotImplementedError
+
+    def dumps_bytes(self, obj):
+        """
+        Serialize obj to utf-8 encoded bytes
+        """
+        return self.dumps(obj).encode("utf-8")
+
+    def loads(self, data):
+        """
+        Deserialize a str or bytes document
+        """
+        raise NotImplementedError
+
+    def loads_plain(self, data):
+        """
+        Deserialize a str or bytes document to plain dicts and lists, without
+        the decoder ``object_hook``
+        """
+        raise NotImplementedError
+
+
+class StdlibJSONBackend(JSONBackend):
+    """
+    The ``json`` module (or simplejson if it's installed)
+    """
+    name = "json"
+
+    def dumps(self, obj):
+        return json.dumps(obj, cls=self.encoder)
+
+    def loads(self, data):
+        return json.loads(data, cls=self.decoder)
+
+    def loads_plain(self, data):
+        return json.loads(data)
+
+
+class OrjsonBackend(JSONBackend):
+    """
+    The `orjson <https://github.com/ijl/orjson>`_ library
+
+    Datetimes are passed to the encoder ``default`` method to be serialized
+    in the same way of the standard backend.
+    """
+    name = "orjson"
+
+    def __init__(self, encoder=None, decoder=None):
+        import orjson
+
+        super(OrjsonBackend, self).__init__(encoder=encoder, decoder=decoder)
+        self._orjson = orjson
+        self._default = self.encoder().default
+        self._options = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        self._object_hook = self.decoder().object_hook
+
+    def dumps(self, obj):
+        return self.dumps_bytes(obj).decode("utf-8")
+
+    def dumps_bytes(self, obj):
+        return self._orjson.dumps(obj, default=self._default, option=self._options)
+
+    def loads(self, data):
+        decoded = self.loads_plain(data)
+        if self._object_hook is None:
+            return decoded
+        return apply_object_hook(decoded, self._object_hook)
+
+    def loads_plain(self, data):
+        if isinstance(data, memoryview):
+            data = data.tobytes()
+        return self._orjson.loads(data)
+
+
+def apply_object_hook(value, object_hook):
+    """
+    Apply object_hook to every object of a decoded document, from the
+    innermost ones as the json decoder does.
+    """
+    if isinstance(value, dict):
+        for key, item in value.items():
+            if isinstance(item, (dict, list)):
+                value[key] = apply_object_hook(item, object_hook)
+        return object_hook(value)
+    elif isinstance(value, list):
+        return [apply_object_hook(item, object_hook) if isinstance(item, (dict, list)) else item
+                for item in value]
+    return value
+
+
+JSON_BACKENDS = {
+    "json": StdlibJSONBackend,
+    "orjson": OrjsonBackend,
+}
+
+
+def register_json_backend(name, backend_class):
+    """
+    Register a JSON backend class to be used as ``ES(json_backend=name)``
+    """
+    JSON_BACKENDS[name] = backend_class
+
+
+def get_json_backend(name=None, encoder=None, decoder=None):
+    """
+    Return an instance of the JSON backend registered as name.
+
+    The standard backend is returned if name is None or if the library of
+    the backend is not installed.
+    """
+    if name is None:
+        name = "json"
+    if isinstance(name, JSONBackend):
+        return name
+    try:
+        backend_class = JSON_BACKENDS[name]
+    except KeyError:
+        raise ValueError("Unknown json backend: %s" % name)
+    try:
+        return backend_class(encoder=encoder, decoder=decoder)
+    except ImportError:
+        logger.warning("json backend %s is not available, falling back to json", name)
+        return StdlibJSONBackend(encoder=encoder, decoder=decoder)
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+"""
+Incremental parser of search and scroll responses.
+
+:class:`HitStream` reads the body of a search response from a file-like
+object and decodes the hits of ``hits.hits`` one at a time, so that only a
+hit (plus a chunk of the body) is in memory while the page is iterated.
+"""
+from __future__ import absolute_import
+
+import codecs
+import re
+
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+from .models import DotDict
+
+__all__ = ["HitStream"]
+
+CHUNK_SIZE = 64 * 1024
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_HITS_START = object()
+
+
+class HitStream(object):
+    """
+    Iterate over the hits of a search response read from ``response``.
+
+    The members of the response before the hits (``_scroll_id``, ``took``,
+    ``hits.total``...) are in ``results`` as soon as the stream is created,
+    the ones after them (``aggregations``, ``facets``...) when all the hits
+    have been read. ``results["hits"]["hits"]`` is always empty.
+
+    :param response: a file-like object with a ``read(size)`` method, i.e. a
+        urllib3 response opened with ``preload_content=False``.
+    :param decoder: the json.JSONDecoder instance used to decode the values.
+    :param chunk_size: the number of bytes read at once.
+    """
+
+    def __init__(self, response, decoder=None, chunk_size=CHUNK_SIZE):
+        self._response = response
+        self._decoder = decoder or json.JSONDecoder()
+        self._chunk_size = chunk_size
+        self._text_decoder = codecs.getincrementaldecoder("utf-8")()
+        self._buffer = u""
+        self._pos = 0
+        self._eof = False
+        self.finished = False
+        self.results = DotDict()
+        self._events = self._parse()
+        # parse up to the first hit
+        for event in self._events:
+            if event is _HITS_START:
+                break
+        else:
+            # not a search response
+            self.close()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self._events)
+        except StopIteration:
+            self.close()
+            raise
+
+    next = __next__
+
+    def read_all(self):
+        """
+        Read the rest of the response and return the remaining hits as a list
+        """
+        return list(self)
+
+    def close(self):
+        """
+        Release the connection of the response. If it's not fully read, the
+        connection is closed.
+        """
+        self._events = iter(())
+        if self._response is None:
+            return
+        if not self._eof and hasattr(self._response, "close"):
+            self._response.close()
+        if hasattr(self._response, "release_conn"):
+            self._response.release_conn()
+        self._response = None
+        self._eof = True
+
+    def _parse(self):
+        self._expect(u"{")
+        for key in self._members(u"}"):
+            if key == u"hits" and self._peek() == u"{":
+                self._pos += 1
+                hits = self.results[key] = DotDict()
+                for hits_key in self._members(u"}"):
+                    if hits_key == u"hits" and self._peek() == u"[":
+                        self._pos += 1
+                        hits[hits_key] = []
+                        yield _HITS_START
+                        for hit in self._elements(u"]"):
+                            yield hit
+                    else:
+                        hits[hits_key] = self._value()
+            else:
+                self.results[key] = self._value()
+        self.finished = True
+
+    def _members(self, end):
+        """
+        Yield the keys of an object: the caller parses the value
+        """
+        if self._peek() == end:
+            self._pos += 1
+            return
+        while True:
+            key = self._value()
+            self._expect(u":")
+            yield key
+            char = self._next_char()
+            if char == end:
+                return
+            if char != u",":
+                raise ValueError("Expecting ',' delimiter at position %d" % self._pos)
+
+    def _elements(self, end):
+        """
+        Yield the decoded values of an array
+        """
+        if self._peek() == end:
+            self._pos += 1
+            return
+        while True:
+            yield self._value()
+            char = self._next_char()
+            if char == end:
+                return
+            if char != u",":
+                raise ValueError("Expecting ',' delimiter at position %d" % self._pos)
+
+    def _value(self):
+        self._peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._pos)
+            except ValueError:
+                if self._eof:
+                    raise
+            else:
+                # a number can continue in the next chunk
+                if end < len(self._buffer) or self._eof:
+                    self._pos = end
+                    return value
+            self._read()
+
+    def _peek(self):
+        while True:
+            self._pos = _WHITESPACE.match(self._buffer, self._pos).end()
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if self._eof:
+                raise ValueError("Unexpected end of the response")
+            self._read()
+
+    def _next_char(self):
+        char = self._peek()
+        self._pos += 1
+        return char
+
+    def _expect(self, expected):
+        char = self._next_char()
+        if char != expected:
+            raise ValueError("Expecting %r at position %d, found %r" % (expected, self._pos - 1, char))
+
+    def _read(self):
+        # read at least as much as the pending text, so that a value larger
+        # than a chunk is parsed again only a few times
+        size = max(self._chunk_size, len(self._buffer) - self._pos)
+        data = self._response.read(size)
+        if data:
+            text = self._text_decoder.decode(data)
+        else:
+            text = self._text_decoder.decode(b"", True)
+            self._eof = True
+        self._buffer = self._buffer[self._pos:] + text
+        self._pos = 0
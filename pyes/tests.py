@@ -1,9 +1,15 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import
 import os
+import gzip
+import io
+import json
 import logging
+import threading
+import time
 import unittest
 from pprint import pprint
+from six.moves import BaseHTTPServer, socketserver
 from pyes.es import ES
 from pyes.helpers import SettingsBuilder
 
@@ -59,6 +65,90 @@ DEFAULT_TEST_MAPPING = {
 }
 
 
+class StandInServer(object):
+    """
+    A local HTTP server answering with canned responses, used to test pyes
+    without a running cluster.
+
+    :param handler: a callable ``handler(method, path, body)`` returning a
+        tuple (status, body). A dict or list body is sent as JSON. The default
+        handler answers ``{"ok": true}``.
+    :param delay: seconds to wait before every response
+    :param compress_responses: compress the responses with gzip when the
+        request accepts it. The gzip request bodies are always decompressed
+        before they are recorded in ``requests``; ``received_bytes`` counts
+        the bytes of the bodies as they were received.
+    """
+
+    def __init__(self, handler=None, delay=0, compress_responses=False):
+        self.handler = handler or (lambda method, path, body: (200, {"ok": True}))
+        self.delay = delay
+        self.compress_responses = compress_responses
+        self.requests = []
+        self.received_bytes = 0
+        self.connections = 0
+        stand_in = self
+
+        class RequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # headers and body are written separately
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+                stand_in.connections += 1
+
+            def _answer(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                stand_in.received_bytes += len(body)
+                if self.headers.get("Content-Encoding") == "gzip":
+                    body = gzip.GzipFile(fileobj=io.BytesIO(body)).read()
+                stand_in.requests.append((self.command, self.path, body))
+                if stand_in.delay:
+                    time.sleep(stand_in.delay)
+                status, data = stand_in.handler(self.command, self.path, body)
+                if isinstance(data, (dict, list)):
+                    data = json.dumps(data)
+                if not isinstance(data, bytes):
+                    data = data.encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                if stand_in.compress_responses and "gzip" in (self.headers.get("Accept-Encoding") or ""):
+                    compressed = io.BytesIO()
+                    with gzip.GzipFile(fileobj=compressed, mode="wb") as response:
+                        response.write(data)
+                    data = compressed.getvalue()
+                    self.send_header("Content-Encoding", "gzip")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                if self.command != "HEAD":
+                    self.wfile.write(data)
+
+            do_GET = do_POST = do_PUT = do_DELETE = do_HEAD = _answer
+
+            def log_message(self, *args):
+                pass
+
+        class Server(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+            daemon_threads = True
+
+        self.httpd = Server(("127.0.0.1", 0), RequestHandler)
+        self.port = self.httpd.server_address[1]
+        self.server = ("http", "127.0.0.1", self.port)
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
 class ESTestCase(unittest.TestCase):
     def setUp(self):
         self.log = open("/tmp/%s.sh" % self._testMethodName, "wb")
@@ -169,9 +169,10 @@ def clean_string(text):
 
 def keys_to_string(data):
     """
-    Function to convert all the unicode keys in string keys
+    Function to convert all the unicode keys in string keys (on python 2,
+    where keyword arguments can't be unicode)
     """
-    if isinstance(data, dict):
+    if six.PY2 and isinstance(data, dict):
         for key in list(data.keys()):
             if isinstance(key, six.string_types):
                 value = data[key]
@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+import asyncio
+import json
+import unittest
+from six.moves.urllib.parse import urlparse, parse_qs
+from pyes.tests import StandInServer
+from pyes.es_async import AsyncES, AsyncResultSet
+from pyes.query import Search, MatchAllQuery
+
+
+def search_handler(method, path, body):
+    if path.startswith("/test-index/test-type/_search"):
+        query = parse_qs(urlparse(path).query)
+        start, size = int(query["from"][0]), int(query["size"][0])
+        hits = [{"_index": "test-index", "_type": "test-type", "_id": str(i),
+                 "_source": {"position": i}} for i in range(start, min(start + size, 25))]
+        return 200, {"took": 1, "hits": {"total": 25, "max_score": 1.0, "hits": hits}}
+    if path.startswith("/_all/_msearch"):
+        return 200, {"responses": [{"hits": {"total": 1, "hits": [{"_id": "1", "_source": {"a": 1}}]}},
+                                   {"error": "boom"}]}
+    if path.startswith("/_bulk"):
+        lines = body.decode("utf-8").splitlines()
+        return 200, {"took": 1, "items": [{"index": {"_id": json.loads(l)["index"]["_id"], "status": 201}}
+                                          for l in lines[::2]]}
+    if path.startswith("/test-index/test-type/1"):
+        return 200, {"_index": "test-index", "_type": "test-type", "_id": "1", "_version": 3,
+                     "found": True, "_source": {"name": "Joe Tester"}}
+    if path.startswith("/_mget"):
+        docs = json.loads(body.decode("utf-8"))["docs"]
+        return 200, {"docs": [{"_index": d["_index"], "_type": d["_type"], "_id": d["_id"],
+                               "_version": 1, "found": True, "_source": {"id": d["_id"]}} for d in docs]}
+    if path.startswith("/test-index/test-type/file"):
+        return 200, {"_index": "test-index", "_type": "test-type", "_id": "file", "_version": 1, "found": True,
+                     "_source": {"_name": "hello.txt", "content": "aGVsbG8="}}
+    if path.startswith("/test-index/_suggest"):
+        return 200, {"_shards": {"total": 1}, "name": [{"text": "jo", "offset": 0, "length": 2,
+                                                         "options": [{"text": "joe", "score": 0.8}]}]}
+    if path == "/":
+        return 200, {"name": "node", "version": {"number": "1.7.0"}}
+    if path.startswith("/missing-index") or (method == "HEAD" and path.startswith("/new-index")):
+        return 404, {"error": "index_not_found_exception", "status": 404}
+    return 200, {"ok": True}
+
+
+class AsyncESTestCase(unittest.TestCase):
+    def setUp(self):
+        self.server = StandInServer(search_handler).start()
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+        self.server.stop()
+
+    def run_async(self, coroutine):
+        return self.loop.run_until_complete(coroutine)
+
+    def get_conn(self, **kwargs):
+        return AsyncES(self.server.server, **kwargs)
+
+    def test_get_reuses_connection(self):
+        async def run():
+            conn = self.get_conn()
+            docs = [await conn.get("test-index", "test-type", 1) for _ in range(5)]
+            await conn.close()
+            return docs
+
+        docs = self.run_async(run())
+        self.assertEqual(docs[0].name, "Joe Tester")
+        self.assertEqual(docs[0]._meta.version, 3)
+        self.assertEqual(self.server.connections, 1)
+
+    def test_concurrent_requests(self):
+        async def run():
+            conn = self.get_conn(pool_maxsize=4)
+            docs = await asyncio.gather(*[conn.get("test-index", "test-type", 1) for _ in range(20)])
+            await conn.close()
+            return docs
+
+        docs = self.run_async(run())
+        self.assertEqual(len(docs), 20)
+        self.assertLessEqual(self.server.connections, 4)
+
+    def test_mget(self):
+        async def run():
+            conn = self.get_conn()
+            docs = await conn.mget(["1", "2"], "test-index", "test-type")
+            await conn.close()
+            return docs
+
+        docs = self.run_async(run())
+        self.assertEqual([doc.id for doc in docs], ["1", "2"])
+
+    def test_bulk(self):
+        async def run():
+            conn = self.get_conn(bulk_size=2)
+            first = await conn.index({"name": "a"}, "test-index", "test-type", 1, bulk=True)
+            second = await conn.index({"name": "b"}, "test-index", "test-type", 2, bulk=True)
+            third = await conn.index({"name": "c"}, "test-index", "test-type", 3, bulk=True)
+            forced = await conn.force_bulk()
+            await conn.close()
+            return first, second, third, forced
+
+        first, second, third, forced = self.run_async(run())
+        self.assertIsNone(first)
+        self.assertEqual(len(second["items"]), 2)
+        self.assertIsNone(third)
+        self.assertEqual(len(forced["items"]), 1)
+
+    def test_async_for(self):
+        async def run():
+            conn = self.get_conn()
+            resultset = conn.search(Search(MatchAllQuery(), bulk_read=10), "test-index", "test-type")
+            self.assertIsInstance(resultset, AsyncResultSet)
+            positions = [hit.position async for hit in resultset]
+            item = await resultset[3]
+            await conn.close()
+            return resultset, positions, item
+
+        resultset, positions, item = self.run_async(run())
+        self.assertEqual(positions, list(range(25)))
+        self.assertEqual(resultset.total, 25)
+        self.assertEqual(item.position, 3)
+
+    def test_async_for_twice(self):
+        async def run():
+            conn = self.get_conn()
+            resultset = conn.search(Search(MatchAllQuery(), bulk_read=10), "test-index", "test-type")
+            first = [hit.position async for hit in resultset]
+            second = [hit.position async for hit in resultset]
+            await conn.close()
+            return first, second
+
+        first, second = self.run_async(run())
+        self.assertEqual(first, list(range(25)))
+        self.assertEqual(second, list(range(25)))
+
+    def test_resultset_requires_fetch(self):
+        conn = self.get_conn()
+        resultset = conn.search(MatchAllQuery(), "test-index", "test-type")
+        self.assertRaises(RuntimeError, lambda: resultset.total)
+        self.assertRaises(TypeError, iter, resultset)
+        self.run_async(resultset.fetch())
+        self.assertEqual(resultset.total, 25)
+        self.run_async(conn.close())
+
+    def test_search_multi(self):
+        async def run():
+            conn = self.get_conn()
+            results = [rs async for rs in conn.search_multi([MatchAllQuery(), MatchAllQuery()])]
+            await conn.close()
+            return results
+
+        first, second = self.run_async(run())
+        self.assertEqual(first.total, 1)
+        self.assertEqual(second.error, "boom")
+
+    def test_indices_manager(self):
+        async def run():
+            conn = self.get_conn()
+            exists = await conn.indices.exists_index("missing-index")
+            deleted = await conn.indices.delete_index_if_exists("missing-index")
+            refreshed = await conn.indices.refresh("test-index")
+            health = await conn.cluster.health()
+            await conn.close()
+            return exists, deleted, refreshed, health
+
+        exists, deleted, refreshed, health = self.run_async(run())
+        self.assertFalse(exists)
+        self.assertIsNone(deleted)
+        self.assertTrue(refreshed.ok)
+        self.assertTrue(health.ok)
+
+    def test_composed_methods(self):
+        from pyes.query import Suggest
+
+        async def run():
+            conn = self.get_conn()
+            updated = await conn.update_by_function({"age": 3}, "test-index", "test-type", 1)
+            name, content = await conn.get_file("test-index", "test-type", "file")
+            suggest = Suggest()
+            suggest.add("jo", "name", "name")
+            suggested = await conn.suggest_from_object(suggest, indices="test-index")
+            await conn.ensure_index("new-index", mappings={"test-type": {"properties": {}}})
+            collected = await conn.collect_info()
+            await conn.close()
+            return updated, name, content, suggested, collected, conn.info
+
+        updated, name, content, suggested, collected, info = self.run_async(run())
+        self.assertEqual(updated["_id"], "1")
+        put = [request for request in self.server.requests if request[0] == "PUT"]
+        self.assertTrue(put[0][1].startswith("/test-index/test-type/1?"))
+        self.assertIn("version=3", put[0][1])
+        self.assertEqual(json.loads(put[0][2].decode("utf-8")), {"name": "Joe Tester", "age": 3})
+        self.assertEqual((name, content), ("hello.txt", b"hello"))
+        self.assertEqual(suggested, [(0.8, 0.8, "joe")])
+        self.assertEqual(put[1][1], "/new-index")
+        self.assertTrue(collected)
+        self.assertEqual(info["server"]["name"], "node")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,725 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+import asyncio
+import functools
+import gzip
+import json
+import os
+import shutil
+import tempfile
+from concurrent.futures import Future
+import threading
+import time
+import unittest
+from pyes.tests import StandInServer
+from pyes.es import ES
+from pyes.es_async import AsyncES
+from elasticsearch.exceptions import TransportError
+from pyes.exceptions import BulkOperationException
+from pyes.models import AdaptiveBulker, BytesBulker, CoalescingBulker, ListBulker, SpillBulker, ThreadedBulker
+from pyes.bulk import parallel_bulk, process_bulk, serialize_action
+
+
+def bulk_handler(method, path, body):
+    """
+    Answer a _bulk request with an item for every action
+    """
+    lines = [line for line in body.decode("utf-8").splitlines() if line.strip()]
+    items = []
+    position = 0
+    while position < len(lines):
+        action = json.loads(lines[position])
+        op_type, meta = list(action.items())[0]
+        position += 1 if op_type == "delete" else 2
+        items.append({op_type: {"_index": meta.get("_index"), "_type": meta.get("_type"), "_id": meta.get("_id"),
+                                "_version": 1, "status": 200 if op_type == "delete" else 201}})
+    return 200, {"took": 1, "errors": False, "items": items}
+
+
+class BulkerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.server = StandInServer(bulk_handler).start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def bulk_bodies(self):
+        return [request[2] for request in self.server.requests]
+
+    def test_max_actions(self):
+        conn = ES(self.server.server, bulk_size=3)
+        results = [conn.index({"name": "Joe"}, "test-index", "test-type", i, bulk=True) for i in range(3)]
+        self.assertEqual(results[:2], [None, None])
+        self.assertEqual(len(results[2]["items"]), 3)
+        self.assertEqual(conn.bulker.bulk_data, [])
+        self.assertEqual(conn.bulker.bulk_bytes, 0)
+
+    def test_max_bytes(self):
+        conn = ES(self.server.server, bulk_size=100, bulk_max_bytes=200)
+        document = {"name": "x" * 50}
+        self.assertIsNone(conn.index(document, "test-index", "test-type", 1, bulk=True))
+        action_size = conn.bulker.bulk_bytes
+        self.assertTrue(100 < action_size < 200)
+        result = conn.index(document, "test-index", "test-type", 2, bulk=True)
+        self.assertEqual(len(result["items"]), 1)
+        self.assertEqual(len(conn.bulker.bulk_data), 1)
+        self.assertEqual(conn.bulker.bulk_bytes, action_size)
+        conn.force_bulk()
+        for body in self.bulk_bodies():
+            self.assertLessEqual(len(body), 200)
+
+    def test_callbacks(self):
+        conn = ES(self.server.server, bulk_size=10)
+        results = []
+        futures = [Future() for _ in range(3)]
+        for i, future in enumerate(futures):
+            conn.index({"name": "Joe"}, "test-index", "test-type", i, bulk=True, callback=future)
+        conn.delete("test-index", "test-type", 7, bulk=True, callback=lambda ok, item: results.append((ok, item)))
+        conn.index({"name": "Joe"}, "test-index", "test-type", 8, bulk=True)
+        conn.index_raw_bulk('{"index":{"_index":"test-index","_type":"test-type","_id":"9"}}\n', '{"name":"Joe"}\n',
+                            callback=lambda ok, item: results.append((ok, item)))
+        self.assertFalse(futures[0].done())
+        conn.force_bulk()
+        self.assertEqual([future.result()["index"]["_id"] for future in futures], [0, 1, 2])
+        self.assertEqual([(ok, list(item.keys())[0], list(item.values())[0]["_id"]) for ok, item in results],
+                         [(True, "delete", 7), (True, "index", "9")])
+
+    def test_callbacks_on_error(self):
+        self.server.handler = lambda method, path, body: (500, {"error": "failure", "status": 500})
+        conn = ES(self.server.server, bulk_size=10)
+        future = Future()
+        results = []
+        conn.index({"name": "Joe"}, "test-index", "test-type", 1, bulk=True, callback=future)
+        conn.index({"name": "Joe"}, "test-index", "test-type", 2, bulk=True,
+                   callback=lambda ok, error: results.append((ok, error)))
+        self.assertRaises(TransportError, conn.force_bulk)
+        self.assertTrue(isinstance(future.exception(), TransportError))
+        self.assertEqual(results[0][0], False)
+        self.assertTrue(isinstance(results[0][1], TransportError))
+
+    def test_force_splits_batches(self):
+        conn = ES(self.server.server, bulk_size=4, bulk_max_bytes=10 ** 6)
+        conn.bulker.bulk_size = 10
+        for i in range(9):
+            conn.index({"name": "Joe"}, "test-index", "test-type", i, bulk=True)
+        conn.bulker.max_bytes = 300
+        result = conn.force_bulk()
+        self.assertEqual([item["index"]["_id"] for item in result["items"]], list(range(9)))
+        self.assertGreater(len(self.server.requests), 1)
+        for body in self.bulk_bodies():
+            self.assertLessEqual(len(body), 300)
+        self.assertIsNone(conn.force_bulk())
+
+    def test_add_without_callback(self):
+        class OldBulker(ListBulker):
+            # a bulker written before the callbacks
+            def add(self, content):
+                super(OldBulker, self).add(content)
+
+        conn = ES(self.server.server, bulk_size=10, bulker_class=OldBulker)
+        conn.index({"name": "Joe"}, "test-index", "test-type", 1, bulk=True)
+        conn.update("test-index", "test-type", 1, document={"name": "Bill"}, bulk=True)
+        conn.delete("test-index", "test-type", 1, bulk=True)
+        conn.index_raw_bulk('{"index":{"_index":"test-index","_type":"test-type","_id":"2"}}\n', '{"name":"Joe"}\n')
+        result = conn.force_bulk()
+        self.assertEqual([list(item.keys())[0] for item in result["items"]], ["index", "update", "delete", "index"])
+
+
+class BytesBulkerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.server = StandInServer(bulk_handler).start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def queue_actions(self, conn):
+        conn.index({"name": u"Jòe"}, "test-index", "test-type", 1, bulk=True)
+        conn.index({"name": "Bill"}, "test-index", "test-type", 2, bulk=True, parent="1", version=3)
+        conn.index('{"name":"Joe"}', "other-index", "test-type", bulk=True, force_insert=True)
+        conn.update("test-index", "test-type", 1, document={"name": "Bill"}, bulk=True)
+        conn.delete("test-index", "test-type", 2, bulk=True)
+        conn.index_raw_bulk('{"index":{"_index":"test-index","_type":"test-type","_id":"3"}}\n', '{"name":"Joe"}\n')
+
+    def test_same_actions(self):
+        bodies = []
+        for bulker_class in (ListBulker, BytesBulker):
+            conn = ES(self.server.server, bulk_size=100, bulker_class=bulker_class)
+            self.queue_actions(conn)
+            result = conn.force_bulk()
+            self.assertEqual(len(result["items"]), 6)
+            body = self.server.requests[-1][2].decode("utf-8")
+            bodies.append([json.loads(line) for line in body.splitlines() if line])
+        self.assertEqual(bodies[0], bodies[1])
+        self.assertEqual(bodies[1][2], {"index": {"_index": "test-index", "_type": "test-type", "_id": 2,
+                                                  "_parent": "1", "_version": 3}})
+
+    def test_buffer(self):
+        conn = ES(self.server.server, bulk_size=2, bulker_class=BytesBulker)
+        self.assertIsInstance(conn.bulker.bulk_data, bytearray)
+        self.assertFalse(conn.bulker)
+        conn.index({"name": "Joe"}, "test-index", "test-type", 1, bulk=True)
+        self.assertTrue(conn.bulker)
+        self.assertEqual(conn.bulker.bulk_bytes, len(conn.bulker.bulk_data))
+        buffer = conn.bulker.bulk_data
+        result = conn.index({"name": "Joe"}, "test-index", "test-type", 2, bulk=True)
+        self.assertEqual(len(result["items"]), 2)
+        conn.index({"name": "Joe"}, "test-index", "test-type", 3, bulk=True)
+        conn.index({"name": "Joe"}, "test-index", "test-type", 4, bulk=True)
+        self.assertIs(conn.bulker.bulk_data, buffer)
+        self.assertEqual(len(conn.bulker._templates), 1)
+
+    def test_max_bytes(self):
+        conn = ES(self.server.server, bulk_size=100, bulk_max_bytes=300, bulker_class=BytesBulker)
+        futures = [Future() for _ in range(8)]
+        for i, future in enumerate(futures):
+            conn.index({"name": "x" * 50}, "test-index", "test-type", i, bulk=True, callback=future)
+        conn.force_bulk()
+        self.assertGreater(len(self.server.requests), 2)
+        for request in self.server.requests:
+            self.assertLessEqual(len(request[2]), 300)
+        self.assertEqual([future.result()["index"]["_id"] for future in futures], list(range(8)))
+
+
+class RetryBulkerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.rejections = {}
+        self.server = StandInServer(self.rejecting_handler).start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def rejecting_handler(self, method, path, body):
+        status, result = bulk_handler(method, path, body)
+        for item in result["items"]:
+            meta = item["index"]
+            if self.rejections.get(meta["_id"], 0) > 0:
+                self.rejections[meta["_id"]] -= 1
+                meta["status"] = 429
+                meta["error"] = "es_rejected_execution_exception"
+                result["errors"] = True
+        return status, result
+
+    def make_conn(self, **kwargs):
+        return ES(self.server.server, bulk_size=3, raise_on_bulk_item_failure=True,
+                  bulker_class=functools.partial(ListBulker, retry_backoff=0.01, **kwargs))
+
+    def test_retry_rejected_items(self):
+        self.rejections = {"1": 2}
+        conn = self.make_conn()
+        for i in range(3):
+            result = conn.index({"name": "Joe"}, "test-index", "test-type", str(i), bulk=True)
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(self.server.requests[1][2].count(b"\n"), 2)
+        self.assertIn(b'"1"', self.server.requests[2][2])
+        self.assertEqual([item["index"]["status"] for item in result["items"]], [201, 201, 201])
+        self.assertFalse(result["errors"])
+
+    def test_retry_bytes_bulker(self):
+        self.rejections = {"1": 1}
+        conn = ES(self.server.server, bulk_size=3,
+                  bulker_class=functools.partial(BytesBulker, retry_backoff=0.01))
+        for i in range(3):
+            result = conn.index({"name": "Joe"}, "test-index", "test-type", str(i), bulk=True)
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertEqual([json.loads(line) for line in self.server.requests[1][2].splitlines()],
+                         [{"index": {"_index": "test-index", "_type": "test-type", "_id": "1"}}, {"name": "Joe"}])
+        self.assertFalse(result["errors"])
+
+    def test_retries_exhausted(self):
+        self.rejections = {"1": 5}
+        conn = self.make_conn(max_item_retries=2)
+        conn.index({"name": "Joe"}, "test-index", "test-type", "1", bulk=True)
+        self.assertRaises(BulkOperationException, conn.force_bulk)
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_retry_delay(self):
+        bulker = ListBulker(None, retry_backoff=1, max_retry_backoff=5)
+        for attempt in range(6):
+            self.assertTrue(0 <= bulker.get_retry_delay(attempt) <= min(5, 2 ** attempt))
+
+
+class AdaptiveBulkerTestCase(unittest.TestCase):
+    def test_aimd(self):
+        bulker = AdaptiveBulker(None, target_latency=0.5, min_batch_bytes=1000, max_batch_bytes=10000,
+                                increase_bytes=1000, max_bytes=4000)
+        self.assertEqual(bulker.update_size(0.1, 0.0), 5000)
+        self.assertEqual(bulker.update_size(0.1, 0.0), 6000)
+        self.assertEqual(bulker.update_size(0.8, 0.0), 3000)
+        self.assertEqual(bulker.update_size(0.1, 0.2), 1500)
+        self.assertEqual(bulker.update_size(0.1, 0.2), 1000)
+        for _ in range(20):
+            bulker.update_size(0.1, 0.0)
+        self.assertEqual(bulker.max_bytes, 10000)
+        self.assertEqual([entry["max_bytes"] for entry in bulker.get_history()[:3]], [5000, 6000, 3000])
+        self.assertEqual(bulker.update_size(0.1, 0.0, full=False), 10000)
+        self.assertEqual(bulker.update_size(0.8, 0.0, full=False), 5000)
+        self.assertRaises(ValueError, AdaptiveBulker, None, min_batch_bytes=10, max_batch_bytes=1)
+
+    def test_adapts_to_latency(self):
+        # the stand-in cluster indexes 50KB per second: the batches converge
+        # toward 5KB for a target of 0.1 seconds
+        def handler(method, path, body):
+            time.sleep(len(body) / 50000.0)
+            return bulk_handler(method, path, body)
+
+        server = StandInServer(handler).start()
+        try:
+            conn = ES(server.server, bulk_size=10000,
+                      bulker_class=functools.partial(AdaptiveBulker, target_latency=0.1, min_batch_bytes=1000,
+                                                     max_batch_bytes=20000, increase_bytes=1000))
+            for i in range(400):
+                conn.index({"name": "x" * 80}, "test-index", "test-type", i, bulk=True)
+            conn.force_bulk()
+        finally:
+            server.stop()
+        history = conn.bulker.get_history()
+        self.assertEqual(sum(entry["actions"] for entry in history), 400)
+        sizes = [entry["bytes"] for entry in history[len(history) // 2:]]
+        self.assertTrue(2000 < sum(sizes) / len(sizes) < 8000, sizes)
+
+
+    def test_forced_batches_dont_grow(self):
+        server = StandInServer(bulk_handler).start()
+        try:
+            conn = ES(server.server, bulk_size=10000,
+                      bulker_class=functools.partial(AdaptiveBulker, min_batch_bytes=1000, max_batch_bytes=20000,
+                                                     increase_bytes=1000))
+            for i in range(3):
+                conn.index({"name": "x" * 80}, "test-index", "test-type", i, bulk=True)
+            conn.force_bulk()
+            for i in range(30):
+                conn.index({"name": "x" * 80}, "test-index", "test-type", i, bulk=True)
+            conn.force_bulk()
+        finally:
+            server.stop()
+        history = conn.bulker.get_history()
+        # the forced batch leaves the size as it is, the full ones grow it
+        self.assertEqual([entry["max_bytes"] for entry in history], [1000, 2000, 3000, 3000])
+        self.assertEqual([entry["bytes"] for entry in history], [len(body) for method, path, body in server.requests])
+
+
+class ThreadedBulkerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.server = StandInServer(bulk_handler, delay=0.2).start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_background_send(self):
+        conn = ES(self.server.server, bulk_size=2, bulker_class=ThreadedBulker)
+        started = time.time()
+        for i in range(4):
+            self.assertIsNone(conn.index({"name": "Joe"}, "test-index", "test-type", i, bulk=True))
+        self.assertLess(time.time() - started, 0.15)
+        conn.index({"name": "Joe"}, "test-index", "test-type", 4, bulk=True)
+        self.assertTrue(conn.bulker)
+        self.assertEqual([item["index"]["_id"] for item in conn.force_bulk()["items"]], [4])
+        self.assertGreaterEqual(time.time() - started, 0.6)
+        self.assertFalse(conn.bulker)
+        self.assertEqual(len(self.server.requests), 3)
+        conn.bulker.close()
+
+    def test_force_bulk_results(self):
+        conn = ES(self.server.server, bulk_size=2,
+                  bulker_class=functools.partial(ThreadedBulker, workers=2, queue_size=4))
+        for i in range(5):
+            conn.bulker.add_action("index", {"_index": "test-index", "_type": "test-type", "_id": str(i)}, {})
+        result = conn.force_bulk()
+        self.assertEqual([item["index"]["_id"] for item in result["items"]], ["0", "1", "2", "3", "4"])
+        self.assertIsNone(conn.force_bulk())
+        conn.bulker.close()
+
+    def test_backpressure(self):
+        conn = ES(self.server.server, bulk_size=1,
+                  bulker_class=functools.partial(ThreadedBulker, workers=1, queue_size=1))
+        started = time.time()
+        for i in range(3):
+            conn.index({"name": "Joe"}, "test-index", "test-type", i, bulk=True)
+        self.assertGreaterEqual(time.time() - started, 0.15)
+        conn.bulker.close()
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_errors(self):
+        self.server.handler = lambda method, path, body: (500, {"error": "failure", "status": 500})
+        conn = ES(self.server.server, bulk_size=1, bulker_class=functools.partial(ThreadedBulker, workers=2))
+        conn.index({"name": "Joe"}, "test-index", "test-type", 1, bulk=True)
+        self.assertRaises(TransportError, conn.force_bulk)
+        self.assertIsNone(conn.force_bulk())
+
+    def test_item_failures(self):
+        self.server.handler = lambda method, path, body: (200, {"took": 1, "errors": True, "items": [
+            {"index": {"_index": "test-index", "_type": "test-type", "_id": "1", "status": 400, "error": "failure"}}]})
+        conn = ES(self.server.server, bulk_size=1, bulker_class=ThreadedBulker, raise_on_bulk_item_failure=True)
+        conn.index({"name": "Joe"}, "test-index", "test-type", 1, bulk=True)
+        self.assertRaises(BulkOperationException, conn.force_bulk)
+
+
+class ParallelBulkTestCase(unittest.TestCase):
+    def setUp(self):
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+        self.server = StandInServer(self.slow_bulk_handler).start()
+        self.conn = ES(self.server.server)
+
+    def tearDown(self):
+        self.server.stop()
+
+    def slow_bulk_handler(self, method, path, body):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(0.1)
+        with self.lock:
+            self.in_flight -= 1
+        return bulk_handler(method, path, body)
+
+    def test_serialize_action(self):
+        def serialize(action):
+            lines = serialize_action(action, self.conn.json_backend)
+            self.assertTrue(lines.endswith(b"\n"))
+            return [json.loads(line) for line in lines.decode("utf-8").splitlines()]
+
+        self.assertEqual(serialize({"_index": "test-index", "_type": "test-type", "_id": 1, "name": "Joe"}),
+                         [{"index": {"_index": "test-index", "_type": "test-type", "_id": 1}}, {"name": "Joe"}])
+        self.assertEqual(serialize({"_op_type": "delete", "_index": "test-index", "_id": 1}),
+                         [{"delete": {"_index": "test-index", "_id": 1}}])
+        self.assertEqual(serialize({"_op_type": "update", "_index": "test-index", "_id": 1, "doc": {"name": "Joe"}}),
+                         [{"update": {"_index": "test-index", "_id": 1}}, {"doc": {"name": "Joe"}}])
+        self.assertEqual(serialize(('{"index":{}}\n', '{"name":"Joe"}\n')), [{"index": {}}, {"name": "Joe"}])
+        # without _source the keys without underscore are fields of the document
+        self.assertEqual(serialize({"_index": "test-index", "_id": 1, "title": "x", "version": 3, "routing": "a"}),
+                         [{"index": {"_index": "test-index", "_id": 1}}, {"title": "x", "version": 3, "routing": "a"}])
+        self.assertEqual(serialize({"_index": "test-index", "_id": 1, "version": 3, "_source": {"title": "x"}}),
+                         [{"index": {"_index": "test-index", "_id": 1, "version": 3}}, {"title": "x"}])
+
+    def test_parallel_bulk(self):
+        actions = [{"_index": "test-index", "_type": "test-type", "_id": i, "_source": {"position": i}}
+                   for i in range(40)]
+        started = time.time()
+        results = list(parallel_bulk(self.conn, iter(actions), workers=4, chunk_size=5))
+        self.assertLess(time.time() - started, 0.6)
+        self.assertEqual(len(self.server.requests), 8)
+        self.assertEqual(self.max_in_flight, 4)
+        self.assertEqual([item["index"]["_id"] for ok, item in results], list(range(40)))
+        self.assertTrue(all(ok for ok, item in results))
+
+    def test_chunk_bytes(self):
+        actions = [('{"index":{"_index":"test-index","_type":"test-type","_id":"%d"}}\n' % i,
+                    '{"name":"%s"}\n' % ("x" * 100)) for i in range(10)]
+        results = list(parallel_bulk(self.conn, actions, workers=2, chunk_bytes=500))
+        self.assertEqual([item["index"]["_id"] for ok, item in results], [str(i) for i in range(10)])
+        for request in self.server.requests:
+            self.assertLessEqual(len(request[2]), 500)
+
+    def test_process_bulk(self):
+        actions = [{"_index": "test-index", "_type": "test-type", "_id": i, "_source": {"name": u"Joe %d àè" % i}}
+                   for i in range(25)]
+        results = list(process_bulk(self.conn, actions, processes=2, workers=2, chunk_size=10))
+        self.assertEqual([item["index"]["_id"] for ok, item in results], list(range(25)))
+        self.assertEqual(len(self.server.requests), 3)
+        expected = b"".join(serialize_action(action, self.conn.json_backend) for action in actions)
+        self.assertEqual(b"".join(request[2] for request in sorted(
+            self.server.requests, key=lambda request: json.loads(request[2].split(b"\n")[0])["index"]["_id"])),
+            expected)
+
+
+class CoalescingBulkerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.server = StandInServer(bulk_handler).start()
+        self.conn = ES(self.server.server, bulk_size=100, bulker_class=CoalescingBulker)
+
+    def tearDown(self):
+        self.server.stop()
+
+    def sent_actions(self):
+        lines = [json.loads(line) for line in self.server.requests[-1][2].decode("utf-8").splitlines() if line]
+        return lines
+
+    def test_latest_wins(self):
+        results = []
+        self.conn.index({"name": "Joe", "age": 1}, "test-index", "test-type", 1, bulk=True,
+                        callback=lambda ok, item: results.append(item))
+        self.conn.index({"name": "Bill"}, "test-index", "test-type", 2, bulk=True)
+        self.conn.index({"name": "Joe", "age": 2}, "test-index", "test-type", 1, bulk=True,
+                        callback=lambda ok, item: results.append(item))
+        self.conn.delete("test-index", "test-type", 2, bulk=True)
+        self.conn.index({"name": "Joe"}, "test-index", "test-type", 1, bulk=True, querystring_args={"routing": "x"})
+        self.assertEqual(self.conn.bulker.get_stats(), {"actions": 5, "dropped": 2})
+        self.conn.force_bulk()
+        self.assertEqual(self.sent_actions(), [
+            {"index": {"_index": "test-index", "_type": "test-type", "_id": 1}}, {"name": "Joe", "age": 2},
+            {"delete": {"_index": "test-index", "_type": "test-type", "_id": 2}},
+            {"index": {"_index": "test-index", "_type": "test-type", "_id": 1, "_routing": "x"}}, {"name": "Joe"}])
+        self.assertEqual(len(results), 2)
+        self.assertEqual(results[0], results[1])
+
+    def test_merge_updates(self):
+        self.conn.update("test-index", "test-type", 1, document={"name": "Joe", "address": {"city": "Rome"}},
+                         bulk=True)
+        self.conn.update("test-index", "test-type", 1, document={"address": {"zip": "00100"}}, bulk=True)
+        self.conn.update("test-index", "test-type", 1, script="ctx._source.age += 1", bulk=True)
+        self.conn.update("test-index", "test-type", 1, document={"age": 3}, bulk=True)
+        self.conn.force_bulk()
+        self.assertEqual(self.sent_actions(), [
+            {"update": {"_index": "test-index", "_type": "test-type", "_id": 1}},
+            {"doc": {"name": "Joe", "address": {"city": "Rome", "zip": "00100"}}},
+            {"update": {"_index": "test-index", "_type": "test-type", "_id": 1}},
+            {"script": "ctx._source.age += 1", "lang": "groovy"},
+            {"update": {"_index": "test-index", "_type": "test-type", "_id": 1}}, {"doc": {"age": 3}}])
+        self.assertEqual(self.conn.bulker.get_stats()["dropped"], 1)
+
+    def test_barriers(self):
+        self.conn.index({"name": "Joe"}, "test-index", "test-type", 1, bulk=True)
+        self.conn.index({"name": "Joe"}, "test-index", "test-type", 1, bulk=True, force_insert=True)
+        self.conn.index({"name": "Bill"}, "test-index", "test-type", 1, bulk=True)
+        self.conn.force_bulk()
+        self.assertEqual(len(self.sent_actions()), 6)
+        self.conn.index({"name": "Joe"}, "test-index", "test-type", 1, bulk=True)
+        self.conn.force_bulk()
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_raw_barrier(self):
+        self.conn.index({"name": "Joe", "age": 1}, "test-index", "test-type", 1, bulk=True)
+        self.conn.index_raw_bulk('{"delete":{"_index":"test-index","_type":"test-type","_id":1}}\n', "")
+        self.conn.index({"name": "Joe", "age": 2}, "test-index", "test-type", 1, bulk=True)
+        self.assertEqual(self.conn.bulker.get_stats(), {"actions": 3, "dropped": 0})
+        self.conn.force_bulk()
+        self.assertEqual(self.sent_actions(), [
+            {"index": {"_index": "test-index", "_type": "test-type", "_id": 1}}, {"name": "Joe", "age": 1},
+            {"delete": {"_index": "test-index", "_type": "test-type", "_id": 1}},
+            {"index": {"_index": "test-index", "_type": "test-type", "_id": 1}}, {"name": "Joe", "age": 2}])
+        self.assertEqual(self.conn.bulker.get_stats()["dropped"], 0)
+
+
+class SpillBulkerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.failing = False
+        self.server = StandInServer(self.handler).start()
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.directory)
+
+    def handler(self, method, path, body):
+        if self.failing:
+            return 500, {"error": "down"}
+        return bulk_handler(method, path, body)
+
+    def connect(self, **kwargs):
+        return ES(self.server.server, bulk_size=3,
+                  bulker_class=functools.partial(SpillBulker, directory=self.directory, retry_backoff=0, **kwargs))
+
+    def segments(self):
+        return sorted(name for name in os.listdir(self.directory) if name.endswith(".bulk"))
+
+    def index(self, conn, ids):
+        for i in ids:
+            conn.index({"position": i}, "test-index", "test-type", i, bulk=True)
+
+    def sent_ids(self):
+        return [json.loads(line)["index"]["_id"] for request in self.server.requests
+                for line in request[2].decode("utf-8").splitlines() if line.startswith('{"index"')]
+
+    def test_send_and_truncate(self):
+        conn = self.connect()
+        self.index(conn, range(4))
+        self.assertEqual(self.sent_ids(), [0, 1, 2])
+        self.assertEqual(len(self.segments()), 1)
+        conn.force_bulk()
+        self.assertEqual(self.sent_ids(), [0, 1, 2, 3])
+        self.assertEqual(self.segments(), [])
+
+    def test_replay(self):
+        self.failing = True
+        conn = self.connect(max_memory_bytes=0)
+        self.index(conn, range(7))
+        self.assertEqual(conn.bulker.get_stats(), {"segments": 2, "actions": 1, "memory_bytes": conn.bulker.bulk_bytes})
+        conn.bulker.close()
+        # a crash while writing an action
+        with open(os.path.join(self.directory, self.segments()[-1]), "ab") as segment:
+            segment.write(b'{"index":{"_index":"test-index"')
+        self.assertEqual(len(self.segments()), 3)
+        self.failing = False
+        self.server.requests = []
+        conn = self.connect()
+        self.index(conn, [7])
+        conn.force_bulk()
+        self.assertEqual(self.sent_ids(), list(range(8)))
+        self.assertEqual(self.segments(), [])
+
+    def test_failed_send(self):
+        self.failing = True
+        conn = self.connect()
+        results = []
+        for i in range(4):
+            conn.index({"position": i}, "test-index", "test-type", i, bulk=True,
+                       callback=lambda ok, item: results.append(ok))
+        self.assertEqual(len(self.segments()), 2)
+        self.assertEqual(results, [])
+        self.assertRaises(TransportError, conn.force_bulk)
+        self.assertEqual(results, [])
+        self.failing = False
+        conn.force_bulk()
+        self.assertEqual(results, [True] * 4)
+        self.assertEqual(self.segments(), [])
+
+    def test_requires_directory(self):
+        self.assertRaises(ValueError, SpillBulker, None)
+
+
+class UpdateByFunctionBatchTestCase(unittest.TestCase):
+    def setUp(self):
+        self.documents = dict((str(i), [1, {"name": "doc %d" % i, "counter": 0}]) for i in range(10))
+        # a concurrent writer changes the documents 3 and 7 once
+        self.conflicts = set(["3", "7"])
+        self.server = StandInServer(self.handler).start()
+        self.conn = ES(self.server.server)
+
+    def tearDown(self):
+        self.server.stop()
+
+    def handler(self, method, path, body):
+        if path.startswith("/_mget"):
+            docs = []
+            for doc in json.loads(body.decode("utf-8"))["docs"]:
+                meta = {"_index": doc["_index"], "_type": doc["_type"], "_id": doc["_id"]}
+                if doc["_id"] == "broken":
+                    docs.append(dict(meta, error={"type": "shard_not_available_exception",
+                                                  "reason": "no shard available"}))
+                elif doc["_id"] in self.documents:
+                    version, source = self.documents[doc["_id"]]
+                    docs.append(dict(meta, found=True, _version=version, _source=source))
+                else:
+                    docs.append(dict(meta, found=False))
+            return 200, {"docs": docs}
+        lines = [json.loads(line) for line in body.decode("utf-8").splitlines() if line]
+        items = []
+        for header, document in zip(lines[::2], lines[1::2]):
+            meta = header["index"]
+            if meta["_id"] in self.conflicts:
+                self.conflicts.remove(meta["_id"])
+                self.documents[meta["_id"]][0] += 1
+                self.documents[meta["_id"]][1]["counter"] += 10
+            version = self.documents[meta["_id"]][0]
+            if meta["_version"] != version:
+                items.append({"index": dict(meta, status=409, error="version conflict")})
+            else:
+                self.documents[meta["_id"]] = [version + 1, document]
+                items.append({"index": dict(meta, _version=version + 1, status=200)})
+        return 200, {"took": 1, "errors": False, "items": items}
+
+    def test_update_by_function_batch(self):
+        def increment(current, extra):
+            current["counter"] += extra["counter"]
+
+        ids = [str(i) for i in range(10)] + ["missing"]
+        result = self.conn.update_by_function_batch([(id, {"counter": 1}) for id in ids], "test-index", "test-type",
+                                                    update_func=increment, chunk_size=4)
+        self.assertEqual([item["index"]["_id"] for item in result["items"]], ids)
+        self.assertEqual([item["index"]["status"] for item in result["items"]], [200] * 10 + [404])
+        self.assertTrue(result["errors"])
+        self.assertEqual(self.documents["3"], [3, {"name": "doc 3", "counter": 11}])
+        self.assertEqual(self.documents["4"], [2, {"name": "doc 4", "counter": 1}])
+        mgets = [body for method, path, body in self.server.requests if path.startswith("/_mget")]
+        # 3 chunks, and the documents 3 and 7 retrieved again
+        self.assertEqual(len(mgets), 5)
+        self.assertEqual(len(json.loads(mgets[1].decode("utf-8"))["docs"]), 1)
+
+    def test_read_errors(self):
+        result = self.conn.update_by_function_batch({"1": {"counter": 1}, "broken": {"counter": 1}},
+                                                    "test-index", "test-type")
+        items = dict((item["index"]["_id"], item["index"]) for item in result["items"])
+        self.assertEqual(items["1"]["status"], 200)
+        self.assertEqual(items["broken"]["status"], 500)
+        self.assertEqual(items["broken"]["error"]["type"], "shard_not_available_exception")
+        bulks = [body for method, path, body in self.server.requests if path.startswith("/_bulk")]
+        self.assertNotIn(b"broken", bulks[0])
+
+    def test_async_es(self):
+        async def run():
+            conn = AsyncES(self.server.server)
+            result = await conn.update_by_function_batch([(str(i), {"counter": 1}) for i in range(5)],
+                                                         "test-index", "test-type", chunk_size=2)
+            await conn.close()
+            return result
+
+        loop = asyncio.new_event_loop()
+        try:
+            result = loop.run_until_complete(run())
+        finally:
+            loop.close()
+        self.assertEqual([item["index"]["status"] for item in result["items"]], [200] * 5)
+        self.assertEqual(self.documents["3"], [3, {"name": "doc 3", "counter": 1}])
+
+    def test_conflicts_exhausted(self):
+        self.conflicts = set(["1"])
+        result = self.conn.update_by_function_batch({"1": {"counter": 1}}, "test-index", "test-type", attempts=1)
+        self.assertEqual(result["items"][0]["index"]["status"], 409)
+
+
+class BulkFromFileTestCase(unittest.TestCase):
+    def setUp(self):
+        self.server = StandInServer(bulk_handler).start()
+        self.conn = ES(self.server.server)
+        self.directory = tempfile.mkdtemp()
+        self.lines = []
+        for i in range(30):
+            if i % 3 == 2:
+                self.lines.append('{"delete":{"_index":"test-index","_type":"test-type","_id":"%d"}}\n' % i)
+            else:
+                self.lines.append('{"index":{"_index":"test-index","_type":"test-type","_id":"%d"}}\n'
+                                  '{"name":"%s"}\n' % (i, "x" * 50))
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.directory)
+
+    def write(self, name, opener=open):
+        path = os.path.join(self.directory, name)
+        with opener(path, "wb") as fileobj:
+            fileobj.write("".join(self.lines).encode("utf-8"))
+        return path
+
+    def check_requests(self, chunk_bytes):
+        for request in self.server.requests:
+            self.assertLessEqual(len(request[2]), chunk_bytes)
+            self.assertTrue(request[2].endswith(b"\n"))
+        # with several workers the bulks can arrive in any order
+        bodies = sorted((request[2] for request in self.server.requests),
+                        key=lambda body: int(json.loads(body.split(b"\n")[0]).popitem()[1]["_id"]))
+        self.assertEqual(b"".join(bodies), "".join(self.lines).encode("utf-8"))
+
+    def test_bulk_from_file(self):
+        progress = []
+        stats = self.conn.bulk_from_file(self.write("actions.json"), chunk_bytes=400, progress=progress.append)
+        self.assertEqual((stats["actions"], stats["errors"], stats["bytes"]), (30, 0, len("".join(self.lines))))
+        self.assertEqual(len(progress), len(self.server.requests))
+        self.assertEqual([p["actions"] for p in progress][-1], 30)
+        self.assertTrue(progress[-1]["actions_per_second"] > 0)
+        self.check_requests(400)
+
+    def test_gzip(self):
+        stats = self.conn.bulk_from_file(self.write("actions.json.gz", gzip.open), chunk_bytes=400, workers=2)
+        self.assertEqual(stats["actions"], 30)
+        self.check_requests(400)
+
+    def test_slices(self):
+        self.lines[10] = "\n" + self.lines[10]
+        self.lines[-1] = self.lines[-1].rstrip("\n")
+        stats = self.conn.bulk_from_file(self.write("actions.json"), chunk_size=4, chunk_bytes=10000)
+        self.assertEqual(stats["actions"], 30)
+        bodies = [request[2] for request in self.server.requests]
+        self.assertEqual([len([line for line in body.splitlines() if b"_index" in line]) for body in bodies],
+                         [4, 4, 2, 4, 4, 4, 4, 4])
+        self.assertEqual(b"".join(bodies), "".join(self.lines).replace("\n\n", "\n").encode("utf-8") + b"\n")
+
+    def test_empty_file(self):
+        self.lines = []
+        self.assertEqual(self.conn.bulk_from_file(self.write("empty.json"))["actions"], 0)
+        self.assertEqual(self.server.requests, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
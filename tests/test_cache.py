@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+import asyncio
+import time
+import unittest
+from pyes.tests import StandInServer
+from pyes.es import ES
+from pyes.es_async import AsyncES
+from pyes.cache import SearchCache, path_indices
+from pyes.query import MatchAllQuery, TermQuery
+
+
+def search_handler(method, path, body):
+    if path.startswith("/_bulk"):
+        return 200, {"took": 1, "errors": False, "items": [
+            {"index": {"_index": "other-index", "_type": "test-type", "_id": "1", "status": 201}}]}
+    if "_count" in path:
+        return 200, {"count": 1}
+    if "_search" in path:
+        return 200, {"took": 1, "hits": {"total": 1, "max_score": 1.0, "hits": [
+            {"_index": "test-index", "_type": "test-type", "_id": "1", "_score": 1.0,
+             "_source": {"name": "Joe Tester"}}]}}
+    if "_cluster" in path:
+        return 200, {"status": "green"}
+    return 200, {"_index": "test-index", "_type": "test-type", "_id": "1", "created": True}
+
+
+class ScrollHandler(object):
+    """
+    Open a new scroll for every scan search, that returns its hits once
+    """
+
+    def __init__(self):
+        self.scrolls = []
+
+    def __call__(self, method, path, body):
+        if path.startswith("/_search/scroll"):
+            scroll_id = body.decode("utf-8").strip('"')
+            hits = []
+            if scroll_id in self.scrolls:
+                self.scrolls.remove(scroll_id)
+                hits = [{"_index": "test-index", "_type": "test-type", "_id": str(i), "_score": 1.0,
+                         "_source": {"name": "Joe Tester"}} for i in range(2)]
+            return 200, {"_scroll_id": scroll_id, "hits": {"total": 2, "max_score": 1.0, "hits": hits}}
+        scroll_id = "scroll-%d" % len(self.scrolls)
+        self.scrolls.append(scroll_id)
+        return 200, {"_scroll_id": scroll_id, "hits": {"total": 2, "max_score": 1.0, "hits": []}}
+
+
+class SearchCacheTestCase(unittest.TestCase):
+    def test_path_indices(self):
+        self.assertEqual(path_indices("/test-index,other-index/test-type/_search"), ("test-index", "other-index"))
+        self.assertEqual(path_indices("/_search"), ("_all",))
+        self.assertEqual(path_indices("/_all/_count"), ("_all",))
+
+    def test_lru(self):
+        cache = SearchCache(max_entries=2)
+        cache.put("a", b"a", ("test-index",), 1)
+        cache.put("b", b"b", ("test-index",), 1)
+        self.assertEqual(cache.get("a"), b"a")
+        cache.put("c", b"c", ("test-index",), 1)
+        self.assertEqual(cache.get("b"), None)
+        self.assertEqual(cache.get("a"), b"a")
+        self.assertEqual(cache.get_stats()["evictions"], 1)
+
+    def test_max_bytes(self):
+        cache = SearchCache(max_bytes=1000)
+        cache.put("big", b"", ("test-index",), 2000)
+        self.assertEqual(len(cache), 0)
+        for key in "abcde":
+            cache.put(key, key, ("test-index",), 100)
+        self.assertEqual(len(cache), 2)
+        self.assertLessEqual(cache.get_stats()["bytes"], 1000)
+        self.assertEqual(cache.get("e"), "e")
+
+    def test_ttl(self):
+        cache = SearchCache(ttl=0.05)
+        cache.put("a", b"a", ("test-index",), 1)
+        self.assertEqual(cache.get("a"), b"a")
+        time.sleep(0.1)
+        self.assertEqual(cache.get("a"), None)
+        self.assertEqual(cache.get_stats(), {"hits": 1, "misses": 1, "evictions": 0, "invalidations": 0,
+                                             "entries": 0, "bytes": 0})
+
+    def test_invalidate(self):
+        cache = SearchCache()
+        cache.put("test", b"", ("test-index",), 1)
+        cache.put("other", b"", ("other-index",), 1)
+        cache.put("all", b"", ("_all",), 1)
+        cache.put("wildcard", b"", ("test-*",), 1)
+        cache.invalidate("test-index")
+        self.assertEqual(cache.get("other"), b"")
+        for key in ("test", "all", "wildcard"):
+            self.assertEqual(cache.get(key), None)
+        cache.invalidate()
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.get_stats()["invalidations"], 4)
+
+
+class CachedSearchTestCase(unittest.TestCase):
+    def setUp(self):
+        self.server = StandInServer(search_handler).start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def count_requests(self, part):
+        return len([request for request in self.server.requests if part in request[1]])
+
+    def test_search_raw(self):
+        conn = ES(self.server.server, search_cache=SearchCache())
+        for _ in range(3):
+            result = conn.search_raw(TermQuery("name", "joe"), indices="test-index")
+            self.assertEqual(result.hits.total, 1)
+        result.hits.total = 2
+        self.assertEqual(conn.search_raw(TermQuery("name", "joe"), indices="test-index").hits.total, 1)
+        conn.search_raw(TermQuery("name", "joe"), indices="test-index", size=1)
+        self.assertEqual(self.count_requests("_search"), 2)
+        for _ in range(3):
+            self.assertEqual(conn.count(MatchAllQuery(), indices="test-index").count, 1)
+        self.assertEqual(self.count_requests("_count"), 1)
+        stats = conn.search_cache.get_stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["entries"]), (5, 3, 3))
+
+    def test_invalidation(self):
+        conn = ES(self.server.server, search_cache=SearchCache())
+        search = lambda: conn.search_raw(TermQuery("name", "joe"), indices="test-index")
+        search()
+        conn.index({"name": "Joe"}, "test-index", "test-type", 1)
+        search()
+        conn.index({"name": "Joe"}, "other-index", "test-type", 1)
+        search()
+        self.assertEqual(self.count_requests("_search"), 2)
+        conn.delete("test-index", "test-type", 1)
+        search()
+        conn.indices.refresh("test-index")
+        search()
+        self.assertEqual(self.count_requests("_search"), 4)
+
+    def test_bulk_invalidation(self):
+        conn = ES(self.server.server, search_cache=SearchCache())
+        search = lambda: conn.search_raw(TermQuery("name", "joe"), indices="other-index")
+        search()
+        conn.index({"name": "Joe"}, "other-index", "test-type", 1, bulk=True)
+        search()
+        self.assertEqual(self.count_requests("_search"), 1)
+        conn.force_bulk()
+        search()
+        self.assertEqual(self.count_requests("_search"), 2)
+
+    def test_scan_not_cached(self):
+        self.server.handler = ScrollHandler()
+        conn = ES(self.server.server, search_cache=SearchCache())
+        for _ in range(2):
+            results = conn.search(MatchAllQuery(), indices="test-index", scan=True)
+            self.assertEqual([hit.get_id() for hit in results], ["0", "1"])
+        self.assertEqual(self.count_requests("search_type=scan"), 2)
+        self.assertEqual(len(conn.search_cache), 0)
+
+    def test_async_es(self):
+        async def run():
+            conn = AsyncES(self.server.server, search_cache=SearchCache())
+            for _ in range(3):
+                await conn.search_raw(TermQuery("name", "joe"), indices="test-index")
+            await conn.index({"name": "Joe"}, "test-index", "test-type", 1)
+            await conn.search_raw(TermQuery("name", "joe"), indices="test-index")
+            await conn.close()
+
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(run())
+        finally:
+            loop.close()
+        self.assertEqual(self.count_requests("_search"), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+import asyncio
+import threading
+import unittest
+from pyes.tests import StandInServer
+from pyes.es import ES
+from pyes.es_async import AsyncES
+from pyes.exceptions import NotFoundException
+from pyes.coalescing import request_key
+
+
+def document_handler(method, path, body):
+    if path.startswith("/missing-index"):
+        return 404, {"_index": "missing-index", "_type": "test-type", "_id": "1", "found": False}
+    if "_search" in path:
+        return 200, {"took": 1, "hits": {"total": 1, "max_score": 1.0, "hits": [
+            {"_index": "test-index", "_type": "test-type", "_id": "1", "_score": 1.0,
+             "_source": {"name": "Joe Tester"}}]}}
+    return 200, {"_index": "test-index", "_type": "test-type", "_id": "1", "found": True,
+                 "_source": {"name": "Joe Tester", "tags": ["a", "b"]}}
+
+
+class RequestKeyTestCase(unittest.TestCase):
+    def test_canonical_body(self):
+        first = request_key("GET", "/_search", {"size": "10"}, b'{"query": {"match_all": {}}, "size": 1}')
+        second = request_key("GET", "/_search", {"size": "10"}, b'{"size":1,"query":{"match_all":{}}}')
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, request_key("GET", "/_search", {"size": "20"},
+                                               b'{"size":1,"query":{"match_all":{}}}'))
+        self.assertEqual(request_key("GET", "/_search", {}, b"not json")[3], b"not json")
+
+
+class CoalescingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.server = StandInServer(document_handler, delay=0.2).start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def run_threads(self, function, number=10):
+        results = [None] * number
+
+        def run(position):
+            try:
+                results[position] = function()
+            except Exception as e:
+                results[position] = e
+
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(number)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_concurrent_gets(self):
+        conn = ES(self.server.server, coalesce_reads=True)
+        results = self.run_threads(lambda: conn.get("test-index", "test-type", 1))
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual([result.name for result in results], ["Joe Tester"] * 10)
+        self.assertEqual(conn.single_flight.get_stats(), {"calls": 1, "shared": 9})
+        results[0].tags.append("c")
+        results[0].name = "Changed"
+        self.assertEqual(results[1].name, "Joe Tester")
+        self.assertEqual(results[1].tags, ["a", "b"])
+
+    def test_concurrent_searches(self):
+        conn = ES(self.server.server, coalesce_reads=True)
+        queries = [{"query": {"match_all": {}}, "size": 1}, {"size": 1, "query": {"match_all": {}}}] * 3
+        results = self.run_threads(lambda: conn.search_raw(queries.pop(), indices="test-index"), 6)
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(len(set(id(result) for result in results)), 6)
+        self.assertEqual(set(result.hits.total for result in results), set([1]))
+
+    def test_errors(self):
+        conn = ES(self.server.server, coalesce_reads=True)
+        results = self.run_threads(lambda: conn.get("missing-index", "test-type", 1), 4)
+        self.assertEqual(len(self.server.requests), 1)
+        for result in results:
+            self.assertTrue(isinstance(result, NotFoundException))
+
+    def test_not_coalesced(self):
+        conn = ES(self.server.server)
+        self.run_threads(lambda: conn.get("test-index", "test-type", 1), 4)
+        self.assertEqual(len(self.server.requests), 4)
+        conn = ES(self.server.server, coalesce_reads=True)
+        self.run_threads(lambda: conn.index({"name": "Joe"}, "test-index", "test-type", 1), 4)
+        self.assertEqual(len(self.server.requests), 8)
+        for _ in range(2):
+            conn.get("test-index", "test-type", 1)
+        self.assertEqual(len(self.server.requests), 10)
+
+    def test_scroll_not_coalesced(self):
+        conn = ES(self.server.server, coalesce_reads=True)
+        self.run_threads(lambda: conn.search_raw({"query": {"match_all": {}}}, indices="test-index",
+                                                 scroll="1m"), 4)
+        self.assertEqual(len(self.server.requests), 4)
+        self.assertEqual(conn.single_flight.get_stats(), {"calls": 0, "shared": 0})
+
+    def test_async_es(self):
+        async def run():
+            conn = AsyncES(self.server.server, coalesce_reads=True)
+            results = await asyncio.gather(*[conn.get("test-index", "test-type", 1) for _ in range(10)])
+            await conn.get("test-index", "test-type", 1)
+            await conn.close()
+            return conn, results
+
+        loop = asyncio.new_event_loop()
+        try:
+            conn, results = loop.run_until_complete(run())
+        finally:
+            loop.close()
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertEqual(conn.single_flight.get_stats(), {"calls": 2, "shared": 9})
+        results[0].name = "Changed"
+        self.assertEqual(results[1].name, "Joe Tester")
+
+
+if __name__ == "__main__":
+    unittest.main()
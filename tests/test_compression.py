@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+import asyncio
+import json
+import unittest
+from pyes.tests import StandInServer
+from pyes.compression import Compression, gzip_compress, gzip_decompress
+from pyes.es import ES
+from pyes.es_async import AsyncES
+from pyes.query import MatchAllQuery
+
+
+def handler(method, path, body):
+    if path.startswith("/_bulk"):
+        lines = [line for line in body.splitlines() if line]
+        return 200, {"took": 1, "errors": False, "items": [
+            {"index": {"_index": "test-index", "_type": "test-type", "_id": str(i), "status": 201}}
+            for i in range(len(lines) // 2)]}
+    return 200, {"took": 1, "hits": {"total": 1, "max_score": 1.0, "hits": [
+        {"_index": "test-index", "_type": "test-type", "_id": "1", "_score": 1.0,
+         "_source": {"text": u"àèìòù " * 200}}]}}
+
+
+class CompressionTestCase(unittest.TestCase):
+    def setUp(self):
+        self.server = StandInServer(handler, compress_responses=True).start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_gzip(self):
+        data = b'{"name": "Joe"}\n' * 100
+        self.assertEqual(gzip_decompress(gzip_compress(data, level=1)), data)
+        self.assertEqual(gzip_decompress(gzip_compress(memoryview(data))), data)
+        self.assertRaises(ValueError, Compression, level=0)
+
+    def test_threshold(self):
+        compression = Compression(min_bytes=100)
+        self.assertEqual(compression.encode_request(b"{}"), (b"{}", {"accept-encoding": "gzip"}))
+        body, headers = compression.encode_request(b"{}" * 100)
+        self.assertEqual(headers, {"accept-encoding": "gzip", "content-encoding": "gzip"})
+        self.assertEqual(gzip_decompress(body), b"{}" * 100)
+        self.assertEqual(compression.get_stats(), {"compressed": 1, "bytes": 200, "compressed_bytes": len(body)})
+
+    def test_bulk(self):
+        conn = ES(self.server.server, bulk_size=100, compression=Compression(min_bytes=1024))
+        for i in range(100):
+            conn.index({"text": u"lorem ipsum dolor sit amet %d" % i}, "test-index", "test-type", i, bulk=True)
+        body = self.server.requests[-1][2]
+        self.assertEqual(len([line for line in body.splitlines() if line]), 200)
+        self.assertEqual(json.loads(body.splitlines()[1].decode("utf-8")), {"text": u"lorem ipsum dolor sit amet 0"})
+        self.assertLess(self.server.received_bytes * 4, len(body))
+        self.assertEqual(conn.compression.get_stats()["bytes"], len(body))
+
+    def test_responses(self):
+        conn = ES(self.server.server, compression=Compression())
+        result = conn.search_raw(MatchAllQuery(), indices="test-index")
+        self.assertEqual(result.hits.hits[0]._source.text, u"àèìòù " * 200)
+        # a small body is sent as it is
+        self.assertEqual(self.server.received_bytes, len(self.server.requests[-1][2]))
+        hits = list(conn.search_raw_stream(MatchAllQuery(), indices="test-index"))
+        self.assertEqual(hits[0]["_source"]["text"], u"àèìòù " * 200)
+
+    def test_async_es(self):
+        compression = Compression(min_bytes=10)
+
+        async def run():
+            conn = AsyncES(self.server.server, compression=compression)
+            result = await conn.search_raw(MatchAllQuery(), indices="test-index")
+            await conn.close()
+            return result
+
+        loop = asyncio.new_event_loop()
+        try:
+            result = loop.run_until_complete(run())
+        finally:
+            loop.close()
+        self.assertEqual(result.hits.hits[0]._source.text, u"àèìòù " * 200)
+        self.assertEqual(compression.get_stats()["compressed"], 1)
+        self.assertEqual(json.loads(self.server.requests[-1][2].decode("utf-8")), {"query": {"match_all": {}}})
+
+
+if __name__ == "__main__":
+    unittest.main()
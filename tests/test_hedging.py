@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+import asyncio
+import threading
+import time
+import unittest
+from pyes.tests import StandInServer
+from pyes.es import ES
+from pyes.es_async import AsyncES
+from pyes.hedging import HedgePolicy
+
+
+def document_handler(method, path, body):
+    if path.startswith("/_mget"):
+        return 200, {"docs": [{"_index": "test-index", "_type": "test-type", "_id": "1", "found": True,
+                               "_source": {"name": "Joe Tester"}}]}
+    if path.startswith("/test-index/_count"):
+        return 200, {"count": 12}
+    return 200, {"_index": "test-index", "_type": "test-type", "_id": "1", "found": True,
+                 "_source": {"name": "Joe Tester"}}
+
+
+class HedgePolicyTestCase(unittest.TestCase):
+    def test_delay(self):
+        policy = HedgePolicy(min_samples=10, default_delay=0.5)
+        self.assertEqual(policy.get_delay("node"), 0.5)
+        for i in range(100):
+            policy.record_latency("node", i / 1000.0)
+        self.assertAlmostEqual(policy.get_delay("node"), 0.094)
+        self.assertEqual(HedgePolicy(delay=0.2).get_delay("node"), 0.2)
+
+    def test_budget(self):
+        policy = HedgePolicy(budget=0.25, burst=2)
+        policy.add_read()
+        self.assertTrue(policy.acquire())
+        self.assertFalse(policy.acquire())
+        for _ in range(20):
+            policy.add_read()
+        self.assertTrue(policy.acquire())
+        self.assertTrue(policy.acquire())
+        self.assertFalse(policy.acquire())
+        self.assertEqual(policy.get_stats(), {"reads": 21, "hedged": 3, "won": 0, "over_budget": 2})
+
+
+class HedgedReadsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.fast = StandInServer(document_handler).start()
+        self.slow = StandInServer(document_handler, delay=0.5).start()
+
+    def tearDown(self):
+        self.fast.stop()
+        self.slow.stop()
+
+    def check_stats(self, stats, reads):
+        self.assertEqual(stats["reads"], reads)
+        self.assertGreater(len(self.slow.requests), 0)
+        self.assertEqual(stats["hedged"], len(self.slow.requests))
+        self.assertEqual(stats["won"], stats["hedged"])
+        self.assertEqual(len(self.fast.requests), reads + stats["hedged"] - len(self.slow.requests))
+
+    def test_hedged_reads(self):
+        policy = HedgePolicy(delay=0.05, budget=1, burst=20)
+        conn = ES([self.fast.server, self.slow.server], hedge_policy=policy)
+        for _ in range(10):
+            started = time.time()
+            self.assertEqual(conn.get("test-index", "test-type", 1).name, "Joe Tester")
+            self.assertLess(time.time() - started, 0.4)
+        self.assertEqual(conn.mget(["1"], "test-index", "test-type")[0].name, "Joe Tester")
+        self.assertEqual(conn.count(indices="test-index").count, 12)
+        self.check_stats(policy.get_stats(), 12)
+
+    def test_budget(self):
+        policy = HedgePolicy(delay=0.05, budget=0, burst=1)
+        conn = ES([self.fast.server, self.slow.server], hedge_policy=policy)
+        for _ in range(8):
+            conn.get("test-index", "test-type", 1)
+        stats = policy.get_stats()
+        self.assertLessEqual(stats["hedged"], 1)
+        self.assertEqual(stats["over_budget"] + stats["hedged"], len(self.slow.requests))
+
+    def test_threads(self):
+        policy = HedgePolicy(delay=0.05, budget=0, burst=0)
+        conn = ES([self.fast.server, self.slow.server], hedge_policy=policy)
+        threads = []
+        send_attempt = conn._send_attempt
+
+        def record_thread(*args):
+            threads.append(threading.current_thread())
+            return send_attempt(*args)
+
+        conn._send_attempt = record_thread
+        # without budget the reads are sent on the calling thread
+        for _ in range(4):
+            conn.get("test-index", "test-type", 1)
+        self.assertEqual(threads, [threading.current_thread()] * 4)
+        self.assertIsNone(conn._hedge_executor)
+        self.assertEqual(policy.get_stats()["over_budget"], len(self.slow.requests))
+        # else on a shared pool
+        del threads[:]
+        policy.budget, policy.burst = 1, 20
+        for _ in range(20):
+            conn.get("test-index", "test-type", 1)
+        self.assertNotIn(threading.current_thread(), threads)
+        self.assertLessEqual(len(set(threads)), ES.HEDGE_WORKERS)
+
+    def test_not_hedged(self):
+        policy = HedgePolicy(delay=0.05)
+        conn = ES([self.fast.server, self.slow.server], hedge_policy=policy)
+        conn.index({"name": "Joe"}, "test-index", "test-type", 1)
+        self.assertEqual(policy.get_stats()["reads"], 0)
+
+    def test_async_hedged_reads(self):
+        policy = HedgePolicy(delay=0.05, budget=1, burst=20)
+
+        async def run():
+            conn = AsyncES([self.fast.server, self.slow.server], hedge_policy=policy)
+            durations = []
+            for _ in range(10):
+                started = time.time()
+                doc = await conn.get("test-index", "test-type", 1)
+                durations.append(time.time() - started)
+                self.assertEqual(doc.name, "Joe Tester")
+            await conn.close()
+            return durations
+
+        loop = asyncio.new_event_loop()
+        try:
+            durations = loop.run_until_complete(run())
+        finally:
+            loop.close()
+        self.assertLess(max(durations), 0.4)
+        self.check_stats(policy.get_stats(), 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+import json
+import unittest
+from pyes.tests import StandInServer
+from pyes.es import ES
+from pyes.routing import RoutingBulker, ShardRouter, murmur3_hash, _IndexRouting
+
+
+class RoutingHashTestCase(unittest.TestCase):
+    def test_murmur3_hash(self):
+        # the values of the Elasticsearch tests of Murmur3HashFunction
+        self.assertEqual(murmur3_hash("hell") & 0xffffffff, 0x5a0cb7c3)
+        self.assertEqual(murmur3_hash("hello") & 0xffffffff, 0xd7c31989)
+        self.assertEqual(murmur3_hash("hello w") & 0xffffffff, 0x22ab2984)
+        self.assertEqual(murmur3_hash("hello wo") & 0xffffffff, 0xdf0ca123)
+        self.assertEqual(murmur3_hash("hello wor") & 0xffffffff, 0xe7744d61)
+        self.assertEqual(murmur3_hash("The quick brown fox jumps over the lazy dog") & 0xffffffff, 0xe07db09c)
+        self.assertEqual(murmur3_hash(1), murmur3_hash("1"))
+
+    def test_shard(self):
+        routing = _IndexRouting(3, 12)
+        for id in range(100):
+            shard = routing.get_shard(id)
+            self.assertEqual(shard, (murmur3_hash(id) % 12) // 4)
+            self.assertTrue(0 <= shard < 3)
+        self.assertEqual(routing.get_shard(1, routing="user"), routing.get_shard(2, routing="user"))
+        partitioned = _IndexRouting(3, 3, partition_size=2)
+        self.assertEqual(len(set(partitioned.get_shard(id, routing="user") for id in range(100))), 2)
+
+
+class RoutingBulkerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.servers = [StandInServer(self.handler).start() for _ in range(3)]
+        self.routing = _IndexRouting(3, 12)
+
+    def tearDown(self):
+        for server in self.servers:
+            server.stop()
+
+    def handler(self, method, path, body):
+        if path.startswith("/_cluster/state"):
+            return 200, {"metadata": {"indices": {"test-index": {
+                "settings": {"index": {"number_of_shards": "3"}}, "routing_num_shards": 12,
+                "aliases": ["test-alias"]}}},
+                "routing_table": {"indices": {"test-index": {"shards": dict(
+                    (str(shard), [{"primary": True, "state": "STARTED", "node": "node%d" % shard},
+                                  {"primary": False, "state": "STARTED", "node": "node%d" % ((shard + 1) % 3)}])
+                    for shard in range(3))}}}}
+        if path.startswith("/_nodes"):
+            return 200, {"nodes": dict(("node%d" % i, {"http": {"publish_address": "localhost/127.0.0.1:%d" %
+                                                                                     server.port}})
+                                       for i, server in enumerate(self.servers))}
+        lines = [json.loads(line) for line in body.decode("utf-8").splitlines() if line]
+        items = []
+        for line in lines:
+            if "index" in line:
+                items.append({"index": dict(line["index"], status=201)})
+        return 200, {"took": 1, "errors": False, "items": items}
+
+    def bulk_ids(self, server):
+        return [json.loads(line)["index"].get("_id") for method, path, body in server.requests if path == "/_bulk"
+                for line in body.decode("utf-8").splitlines() if line.startswith('{"index"')]
+
+    def test_routing(self):
+        conn = ES([server.server for server in self.servers], bulk_size=30, bulker_class=RoutingBulker)
+        for i in range(30):
+            index = "test-alias" if i % 2 else "test-index"
+            conn.index({"position": i}, index, "test-type", i, bulk=True)
+        conn.force_bulk()
+        for shard, server in enumerate(self.servers):
+            ids = self.bulk_ids(server)
+            self.assertTrue(ids)
+            self.assertEqual([id for id in ids if self.routing.get_shard(id) != shard], [])
+        self.assertEqual(sorted(id for server in self.servers for id in self.bulk_ids(server)), list(range(30)))
+
+    def test_items_order(self):
+        conn = ES([server.server for server in self.servers], bulk_size=1000, bulker_class=RoutingBulker)
+        for i in range(20):
+            conn.index({"position": i}, "test-index", "test-type", i, bulk=True)
+        conn.index({"position": 20}, "other-index", "test-type", 20, bulk=True)
+        conn.index({"position": 21}, "test-index", "test-type", bulk=True)
+        result = conn.force_bulk()
+        self.assertEqual([item["index"].get("_id") for item in result["items"]], list(range(21)) + [None])
+        # the actions that can't be routed go to any node
+        self.assertEqual(sum(len(self.bulk_ids(server)) for server in self.servers), 22)
+
+    def test_cluster_state_metrics(self):
+        router = ShardRouter(ES(self.servers[0].server))
+        server = self.servers[self.routing.get_shard(1)]
+        self.assertEqual(router.get_node("test-index", 1), "127.0.0.1:%d" % server.port)
+        path = [path for method, path, body in self.servers[0].requests if path.startswith("/_cluster/state")][0]
+        self.assertTrue(path.startswith("/_cluster/state/metadata,routing_table?"))
+        self.assertIn("filter_path=", path)
+
+    def test_unreachable_cluster_state(self):
+        router = ShardRouter(ES(("http", "127.0.0.1", 9299), max_retries=0))
+        self.assertEqual(router.get_node("test-index", 1), None)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+import json
+import unittest
+from six.moves.urllib.parse import urlparse, parse_qs
+from pyes.tests import StandInServer
+from pyes.es import ES, SearchAfterResultSet
+from pyes.exceptions import InvalidQuery
+from pyes.query import Search, MatchAllQuery
+from pyes.sort import SortFactory, SortOrder
+
+# 25 documents, with the same group every 5
+DOCUMENTS = [{"_id": "%02d" % i, "_source": {"position": i, "group": i // 5}} for i in range(25)]
+
+
+class SearchAfterTestCase(unittest.TestCase):
+    def setUp(self):
+        self.server = StandInServer(self.search_handler).start()
+        self.conn = ES(self.server.server)
+
+    def tearDown(self):
+        self.server.stop()
+
+    def search_handler(self, method, path, body):
+        query = parse_qs(urlparse(path).query)
+        request = json.loads(body.decode("utf-8"))
+        size = int(query["size"][0])
+        start = int(query.get("from", ["0"])[0])
+        # sorted by group, then by the tiebreaker
+        hits = [dict(document, _index="test-index", _type="test-type",
+                     sort=[document["_source"]["group"], document["_id"]]) for document in DOCUMENTS]
+        if "search_after" in request:
+            hits = [hit for hit in hits if hit["sort"] > request["search_after"]]
+        return 200, {"took": 1, "hits": {"total": 25, "max_score": None, "hits": hits[start:start + size]}}
+
+    def requests(self):
+        return [(parse_qs(urlparse(path).query), json.loads(body.decode("utf-8")))
+                for method, path, body in self.server.requests]
+
+    def test_pages(self):
+        sort = SortFactory()
+        sort.add(SortOrder("group"))
+        results = self.conn.search(Search(MatchAllQuery(), sort=sort, bulk_read=10), indices="test-index",
+                                   doc_types="test-type", search_after=True, tiebreaker="uid")
+        self.assertTrue(isinstance(results, SearchAfterResultSet))
+        self.assertEqual([hit.position for hit in results], list(range(25)))
+        requests = self.requests()
+        self.assertEqual(len(requests), 3)
+        for params, body in requests:
+            self.assertNotIn("from", params)
+            self.assertEqual(body["sort"], [{"group": {}}, {"uid": "asc"}])
+        self.assertNotIn("search_after", requests[0][1])
+        self.assertEqual(requests[1][1]["search_after"], [1, "09"])
+        self.assertEqual(requests[2][1]["search_after"], [3, "19"])
+        # iterating again restarts from the first page
+        self.assertEqual(len(list(results)), 25)
+        self.assertNotIn("search_after", self.requests()[3][1])
+
+    def test_tiebreaker(self):
+        results = self.conn.search(Search(MatchAllQuery(), sort=[{"group": "desc"}, "uid"], bulk_read=10),
+                                   indices="test-index", search_after=True, tiebreaker="uid")
+        self.assertEqual(len(list(results)), 25)
+        self.assertEqual(self.requests()[0][1]["sort"], [{"group": "desc"}, "uid"])
+        results = self.conn.search(MatchAllQuery(), indices="test-index", search_after=True, tiebreaker="uid")
+        next(iter(results))
+        self.assertEqual(self.requests()[-1][1]["sort"], ["_score", {"uid": "asc"}])
+
+    def test_start(self):
+        results = self.conn.search(Search(MatchAllQuery(), start=5, bulk_read=10), indices="test-index",
+                                   search_after=True, tiebreaker="uid")
+        self.assertEqual([hit.position for hit in results], list(range(5, 25)))
+        self.assertEqual(self.requests()[0][0]["from"], ["5"])
+        self.assertNotIn("from", self.requests()[1][0])
+
+    def test_scan(self):
+        self.assertRaises(InvalidQuery, self.conn.search, MatchAllQuery(), search_after=True, tiebreaker="uid",
+                          scan=True)
+
+    def test_requires_tiebreaker(self):
+        self.assertRaises(InvalidQuery, self.conn.search, MatchAllQuery(), search_after=True)
+
+
+if __name__ == "__main__":
+    unittest.main()
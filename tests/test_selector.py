@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+import asyncio
+import unittest
+from six.moves.urllib.parse import urlparse
+from pyes.tests import StandInServer
+from pyes.es import ES
+from pyes.es_async import AsyncES
+from pyes.connection_http import Connection
+from pyes.fakettypes import Method, RestRequest
+from pyes.selector import LatencySelector
+
+
+def document_handler(method, path, body):
+    return 200, {"_index": "test-index", "_type": "test-type", "_id": "1", "found": True,
+                 "_source": {"name": "Joe Tester"}}
+
+
+class LatencySelectorTestCase(unittest.TestCase):
+    def test_prefers_fast_nodes(self):
+        selector = LatencySelector()
+        selector.finish("fast", selector.start("fast") - 0.01)
+        selector.finish("slow", selector.start("slow") - 0.5)
+        self.assertEqual(set(selector.select(["fast", "slow"]) for _ in range(20)), set(["fast"]))
+        self.assertEqual(selector.select(["slow"]), "slow")
+        self.assertRaises(IndexError, selector.select, [])
+
+    def test_unknown_nodes_first(self):
+        selector = LatencySelector()
+        selector.finish("known", selector.start("known"))
+        self.assertEqual(selector.select(["known", "new"]), "new")
+
+    def test_in_flight(self):
+        selector = LatencySelector(decay=1)
+        selector.finish("a", selector.start("a") - 0.1)
+        selector.finish("b", selector.start("b") - 0.15)
+        for _ in range(3):
+            selector.start("a")
+        self.assertEqual(selector.select(["a", "b"]), "b")
+        self.assertEqual(selector.get_stats()["a"]["in_flight"], 3)
+
+    def test_stats(self):
+        selector = LatencySelector(decay=0.5, failure_penalty=2.0)
+        selector.finish("a", selector.start("a") - 1.0)
+        selector.finish("a", selector.start("a"), failed=True)
+        stats = selector.get_stats()["a"]
+        self.assertEqual(stats["requests"], 2)
+        self.assertEqual(stats["failures"], 1)
+        self.assertEqual(stats["in_flight"], 0)
+        self.assertAlmostEqual(stats["ewma"], 1.5, places=1)
+        selector.reset()
+        self.assertEqual(selector.get_stats(), {})
+        self.assertRaises(ValueError, LatencySelector, decay=0)
+
+
+class SelectorConnectionTestCase(unittest.TestCase):
+    def setUp(self):
+        self.fast = StandInServer(document_handler).start()
+        self.slow = StandInServer(document_handler, delay=0.05).start()
+
+    def tearDown(self):
+        self.fast.stop()
+        self.slow.stop()
+
+    def check_routing(self, stats):
+        self.assertGreater(len(self.fast.requests), 3 * len(self.slow.requests))
+        fast, slow = [stats["http://127.0.0.1:%d" % server.port] for server in (self.fast, self.slow)]
+        self.assertGreater(slow["ewma"], fast["ewma"])
+        self.assertEqual(fast["requests"] + slow["requests"], 40)
+
+    def test_es(self):
+        conn = ES([self.fast.server, self.slow.server], selector=LatencySelector())
+        for _ in range(40):
+            self.assertEqual(conn.get("test-index", "test-type", 1).name, "Joe Tester")
+        self.check_routing(conn.get_selector_stats())
+        self.assertEqual(ES(self.fast.server).get_selector_stats(), {})
+
+    def test_async_es(self):
+        async def run():
+            conn = AsyncES([self.fast.server, self.slow.server], selector=LatencySelector())
+            for _ in range(10):
+                await asyncio.gather(*[conn.get("test-index", "test-type", 1) for _ in range(4)])
+            await conn.close()
+            return conn.get_selector_stats()
+
+        loop = asyncio.new_event_loop()
+        try:
+            stats = loop.run_until_complete(run())
+        finally:
+            loop.close()
+        self.check_routing(stats)
+
+    def test_http_connection(self):
+        selector = LatencySelector()
+        connection = Connection([urlparse("http://127.0.0.1:%d" % server.port) for server in (self.fast, self.slow)],
+                                selector=selector)
+        for _ in range(40):
+            response = connection.execute(RestRequest(method=Method.GET, uri="/test-index/test-type/1"))
+            self.assertEqual(response.status, 200)
+        self.check_routing(selector.get_stats())
+
+
+if __name__ == "__main__":
+    unittest.main()
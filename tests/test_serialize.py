@@ -1,10 +1,18 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import
+import asyncio
 import unittest
-from pyes.tests import ESTestCase
+from pyes.tests import ESTestCase, StandInServer
+from pyes.es import ES, JSONSerializer, ESJsonEncoder, ESJsonDecoder
+from pyes.es_async import AsyncES
+from pyes.models import DotDict, ElasticSearchModel
+from pyes.serializers import get_json_backend, register_json_backend, JSON_BACKENDS, \
+    StdlibJSONBackend, OrjsonBackend
+from pyes.query import Search, MatchAllQuery
 from pyes.query import TermQuery, RangeQuery
 from pyes.utils import ESRange
-from datetime import datetime
+from datetime import datetime, date
+from decimal import Decimal
 
 class SerializationTestCase(ESTestCase):
     def setUp(self):
@@ -57,5 +65,246 @@ class SerializationTestCase(ESTestCase):
         # self.assertEqual(hit.inserted, datetime(1, 1, 1, 0, 0, 0))
 
 
+class RequestEncodingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.server = StandInServer().start()
+        self.conn = ES(self.server.server)
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_encode_body(self):
+        self.assertEqual(self.conn._encode_body({"inserted": datetime(2010, 10, 22, 12, 12, 12)}),
+                         b'{"inserted": "2010-10-22T12:12:12"}')
+        self.assertEqual(self.conn._encode_body(u'{"name": "\u00e8"}'), u'{"name": "\u00e8"}'.encode("utf-8"))
+        body = b'{"name": "Joe"}'
+        self.assertIs(self.conn._encode_body(body), body)
+        view = memoryview(body)
+        self.assertIs(self.conn._encode_body(view), view)
+
+    def test_serializer_passes_serialized_bodies(self):
+        serializer = JSONSerializer()
+        for body in (u'{"a": 1}', b'{"a": 1}', bytearray(b'{"a": 1}'), memoryview(b'{"a": 1}')):
+            self.assertIs(serializer.dumps(body), body)
+        self.assertEqual(serializer.dumps({"a": 1}), '{"a": 1}')
+
+    def test_send_serialized_bodies(self):
+        for body in ({"a": 1}, u'{"a": 1}', b'{"a": 1}', memoryview(b'{"a": 1}')):
+            self.assertTrue(self.conn._send_request("POST", "/test-index/_search", body).ok)
+        self.assertEqual([request[2] for request in self.server.requests], [b'{"a": 1}'] * 4)
+
+
+class MissingBackend(StdlibJSONBackend):
+    def __init__(self, encoder=None, decoder=None):
+        raise ImportError("missing")
+
+
+class JSONBackendTestCase(unittest.TestCase):
+    document = {"datetime": datetime(2010, 10, 22, 12, 12, 12), "micro": datetime(2010, 10, 22, 12, 12, 12, 5000),
+                "date": date(2010, 10, 22), "decimal": Decimal("1.5"), "set": set([1]), 1: "int key",
+                "nested": [{"text": u"\u00e8"}]}
+    response = b'{"_source": {"inserted": "2010-10-22T12:12:12", "name": "Joe", ' \
+               b'"nested": [{"at": "2010-10-22T12:12:12.500000"}, "2010-10-22"]}}'
+
+    def get_backends(self):
+        return [get_json_backend(name, encoder=ESJsonEncoder, decoder=ESJsonDecoder) for name in ("json", "orjson")]
+
+    def test_encoding_semantics(self):
+        stdlib, orjson = self.get_backends()
+        self.assertIsInstance(orjson, OrjsonBackend)
+        import json
+        self.assertEqual(json.loads(stdlib.dumps(self.document)), json.loads(orjson.dumps(self.document)))
+        self.assertEqual(json.loads(orjson.dumps_bytes(self.document))["date"], "2010-10-22T00:00:00")
+
+    def test_decoding_semantics(self):
+        stdlib, orjson = self.get_backends()
+        expected = stdlib.loads(self.response)
+        decoded = orjson.loads(self.response)
+        self.assertEqual(decoded, expected)
+        self.assertIsInstance(decoded, DotDict)
+        self.assertIsInstance(decoded._source.nested[0], DotDict)
+        self.assertEqual(decoded._source.inserted, datetime(2010, 10, 22, 12, 12, 12))
+        self.assertEqual(decoded._source.nested[1], datetime(2010, 10, 22))
+
+    def test_fallback(self):
+        register_json_backend("missing", MissingBackend)
+        try:
+            self.assertIsInstance(get_json_backend("missing"), StdlibJSONBackend)
+        finally:
+            del JSON_BACKENDS["missing"]
+        self.assertRaises(ValueError, get_json_backend, "unknown")
+
+    def test_connection_backend(self):
+        server = StandInServer().start()
+        try:
+            conn = ES(server.server, json_backend="orjson", bulk_size=10)
+            self.assertIsInstance(conn.json_backend, OrjsonBackend)
+            model = ElasticSearchModel({"inserted": date(2010, 10, 22)})
+            model._meta.update({"index": "test-index", "type": "test-type", "id": 1, "connection": conn})
+            self.assertEqual(model.get_bulk(),
+                             '{"index":{"_index":"test-index","_type":"test-type","_id":1}}\n'
+                             '{"inserted":"2010-10-22T00:00:00"}\n')
+            conn.index({"value": Decimal("1.5")}, "test-index", "test-type", 2, bulk=True)
+            self.assertEqual(conn.bulker.bulk_data,
+                             ['{"index":{"_index":"test-index","_type":"test-type","_id":2}}\n{"value":1.5}'])
+            body, result = conn.search_raw_multi([Search(MatchAllQuery())], indices_list=["test-index"])
+            self.assertEqual(body, '{"index":"test-index"}\n{"query":{"match_all":{}}}\n')
+            self.assertTrue(result.ok)
+            conn.force_bulk()
+        finally:
+            server.stop()
+
+
+def mapping_handler(method, path, body):
+    if path.startswith("/_all/_mapping") or path.startswith("/test-index/_mapping"):
+        return 200, {"test-index": {"mappings": {"test-type": {"properties": {
+            "inserted": {"type": "date"},
+            "name": {"type": "text"},
+            "comments": {"type": "nested", "properties": {"created": {"type": "date"},
+                                                          "text": {"type": "text"}}}}}}}}
+    if path.startswith("/test-index/test-type/_search"):
+        return 200, {"hits": {"total": 1, "hits": [
+            {"_index": "test-index", "_type": "test-type", "_id": "1",
+             "_source": {"inserted": "2010-10-22T12:12:12", "name": "2010-10-22T12:12:12",
+                         "comments": [{"created": "2010-10-22", "text": "2010-10-22T12:12:12.500000"},
+                                      {"created": "not a date"}]}}]}}
+    return 200, {"ok": True}
+
+
+class DateDecodingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.server = StandInServer(mapping_handler).start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def search(self, **kwargs):
+        conn = ES(self.server.server, **kwargs)
+        return conn, conn.search(MatchAllQuery(), "test-index", "test-type")
+
+    def test_heuristic(self):
+        conn, resultset = self.search()
+        hit = resultset[0]
+        self.assertEqual(hit.name, datetime(2010, 10, 22, 12, 12, 12))
+        self.assertEqual(hit.comments[0].text, datetime(2010, 10, 22, 12, 12, 12, 500000))
+        self.assertNotIn("/_all/_mapping", [request[1] for request in self.server.requests])
+
+    def test_mapping(self):
+        conn, resultset = self.search(date_decoding="mapping")
+        self.assertIsInstance(resultset.hits[0]["_source"]["inserted"], str)
+        hit = resultset[0]
+        self.assertEqual(hit.inserted, datetime(2010, 10, 22, 12, 12, 12))
+        self.assertEqual(hit.name, "2010-10-22T12:12:12")
+        self.assertEqual(hit.comments[0].created, date(2010, 10, 22))
+        self.assertEqual(hit.comments[0].text, "2010-10-22T12:12:12.500000")
+        self.assertEqual(hit.comments[1].created, "not a date")
+        self.assertEqual([path for path, field in conn.get_date_fields("test-index", "test-type")],
+                         [["comments", "created"], ["inserted"]])
+        self.assertEqual(conn.get_date_fields("test-index", "missing-type"), [])
+        self.assertEqual([request[1] for request in self.server.requests].count("/_all/_mapping"), 1)
+
+    def test_invalid_mode(self):
+        self.assertRaises(ValueError, ES, self.server.server, date_decoding="strptime")
+
+    def test_mapping_changes(self):
+        mappings = {"test-index": {"mappings": {"test-type": {"properties": {"name": {"type": "text"}}}}}}
+
+        def handler(method, path, body):
+            if "/_mapping" in path and method == "GET":
+                index = path.split("/")[1]
+                return 200, mappings if index in ("_all", "_mapping") else {index: mappings[index]}
+            return 200, {"ok": True}
+
+        self.server.handler = handler
+        conn = ES(self.server.server, date_decoding="mapping")
+        self.assertEqual(conn.get_date_fields("test-index", "test-type"), [])
+        mappings["new-index"] = {"mappings": {"test-type": {"properties": {"created": {"type": "date"}}}}}
+        self.assertEqual([path for path, field in conn.get_date_fields("new-index", "test-type")], [["created"]])
+        # a missing type reloads the mapping at most every MAPPING_RELOAD_INTERVAL seconds
+        requests = len(self.server.requests)
+        for _ in range(3):
+            self.assertEqual(conn.get_date_fields("new-index", "other-type"), [])
+        self.assertEqual(self.server.requests[requests:], [("GET", "/new-index/_mapping", b"")])
+
+        mappings["test-index"]["mappings"]["test-type"]["properties"]["inserted"] = {"type": "date"}
+        self.assertEqual(conn.get_date_fields("test-index", "test-type"), [])
+        conn.indices.put_mapping("test-type", {"properties": {"inserted": {"type": "date"}}}, "test-index")
+        self.assertEqual([path for path, field in conn.get_date_fields("test-index", "test-type")], [["inserted"]])
+        self.assertEqual([path for path, field in conn.get_date_fields("new-index", "test-type")], [["created"]])
+
+    def test_async_mapping_changes(self):
+        mappings = {"test-index": {"mappings": {"test-type": {"properties": {"name": {"type": "text"}}}}}}
+        # whether the mappings of test-index were loaded when a PUT arrived
+        loaded = []
+
+        def handler(method, path, body):
+            if "/_mapping" in path and method == "GET":
+                return 200, mappings
+            if method == "PUT":
+                loaded.append("test-index" in conn._mappings.indices)
+            return 200, {"ok": True}
+
+        async def run():
+            await conn.load_mappings()
+            self.assertEqual(conn.get_date_fields("test-index", "test-type"), [])
+            mappings["test-index"]["mappings"]["test-type"]["properties"]["inserted"] = {"type": "date"}
+            await conn.indices.put_mapping("test-type", {"properties": {"inserted": {"type": "date"}}},
+                                           "test-index")
+            self.assertEqual(conn.get_date_fields("test-index", "test-type"), [])
+            await conn.indices.create_index("test-index")
+            await conn.load_mappings()
+            self.assertEqual([path for path, field in conn.get_date_fields("test-index", "test-type")],
+                             [["inserted"]])
+            await conn.close()
+
+        self.server.handler = handler
+        conn = AsyncES(self.server.server, date_decoding="mapping")
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(run())
+        finally:
+            loop.close()
+        self.assertEqual(loaded, [True, False])
+
+
+class ResponseModeTestCase(unittest.TestCase):
+    def setUp(self):
+        self.server = StandInServer(mapping_handler).start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def check_dict_mode(self, **kwargs):
+        conn = ES(self.server.server, response_mode="dict", **kwargs)
+        resultset = conn.search(MatchAllQuery(), "test-index", "test-type")
+        self.assertIs(type(resultset.hits[0]), dict)
+        self.assertEqual(resultset.hits[0]["_source"]["inserted"], "2010-10-22T12:12:12")
+        hit = resultset[0]
+        self.assertIsInstance(hit, ElasticSearchModel)
+        self.assertIsInstance(hit.comments[0], DotDict)
+        self.assertEqual(hit.inserted, datetime(2010, 10, 22, 12, 12, 12))
+        self.assertEqual(hit.comments[0].text, datetime(2010, 10, 22, 12, 12, 12, 500000))
+        self.assertEqual(hit._meta.id, "1")
+
+        result = conn.search_raw(MatchAllQuery(), "test-index", "test-type")
+        self.assertIs(type(result["hits"]), dict)
+        self.assertEqual(result.hits.total, 1)
+        self.assertIs(type(result["hits"]), DotDict)
+        self.assertIs(type(result.hits.hits[0]), dict)
+
+    def test_dict_mode(self):
+        self.check_dict_mode()
+
+    def test_dict_mode_orjson(self):
+        self.check_dict_mode(json_backend="orjson")
+
+    def test_dotdict_mode(self):
+        conn = ES(self.server.server)
+        result = conn.search_raw(MatchAllQuery(), "test-index", "test-type")
+        self.assertIsInstance(result.hits.hits[0], DotDict)
+        self.assertEqual(result.hits.hits[0]._source.inserted, datetime(2010, 10, 22, 12, 12, 12))
+        self.assertRaises(ValueError, ES, self.server.server, response_mode="list")
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+import io
+import json
+import unittest
+from datetime import datetime
+from six.moves.urllib.parse import urlparse, parse_qs
+from pyes.tests import StandInServer
+from pyes.es import ES, StreamingResultSet
+from pyes.exceptions import ElasticSearchException
+from pyes.models import DotDict, ElasticSearchModel
+from pyes.query import Search, MatchAllQuery
+from pyes.streaming import HitStream
+
+
+def search_handler(method, path, body):
+    if path.startswith("/test-index/test-type/_search"):
+        query = parse_qs(urlparse(path).query)
+        start, size = int(query["from"][0]), int(query["size"][0])
+        hits = [{"_index": "test-index", "_type": "test-type", "_id": str(i),
+                 "_source": {"position": i, "text": u"àèìòù " * i, "inserted": "2010-10-22T12:12:12"}}
+                for i in range(start, min(start + size, 25))]
+        response = {"took": 1, "hits": {"total": 25, "max_score": 1.0, "hits": hits},
+                    "aggregations": {"positions": {"value": 300}}}
+        if "scroll" in query:
+            response["_scroll_id"] = "scroll-1"
+        return 200, response
+    if path.startswith("/_search/scroll"):
+        if body == b"scroll-1":
+            hits = [{"_id": str(i), "_source": {"position": i}} for i in range(10, 20)]
+        else:
+            hits = []
+        return 200, {"_scroll_id": "scroll-2", "hits": {"total": 20, "hits": hits}}
+    if path.startswith("/missing-index"):
+        return 400, {"error": "SearchPhaseExecutionException[Failed to execute phase [query]]", "status": 400}
+    return 200, {"ok": True}
+
+
+class HitStreamTestCase(unittest.TestCase):
+    document = {"_scroll_id": "abc", "took": 3,
+                "hits": {"total": 50, "max_score": 1.5,
+                         "hits": [{"_id": str(i), "_source": {"text": u"è" * i * 10, "number": i * 1.5}}
+                                  for i in range(50)]},
+                "aggregations": {"a": {"value": 12345}}, "number": 1.25}
+
+    def test_chunks(self):
+        data = json.dumps(self.document, indent=1).encode("utf-8")
+        for chunk_size in (1, 7, 64, 1000, len(data) * 2):
+            stream = HitStream(io.BytesIO(data), chunk_size=chunk_size)
+            self.assertEqual(stream.results["hits"]["total"], 50)
+            self.assertEqual(stream.results["_scroll_id"], "abc")
+            self.assertNotIn("aggregations", stream.results)
+            hits = list(stream)
+            self.assertEqual(hits, self.document["hits"]["hits"])
+            self.assertTrue(stream.finished)
+            self.assertEqual(stream.results["aggregations"], {"a": {"value": 12345}})
+            self.assertEqual(stream.results["number"], 1.25)
+
+    def test_not_search_response(self):
+        stream = HitStream(io.BytesIO(b'{"error": "boom", "status": 500}'))
+        self.assertEqual(stream.results, {"error": "boom", "status": 500})
+        self.assertEqual(list(stream), [])
+
+    def test_invalid_response(self):
+        stream = HitStream(io.BytesIO(b'{"hits": {"hits": [{"_id": 1}, {"_id":'), chunk_size=4)
+        self.assertEqual(next(stream), {"_id": 1})
+        self.assertRaises(ValueError, next, stream)
+
+    def test_close(self):
+        data = json.dumps(self.document).encode("utf-8")
+        stream = HitStream(io.BytesIO(data), chunk_size=16)
+        self.assertEqual(next(stream)["_id"], "0")
+        stream.close()
+        self.assertEqual(list(stream), [])
+
+
+class StreamingResultSetTestCase(unittest.TestCase):
+    def setUp(self):
+        self.server = StandInServer(search_handler).start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_pages(self):
+        conn = ES(self.server.server)
+        resultset = conn.search(Search(MatchAllQuery(), bulk_read=10), "test-index", "test-type", stream=True)
+        self.assertIsInstance(resultset, StreamingResultSet)
+        self.assertEqual(resultset.total, 25)
+        hits = list(resultset)
+        self.assertEqual([hit.position for hit in hits], list(range(25)))
+        self.assertIsInstance(hits[0], ElasticSearchModel)
+        self.assertEqual(hits[0].inserted, datetime(2010, 10, 22, 12, 12, 12))
+        self.assertEqual(resultset.aggs, {"positions": {"value": 300}})
+        self.assertEqual(resultset[12].position, 12)
+        self.assertEqual([hit.position for hit in resultset], list(range(25)))
+
+    def test_dict_mode(self):
+        conn = ES(self.server.server, response_mode="dict")
+        resultset = conn.search(Search(MatchAllQuery(), size=5), "test-index", "test-type", stream=True)
+        hits = list(resultset)
+        self.assertEqual([hit.position for hit in hits], list(range(5)))
+        self.assertEqual(hits[0].inserted, datetime(2010, 10, 22, 12, 12, 12))
+
+    def test_aggs_before_hits(self):
+        conn = ES(self.server.server)
+        resultset = conn.search(Search(MatchAllQuery(), size=10), "test-index", "test-type", stream=True)
+        self.assertIsInstance(resultset.aggs.positions, DotDict)
+        self.assertEqual([hit.position for hit in resultset], list(range(10)))
+
+    def test_scroll(self):
+        conn = ES(self.server.server)
+        resultset = conn.search(Search(MatchAllQuery(), size=20, bulk_read=10), "test-index", "test-type",
+                                stream=True, scroll="1m")
+        self.assertEqual([hit.position for hit in resultset], list(range(20)))
+        self.assertEqual([request[1] for request in self.server.requests].count("/_search/scroll?scroll=1m"), 1)
+
+    def test_error(self):
+        conn = ES(self.server.server)
+        resultset = conn.search(MatchAllQuery(), "missing-index", stream=True)
+        self.assertRaises(ElasticSearchException, list, resultset)
+
+
+if __name__ == "__main__":
+    unittest.main()